@@ -14,7 +14,10 @@ import subprocess
 import serial
 from serial.tools import list_ports
 import binascii
+import json
 import time
+import wave
+import struct
 
 #######################################################################
 '''
@@ -51,6 +54,9 @@ xferCSVToController(filename, dest='', progressbar=None)
 xferFileToController(filename, dest='', progressbar=None)
     Transfers a file of any type to the controller with the same name.
     dest specifies the destination file and path and must be specified.
+fetchTrace()
+    Returns the per-frame profiling trace of the last animation played
+    on the controller as a list of dicts.  Pico only.
 
 All these functions must be implemented for all hardware types.
 '''
@@ -61,10 +67,14 @@ _Path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'lib')
 sys.path.append(_Path)
 # Now import tables from our extended path
 import tables
-from helpers import filecrc16
+from helpers import filecrc16, TraceFormat, TraceVersion
 
 # Read port id from local cache file
 portRoot = None    # May be set by Hauntimator prior to comms
+picoSerial = None  # USB serial number of the Pico found by isReady
+
+# Controller capability descriptors cached by Pico serial number
+capsfile = os.path.join(os.path.dirname(os.path.realpath(__file__)), '.capabilities')
 
 # Remove path so other code can't accidentally get to it
 sys.path.remove(_Path)
@@ -97,6 +107,14 @@ def _natural_sort_key(device):
     return (int(m.group(1)) if m else -1, device)
 
 
+def _serial_number(device):
+    """Return the USB serial number of the named device if we can determine it, else None."""
+    for p in list_ports.comports():
+        if p.device == device:
+            return p.serial_number
+    return None
+
+
 def find_command_port(vid=PICO_VID, pid=None, serial_number=None):
     """
     Find the Command Port of a connected Pico Maestro.
@@ -160,9 +178,15 @@ def lineFromPico():
 #################### Status Request Functions #################
 def isReady():
     global portRoot
+    global picoSerial
+    global _capabilities
+    global _capabilitiesFresh
 
     portRoot = None
+    _capabilities = None    # Ask again on the new connection
+    _capabilitiesFresh = False
     theDevice = find_command_port()
+    picoSerial = _serial_number(theDevice)
     try:
         ser = serial.Serial(theDevice, 115200)
         # Save the good port
@@ -212,17 +236,88 @@ def getFileChecksum(filename):
         checksum = -1
     return checksum
 
+def fetchCapabilities():
+    line = ''
+    # Status requires round trip so port cannot be closed in between
+    if portRoot is not None:
+        ser = openPort()
+        if ser is not None:
+            toPico(ser, 'statusd\n')
+            line = ser.readline().decode('utf-8')
+            ser.close()
+    try:
+        return json.loads(line)
+    except:
+        return None
+
+def _readCapabilitiesCache():
+    try:
+        with open(capsfile, 'r') as file:
+            return json.load(file)
+    except:
+        return {}
+
+def _writeCapabilitiesCache(caps):
+    cache = _readCapabilitiesCache()
+    cache[picoSerial] = caps
+    try:
+        with open(capsfile, 'w') as file:
+            json.dump(cache, file)
+    except:
+        pass
+
+# Capability descriptor of the connected Pico, fetched once per connection
+_capabilities = None
+_capabilitiesFresh = False  # True if _capabilities came from the Pico rather than the cache
+
+def getCapabilities():
+    '''
+    Returns the capability descriptor of the connected Pico: block sizes, PreferBinary,
+    tables hash, firmware version and free flash/SD space.  It is requested from the Pico
+    the first time it is needed after isReady and saved by serial number.  If the Pico
+    cannot answer, the last saved descriptor for that Pico is used.  Returns an empty
+    dict if nothing is known.
+    '''
+    global _capabilities
+    global _capabilitiesFresh
+    if _capabilities is None:
+        _capabilities = fetchCapabilities()
+        _capabilitiesFresh = _capabilities is not None
+        if _capabilitiesFresh:
+            if picoSerial is not None: _writeCapabilitiesCache(_capabilities)
+        else:
+            _capabilities = _readCapabilitiesCache().get(picoSerial, {})
+    return _capabilities
+
+def forgetCapabilities():
+    # Ask the Pico again next time, e.g. after its tables have been replaced
+    global _capabilities
+    global _capabilitiesFresh
+    _capabilities = None
+    _capabilitiesFresh = False
+
 # Set to True if the local copies of tables.py and tabledefs
-# exactly match those installed on the Pico.
+# exactly match those installed on the Pico.  Only trusted when
+# the Pico could not be asked about its tables.
 I_Solemnly_Swear_That_The_Tables_Are_Synced_With_The_Pico = True
 
 def binarySynced():
-    # Avoid checking board status over USB and assume we know everything
-    return I_Solemnly_Swear_That_The_Tables_Are_Synced_With_The_Pico
-    picoBinaryFlag, picoBlockSizes = getBinarySizes()
-    localBlockSizes = list(tables.getBinarysizes())
-    localBinaryFlag = tables.PreferBinary
-    return picoBinaryFlag == localBinaryFlag and picoBlockSizes == localBlockSizes
+    caps = getCapabilities()
+    if not _capabilitiesFresh or 'tableshash' not in caps:
+        # Unable to ask the Pico and a saved hash may be out of date so assume we know everything
+        return I_Solemnly_Swear_That_The_Tables_Are_Synced_With_The_Pico
+    return (caps['tableshash'] == tables.getTablesHash()
+        and caps['blocksizes'] == list(tables.getBinarysizes()))
+
+def preferBinary():
+    # Returns what the Pico wants if known and what our tables want otherwise
+    return getCapabilities().get('preferbinary', tables.PreferBinary)
+
+def _fitsOnController(filename, dest):
+    # Checks the file against the free space last reported by the Pico
+    caps = getCapabilities()
+    freespace = caps.get('sdfree' if dest.startswith('/sd') else 'flashfree', -1)
+    return freespace < 0 or os.path.getsize(filename) <= freespace
 
 def portCounts():
     if binarySynced() and len(tables.PWMPortTable) > 0 and len(tables.DigitalPortTable) > 0:
@@ -251,15 +346,57 @@ def getConfiguredDigitalPorts():
         return None
 
 
+def _catalogEntry(filename, dest):
+    # Describes an animation file for the Pico's animation catalog (see helpers.py)
+    # Returns the animation path without extension and the entry or None
+    root, ext = os.path.splitext(dest)
+    try:
+        if ext == '.wav':
+            with wave.open(filename, 'rb') as wf:
+                return root, {'audio':dest, 'rate':wf.getframerate(), 'channels':wf.getnchannels(),
+                    'sampwidth':wf.getsampwidth(), 'frames':wf.getnframes()}
+        elif ext == '.csv':
+            # Duration is the time of the last line
+            last = ''
+            with open(filename, 'r') as file:
+                file.readline()
+                for line in file:
+                    if len(line.strip()) > 0: last = line
+            duration = int(last.split(',')[0]) if len(last) > 0 else 0
+            return root, {'control':dest, 'format':'csv', 'duration':duration}
+        elif ext == '.bin':
+            # Duration is the time of the last record
+            blocksize = tables.getBinarysizes()[0]
+            size = os.path.getsize(filename) // blocksize * blocksize
+            duration = 0
+            if size > 0:
+                with open(filename, 'rb') as file:
+                    file.seek(size - blocksize)
+                    duration = int.from_bytes(file.read(4), 'little')
+            return root, {'control':dest, 'format':'bin', 'blocksize':blocksize, 'duration':duration}
+    except:
+        pass
+    return root, None
+
 #################### Library functions ########################
 ##### File Transfers
 def xferFileToController(filename, dest='', progressbar=None):
     # Transfer any type of file to the Pico
+    # Check the space first as asking the Pico for it needs the port to itself
+    if os.path.isfile(filename) and not _fitsOnController(filename, dest):
+        sys.stderr.write('Whoops - Not enough room on the Pico for %s\n' % filename)
+        return True
+
     ser = openPort()
     if ser is None:
         return True # It is True that an error has occurred
 
     if os.path.isfile(filename):
+        # Describe the file first since the Pico reboots after the upload.  The Pico
+        # holds the entry and only catalogs it once the upload has been written.
+        root, entry = _catalogEntry(filename, dest)
+        if entry is not None:
+            toPico(ser, 'k %s %s\n' % (root, json.dumps(entry)))
         tf = open(filename, 'rb')
         fd = tf.fileno()
         fsize = os.fstat(fd).st_size * 2    # Two hex characters per byte
@@ -286,6 +423,18 @@ def xferFileToController(filename, dest='', progressbar=None):
     time.sleep(2)
     #print('Closing serial port')
     ser.close()
+
+    # New tables change the hash and block sizes so the descriptor must be fetched again
+    name = os.path.basename(dest) or os.path.basename(filename)
+    if name.startswith('tabledefs') or name == 'tables.py':
+        forgetCapabilities()
+        return False
+
+    # Account for the space used rather than asking the Pico again
+    caps = getCapabilities()
+    freekey = 'sdfree' if dest.startswith('/sd') else 'flashfree'
+    if caps.get(freekey, -1) >= 0 and os.path.isfile(filename):
+        caps[freekey] = max(0, caps[freekey] - os.path.getsize(filename))
     return False
 
 def xferCSVToController(filename, dest='', progressbar=None):
@@ -299,9 +448,11 @@ def xferCSVToController(filename, dest='', progressbar=None):
         -1: Actual upload failed for whatever reason
     '''
     # Add error handling!!!
+    # The cached capability descriptor answers both questions without a round trip
     ofname = None
     picoBinaryFlag = binarySynced()
-    if picoBinaryFlag and tables.PreferBinary:
+    wantsBinary = preferBinary()
+    if picoBinaryFlag and wantsBinary:
         # Pico and local match and Pico wants binary
         ofname = tables.csvToBin(filename)
         if ofname is not None:
@@ -316,7 +467,7 @@ def xferCSVToController(filename, dest='', progressbar=None):
             statusflag = 1
             if xferFileToController(filename, dest=dest, progressbar=progressbar):
                 statusflag = -1
-    elif picoBinaryFlag and not tables.PreferBinary:
+    elif picoBinaryFlag and not wantsBinary:
         # Pico and local match and Pico wants CSV
         statusflag = 0
         if xferFileToController(filename, dest=dest, progressbar=progressbar):
@@ -364,21 +515,82 @@ def setDigitalChannel(channel, value):
     stringToPico(outstring)
 
 
+##### Profiling
+TraceFields = ('frame', 'late', 'read', 'servo', 'digital', 'cycle', 'skips', 'gc')
+
+def fetchTrace():
+    # Requests the profiling trace of the last animation played and returns its records
+    records = []
+    ser = openPort()
+    if ser is None:
+        return records
+    toPico(ser, 't\n')
+    try:
+        header = ser.readline().decode('utf-8').split()
+        if len(header) != 4 or header[0] != 'trace' or int(header[1]) != TraceVersion:
+            sys.stderr.write('Whoops - Unexpected trace header: %s\n' % ' '.join(header))
+        else:
+            for i in range(int(header[2])):
+                values = struct.unpack(TraceFormat, binascii.unhexlify(ser.readline().strip()))
+                records.append(dict(zip(TraceFields, values)))
+            ser.readline()  # Swallow end marker
+    except:
+        sys.stderr.write('Whoops - Unable to read the trace from the Pico\n')
+    ser.close()
+    return records
+
+def histogram(values, bins=10, width=50):
+    # Returns the lines of a text histogram of values
+    lines = []
+    if len(values) == 0: return lines
+    low = min(values)
+    high = max(values)
+    step = max(1, (high - low + bins) // bins)
+    counts = [0] * bins
+    for value in values:
+        counts[min(bins - 1, (value - low) // step)] += 1
+    biggest = max(counts)
+    for i in range(bins):
+        bar = '#' * ((counts[i] * width + biggest - 1) // biggest)
+        lines.append('%8d - %8d %6d %s' % (low + i * step, low + (i + 1) * step - 1, counts[i], bar))
+    return lines
+
+def printTraceReport(records, timelinefile=None):
+    # Prints histograms of the trace timings and optionally writes the timeline as CSV
+    print('Frames traced:', len(records))
+    if len(records) == 0: return
+    print('Lines skipped:', sum(r['skips'] for r in records),
+        '  Garbage collections:', sum(r['gc'] for r in records))
+    for field in ('late', 'read', 'servo', 'digital', 'cycle'):
+        values = [r[field] for r in records]
+        print('\n%s (usec) min %d avg %d max %d' % (field, min(values), sum(values) // len(values), max(values)))
+        for line in histogram(values):
+            print(line)
+    if timelinefile is not None:
+        with open(timelinefile, 'w') as file:
+            file.write(','.join(TraceFields) + '\n')
+            for r in records:
+                file.write(','.join(str(r[field]) for field in TraceFields) + '\n')
+
 #/* Define block */
 verbosity = False
 
 #/* Usage method */
 def print_usage(name):
     """ Simple method to output usage when needed """
-    sys.stderr.write("\nUsage: %s [-/-h/-help] [-v/-verbose]\n" % name);
+    sys.stderr.write("\nUsage: %s [-/-h/-help] [-v/-verbose] [-t/-trace [timeline.csv]]\n" % name);
     sys.stderr.write("Runs unit tests on this communication library.\n");
     sys.stderr.write("-/-h/-help  :show this information\n");
     sys.stderr.write("-v/-verbose :run more verbosely (Default silent on success)\n");
+    sys.stderr.write("-t/-trace   :report the profiling trace of the last animation played instead\n");
+    sys.stderr.write("             and optionally write its timeline to a CSV file\n");
     sys.stderr.write("\n\n");
 
 #/* Main */
 def main():
     global verbosity
+    traceReport = False
+    timelinefile = None
 
     i = 1
     while i < len(sys.argv):
@@ -387,6 +599,11 @@ def main():
             sys.exit(0);
         elif sys.argv[i] == '-v' or sys.argv[i] == '-verbose':
             verbosity = True
+        elif sys.argv[i] == '-t' or sys.argv[i] == '-trace':
+            traceReport = True
+            if i+1 < len(sys.argv) and sys.argv[i+1][0] != '-':
+                i += 1
+                timelinefile = sys.argv[i]
         else:
             sys.stderr.write("\nWhoops - Unrecognized argument: %s\n" % sys.argv[i]);
             print_usage(sys.argv[0]);
@@ -394,6 +611,13 @@ def main():
 
         i += 1
 
+    if traceReport:
+        if not isReady():
+            sys.stderr.write('Whoops - Unable to find the Pico\n')
+            sys.exit(10)
+        printTraceReport(fetchTrace(), timelinefile)
+        return
+
     if(verbosity): print('Creating temporary file')
     tfile = open('abcdef', 'w')
     tfile.write('This is a test of file transfers to the Pico\n')
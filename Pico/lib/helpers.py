@@ -42,16 +42,38 @@ def clearAllDigital():
 import wave
 from machine import I2S
 import _thread
+import gc
 
 I2SDataPin = 9
 I2SBitClockPin = 10
 I2SChannelPin = 11
 
-AudioBlockSize = 1024
+I2SBufferSize = 8192
+AudioBlockSize = I2SBufferSize // 2    # Each ping-pong buffer fills half the I2S buffer
 CSVAsciiBlockSize = 512
+SDBlockSize = 512
+
+# Control data ring buffer depth limits.  The depth actually used is the number of
+# records that fit in 1/ControlQueueRAMShare of the free RAM, within these limits.
+ControlQueueMinDepth = 5
+ControlQueueMaxDepth = 64
+ControlQueueRAMShare = 8
+ControlReadSize = 4096      # Largest single control file read, a multiple of SDBlockSize
+ControlDecodeBatch = 4      # Most control records decoded between audio writes
+
+# The I2S channel is shared by all players and only set up again when a player
+# needs different bits, channels or rate from the last one
+_audioOut = None
+_audioParams = None
+
+def controlQueueDepth(recordsize):
+    # Pick a control data ring buffer depth that fits comfortably in free RAM
+    gc.collect()
+    depth = gc.mem_free() // ControlQueueRAMShare // max(1, recordsize)
+    return max(ControlQueueMinDepth, min(ControlQueueMaxDepth, depth))
 
 class WavePlayer:
-    def __init__(self, wavefilename, csvfilename=None, binblocksize=0, verbose=0):
+    def __init__(self, wavefilename, csvfilename=None, binblocksize=0, verbose=0, queuedepth=None):
         self.verbose = verbose
         self.filename = wavefilename
         try:
@@ -62,8 +84,23 @@ class WavePlayer:
         self._volume = 0.5
 
         # Open the csvfile if specified
-        self.fullqueue = []
-        self.emptyqueue = []
+        # Control data is passed from the audio thread to the control loop in a
+        # fixed-size ring of slots.  Only the audio thread moves ringhead and only
+        # the control loop moves ringtail so no locks are needed.  The slot at
+        # ringtail is held by the control loop until its next call to readline.
+        # If a decoder is set, the audio thread also decodes each record into
+        # frame buffers for its slot and ringready, which trails ringhead, marks
+        # where decoding is up to.  The control loop only sees decoded records.
+        self.ring = []
+        self.ringlens = []
+        self.ringhead = 0
+        self.ringready = 0
+        self.ringtail = 0
+        self.slot = 0           # Slot of the record last returned by readline
+        self.decoder = None
+        self.holding = False
+        self.ateof = False
+        self.csvfiletime = 0
         self.queuesize = 0
         self.binblocksize = 0
         self.csvfile = None
@@ -75,15 +112,16 @@ class WavePlayer:
                 self.csvfile = open(csvfilename, 'rb')
                 # If opening is successful, set up data queue
                 self.binblocksize = binblocksize
-                # Create a semaphore lock for threads to coordinate getting and putting data in queue
-                self.queuelock = _thread.allocate_lock()
-                # Fill the queue initially
-                self.queuesize = 5
-                # initially fill the empty queue
+                self.queuesize = queuedepth if queuedepth else controlQueueDepth(binblocksize)
+                # All the slots live in one buffer so runs of them can be read at once
+                self.ringbuf = bytearray(self.queuesize * binblocksize)
+                self.ringmv = memoryview(self.ringbuf)
                 for i in range(self.queuesize):
-                    self.emptyqueue.append(bytearray(binblocksize))
-                # Read in the first two blocks of binary data
+                    self.ring.append(self.ringmv[i*binblocksize:(i+1)*binblocksize])
+                self.ringlens = [0] * self.queuesize
+                # Fill the queue initially
                 self.bfillqueue()
+                self.decodequeue()
             except:
                 pass    # Ignore any errors including filename is None
         else:
@@ -91,12 +129,11 @@ class WavePlayer:
             try:
                 self.csvfile = open(csvfilename, 'r')
                 # If opening is successful, set up data queue
-                # Create a semaphore lock for threads to coordinate getting and putting data in queue
-                self.queuelock = _thread.allocate_lock()
+                self.queuesize = queuedepth if queuedepth else controlQueueDepth(CSVAsciiBlockSize)
+                self.ring = [None] * self.queuesize
                 # Fill the queue initially
-                self.queuesize = 5
-                # initially fill the queue
                 self.fillqueue()
+                self.decodequeue()
             except:
                 pass    # Ignore any errors including filename is None
 
@@ -105,6 +142,16 @@ class WavePlayer:
         self.currbuffer = 0
         self.audiodata[0] = bytearray(AudioBlockSize)
         self.audiodata[1] = bytearray(AudioBlockSize)
+        self.audioviews = [memoryview(self.audiodata[0]), memoryview(self.audiodata[1])]
+        self.audiosizes = [0, 0]
+        self.alignaudio()
+
+        # Audio clock bookkeeping.  framesqueued counts frames handed to write() and
+        # anchorframes/anchorticks snapshot it when I2S has taken them all, which is
+        # when its buffer is full.  anchorseq is odd while the snapshot is changing.
+        self.framesize = self.file.getsampwidth() * self.file.getnchannels()
+        self.ibufframes = I2SBufferSize // self.framesize
+        self.resetclock()
 
         # Initialize stats
         self.startTicks = 0
@@ -124,19 +171,10 @@ class WavePlayer:
         # Set semaphore to indicate that we need to write again
         self.emptyflag = True
 
-        # Set up pins for I2S
-        datapin = Pin(I2SDataPin, Pin.OUT)
-        bitclockpin = Pin(I2SBitClockPin, Pin.OUT)
-        channelpin = Pin(I2SChannelPin, Pin.OUT)
-
-        # Create the audio out channel over I2S
-        self.audio_out = I2S(1,
-                sck=bitclockpin, ws=channelpin, sd=datapin,
-                mode=I2S.TX,
-                bits=self.file.getsampwidth() * 8,
-                format=(I2S.MONO if self.file.getnchannels() == 1 else I2S.STEREO),
-                rate=self.file.getframerate(),
-                ibuf=AudioBlockSize*4)
+        # Set up the I2S channel
+        self.i2sparams = (self.file.getsampwidth() * 8, self.file.getnchannels(), self.file.getframerate())
+        self.threadrunning = False
+        self.openaudio()
 
         # Create a semaphore lock for outside reads to avoid interfering with reads in this thread
         self.readLock = _thread.allocate_lock()
@@ -148,49 +186,89 @@ class WavePlayer:
 
     def fillqueue(self):
         startTicks = utime.ticks_us()
-        while len(self.fullqueue) < self.queuesize:
+        depth = self.queuesize
+        while not self.ateof:
+            head = self.ringhead
+            if (head + 1) % depth == self.ringtail: break   # Ring is full
             line = self.csvfile.readline()
-            self.queuelock.acquire()
-            self.fullqueue.append(line)
-            self.queuelock.release()
+            self.ring[head] = line
+            if len(line) == 0: self.ateof = True    # Empty line tells reader the file is done
+            self.ringhead = (head + 1) % depth
         self.csvfiletime += utime.ticks_diff(utime.ticks_us(), startTicks)
 
     def bfillqueue(self):
         startTicks = utime.ticks_us()
-        while len(self.emptyqueue) > 0:
-            # Pop empty buffer off of empty queue
-            self.queuelock.acquire()
-            buffer = self.emptyqueue.pop(0)
-            self.queuelock.release()
-            # Fill it up
-            BLOCKSIZE = 512  # Don't read more than 512 bytes per read
-            f = self.csvfile
-            n = self.binblocksize
-            mv = memoryview(buffer)
+        depth = self.queuesize
+        n = self.binblocksize
+        f = self.csvfile
+        while not self.ateof:
+            head = self.ringhead
+            free = (self.ringtail - head - 1) % depth
+            if free == 0: break     # Ring is full
+            # Fill all the free slots up to the end of the ring in one batch
+            count = min(free, depth - head)
+            mv = self.ringmv[head*n:(head+count)*n]
             bytes_read = 0
-            for i in range(0, n - BLOCKSIZE, BLOCKSIZE):
-                bytes_read += f.readinto(mv[i:i + BLOCKSIZE])
-            if bytes_read < n:
-                bytes_read += f.readinto(mv[bytes_read:n])
-            # Push it onto full queue
-            if bytes_read == 0: buffer = b''    # Klugey way to tell it the file is empty so it will stop??
-            self.queuelock.acquire()
-            self.fullqueue.append(buffer)
-            self.queuelock.release()
+            while bytes_read < count * n:
+                nread = f.readinto(mv[bytes_read:min(count*n, bytes_read + ControlReadSize)])
+                if not nread: break
+                bytes_read += nread
+            records = (bytes_read + n - 1) // n
+            for i in range(records):
+                self.ringlens[head + i] = min(n, bytes_read - i*n)
+            if records < count:
+                # Hit end of file so add a zero length record to tell the reader
+                self.ringlens[head + records] = 0
+                records += 1
+                self.ateof = True
+            self.ringhead = (head + records) % depth
         self.csvfiletime += utime.ticks_diff(utime.ticks_us(), startTicks)
 
+    def decodequeue(self, limit=None):
+        # Decode up to limit records that have been read but not yet decoded
+        if self.decoder is None:
+            self.ringready = self.ringhead
+            return
+        depth = self.queuesize
+        count = 0
+        while self.ringready != self.ringhead and (limit is None or count < limit):
+            slot = self.ringready
+            if self.binblocksize > 0:
+                if self.ringlens[slot] > 0: self.decoder(slot, self.ring[slot])
+            elif len(self.ring[slot]) > 0:
+                self.decoder(slot, self.ring[slot])
+            self.ringready = (slot + 1) % depth
+            count += 1
+
+    def setdecoder(self, decoder):
+        # Have the audio thread call decoder(slot, record) for each control record
+        # as it is read.  Must be set before play() and any records already read but
+        # not yet returned are decoded here.  None turns decoding off.
+        self.decoder = decoder
+        if self.queuesize == 0: return
+        if decoder is not None:
+            self.ringready = (self.ringtail + (1 if self.holding else 0)) % self.queuesize
+        self.decodequeue()
+
     def readline(self, emptybuf=None):
         # Must be called from another thread to prevent locking
+        # emptybuf is the record returned by the previous call and is ignored since
+        # that slot is always handed back to the ring here
         if self.controlstop:
             return('')
-        if emptybuf is not None and self.binblocksize > 0:
-            self.emptyqueue.append(emptybuf)
-        while len(self.fullqueue) < 1:
+        if self.holding:
+            self.ringtail = (self.ringtail + 1) % self.queuesize
+            self.holding = False
+        while self.ringready == self.ringtail:
             self.suspendedusec += 20
             utime.sleep_us(20)
-        self.queuelock.acquire()
-        outline = self.fullqueue.pop(0)
-        self.queuelock.release()
+        tail = self.ringtail
+        self.slot = tail
+        if self.binblocksize > 0:
+            outline = self.ring[tail] if self.ringlens[tail] > 0 else b''
+        else:
+            outline = self.ring[tail]
+        self.holding = True
         self.controlstop = len(outline) == 0
         return outline
 
@@ -200,15 +278,50 @@ class WavePlayer:
         pass
 
     def irq(self, arg):
+        # The last write has been taken into the I2S buffer so snapshot the audio clock
+        self.anchorseq += 1
+        self.anchorframes = self.framesqueued
+        self.anchorticks = utime.ticks_us()
+        self.anchorseq += 1
         self.emptyflag = True
         if self.verbose > 1: print('In irq arg:', arg)
 
+    def resetclock(self):
+        self.framesqueued = 0
+        self.anchorseq = 0
+        self.anchorframes = 0
+        self.anchorticks = utime.ticks_us()
+        self.lastclock = 0
+
+    def clockus(self):
+        # Monotonic audio clock in usec since play() based on the I2S sample count
+        # None once the audio has all been read or playback stopped, as the clock then
+        # stands still and the frame clock should run free for the rest of the show
+        if self.file is None or self.stopflag: return None
+        while True:
+            seq = self.anchorseq
+            frames = self.anchorframes
+            ticks = self.anchorticks
+            if seq == self.anchorseq and not seq & 1: break
+        rate = self.file.getframerate()
+        # Everything but a full I2S buffer has already been played at the anchor
+        clock = max(0, frames - self.ibufframes) * 1000000 // rate + utime.ticks_diff(utime.ticks_us(), ticks)
+        # Cannot have played more than has been handed to I2S
+        clock = min(clock, frames * 1000000 // rate)
+        if clock < self.lastclock:
+            clock = self.lastclock
+        self.lastclock = clock
+        return clock
+
     def play(self):
         if self.file is None: return
         if self.verbose > 0: print('Running play() in thread', _thread.get_ident())
         # Play until done or stopped
         self.stopflag = False
         if self.csvfile is not None: self.controlstop = False
+        self.resetclock()
+        self.openaudio()    # Another player may have changed the I2S setup since
+        self.threadrunning = True
         # Kick off playback in a new thread
         _thread.start_new_thread(self.threadplay, (False,))
 
@@ -229,16 +342,33 @@ class WavePlayer:
         while not self.stopflag or not self.controlstop: self.playblock(False)
 
         # Try to more explicitly kill the thread
+        self.threadrunning = False
         _thread.exit()
 
+    def join(self):
+        # Wait for the playback thread to finish
+        while self.threadrunning:
+            utime.sleep_ms(1)
+
+    def closefiles(self):
+        # Close the files of a player that will not be played
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.csvfile is not None:
+            self.csvfile.close()
+            self.csvfile = None
+
     def playblock(self, junk):
         #print('Entered playblock')
-        # Make sure data queue is full
+        # Make sure data queue is full and decoded
         if not self.controlstop:
-            if self.binblocksize > 0:
-                self.bfillqueue()
-            else:
-                self.fillqueue()
+            if not self.ateof:
+                if self.binblocksize > 0:
+                    self.bfillqueue()
+                else:
+                    self.fillqueue()
+            self.decodequeue(ControlDecodeBatch)
 
         # Check to see if we are stopped
         if not self.stopflag:
@@ -248,11 +378,16 @@ class WavePlayer:
                 self.emptyflag = False
                 # Play one block of audio data from current ping-pong buffer
                 startTicks = utime.ticks_us()
-                self.audio_out.write(self.audiodata[self.currbuffer])
+                size = self.audiosizes[self.currbuffer]
+                if size == AudioBlockSize:
+                    self.audio_out.write(self.audiodata[self.currbuffer])
+                else:
+                    self.audio_out.write(self.audioviews[self.currbuffer][:size])
                 totaluploadticks = utime.ticks_diff(utime.ticks_us(), startTicks)
                 if self.verbose > 1: print('Ticks to write block to i2s', totaluploadticks)
                 self.sumuploadticks += totaluploadticks
                 self.blocksplayed += 1
+                self.framesqueued += size // self.framesize
 
                 # Fill the buffer while playing previous buffer
                 # Switch to other buffer
@@ -262,10 +397,50 @@ class WavePlayer:
                 self.sumreadfileticks += utime.ticks_diff(utime.ticks_us(), startTicks)
 
 
+    def openaudio(self):
+        # Take over the I2S channel if it is already set up the same way so the last
+        # player's audio keeps draining while we start.  Otherwise set it up.
+        global _audioOut, _audioParams
+        if _audioParams == self.i2sparams:
+            self.audio_out = _audioOut
+            return
+
+        # Set up pins for I2S
+        datapin = Pin(I2SDataPin, Pin.OUT)
+        bitclockpin = Pin(I2SBitClockPin, Pin.OUT)
+        channelpin = Pin(I2SChannelPin, Pin.OUT)
+
+        # Create the audio out channel over I2S
+        self.audio_out = I2S(1,
+                sck=bitclockpin, ws=channelpin, sd=datapin,
+                mode=I2S.TX,
+                bits=self.file.getsampwidth() * 8,
+                format=(I2S.MONO if self.file.getnchannels() == 1 else I2S.STEREO),
+                rate=self.file.getframerate(),
+                ibuf=I2SBufferSize)
+        _audioOut = self.audio_out
+        _audioParams = self.i2sparams
+
+    def alignaudio(self):
+        # Make the first audio read short enough that all the following reads start on
+        # an SD sector boundary and go to the card as whole multi-block reads
+        self.audiolead = 0
+        try:
+            lead = -self.file.getdataoffset() % SDBlockSize
+            if lead % (self.file.getsampwidth() * self.file.getnchannels()) == 0:
+                self.audiolead = lead
+        except:
+            pass
+
     def loadbuffer(self, buffer):
         startTicks = utime.ticks_us()
         self.readLock.acquire()
-        size = self.file.readframes(AudioBlockSize, databuf=self.audiodata[buffer])
+        if self.audiolead > 0:
+            size = self.file.readframes(AudioBlockSize, databuf=self.audioviews[buffer][:self.audiolead])
+            self.audiolead = 0
+        else:
+            size = self.file.readframes(AudioBlockSize, databuf=self.audiodata[buffer])
+        self.audiosizes[buffer] = size
         if size == 0: self.stopflag = True
         self.readLock.release()
         if self.verbose > 1: print('Ticks to read block:', utime.ticks_diff(utime.ticks_us(), startTicks), 'usec')
@@ -282,6 +457,7 @@ class WavePlayer:
             print('Total time spent reading audio data  :', self.sumreadfileticks, 'usec')
             print('Total time spent uploading data      :', self.sumuploadticks, 'usec')
             print('Total estimated time queue waiting   :', self.suspendedusec, 'usec')
+            print('Control data queue depth             :', self.queuesize, 'records')
             print('Total time                           :', utime.ticks_diff(utime.ticks_us(), self.startTicks)/1000000, 'sec')
             print('Total audio played                   :', self.blocksplayed * self.blockframes * AudioBlockSize / 512 / self.file.getframerate(), 'sec')
             print('----------------------------------------------------')
@@ -290,12 +466,28 @@ class WavePlayer:
     def rewind(self):
         if self.file is None: return
         if not self.stopflag or not self.controlstop: self.stop()
-        # Get ready to start from the top
-        self.file.close()
-        try:
-            self.file = wave.open(self.filename)
-        except:
-            self.file = None
+        self.join()
+        # Get ready to start from the top without reopening the files
+        self.file.setpos(0)
+        self.alignaudio()
+        if self.csvfile is not None:
+            self.csvfile.seek(0)
+            self.ringhead = 0
+            self.ringready = 0
+            self.ringtail = 0
+            self.holding = False
+            self.ateof = False
+            self.controlstop = False
+            self.decoder = None     # Until the header has been skipped again
+            if self.binblocksize > 0:
+                self.bfillqueue()
+            else:
+                self.fillqueue()
+            self.decodequeue()
+        self.currbuffer = 0
+        self.emptyflag = True
+        self.loadbuffer(self.currbuffer)
+        self.stopflag = False
 
     def volume(self, newVolume=None):
         if newVolume is None:
@@ -308,11 +500,159 @@ class WavePlayer:
 
 
 
-############# SD Card Code #################################
+############# Frame Scheduler ################################
 import machine
+
+SchedulerSpinUsec = 1500    # Spin on ticks_us for this last part of every wait
+LateFrameUsec = 1000        # Frames latched later than this are counted as late
+SlewThresholdUsec = 2000    # Slew toward the sync clock when drift exceeds this
+SlewStepUsec = 500          # Largest correction applied per frame
+
+class FrameScheduler:
+    # Latches control frames at their timestamps.  Most of each wait is spent idle
+    # on a one-shot timer and the rest spinning so the frame goes out on time.
+    # If a sync clock such as WavePlayer.clockus is given to start(), the frame
+    # clock is slewed toward it a little each frame whenever they drift apart.
+    def __init__(self):
+        self.timer = None
+        try:
+            self.timer = machine.Timer()
+        except:
+            pass    # No timer available (e.g. on the desktop) so just sleep
+        self.due = False
+        self.startus = 0
+        self.clock = None
+        self.resetstats()
+
+    def resetstats(self):
+        self.frames = 0
+        self.late = 0
+        self.waitus = 0
+        self.sumjitter = 0
+        self.minjitter = 0
+        self.maxjitter = 0
+        self.drift = 0
+        self.maxdrift = 0
+        self.slewus = 0
+
+    def start(self, clock=None):
+        # Restart the frame clock at zero, optionally synced to clock (usec)
+        self.resetstats()
+        self.clock = clock
+        self.startus = utime.ticks_us()
+
+    def sync(self):
+        # Slew the frame clock toward the sync clock if they have drifted apart
+        if self.clock is None: return
+        target = self.clock()
+        if target is None: return
+        self.drift = target - self.now()    # Positive when the sync clock is ahead
+        if abs(self.drift) > abs(self.maxdrift): self.maxdrift = self.drift
+        if abs(self.drift) > SlewThresholdUsec:
+            step = max(-SlewStepUsec, min(SlewStepUsec, self.drift))
+            self.startus = utime.ticks_add(self.startus, -step)
+            self.slewus += abs(step)
+
+    def now(self):
+        # Time on the frame clock in usec
+        return utime.ticks_diff(utime.ticks_us(), self.startus)
+
+    def nowms(self):
+        return self.now() // 1000
+
+    def _fire(self, timer):
+        self.due = True
+
+    def wait(self, framems):
+        # Wait for frame time framems (msec) and return how late we are in usec
+        self.sync()
+        target = framems * 1000
+        now = self.now()
+        remaining = target - now - SchedulerSpinUsec
+        if remaining >= 1000:
+            if self.timer is not None:
+                self.due = False
+                self.timer.init(mode=machine.Timer.ONE_SHOT, period=remaining // 1000, callback=self._fire)
+                while not self.due:
+                    machine.idle()
+            else:
+                utime.sleep_ms(remaining // 1000)
+        while self.now() < target:
+            pass
+        jitter = self.now() - target
+        if target > now: self.waitus += target - now
+
+        # Update stats
+        if self.frames == 0 or jitter < self.minjitter: self.minjitter = jitter
+        if self.frames == 0 or jitter > self.maxjitter: self.maxjitter = jitter
+        self.frames += 1
+        self.sumjitter += jitter
+        if jitter > LateFrameUsec: self.late += 1
+        return jitter
+
+    def printstats(self):
+        print('Frames latched:', self.frames, ' Late by over', LateFrameUsec, 'usec:', self.late)
+        if self.frames > 0:
+            print('Frame jitter min/avg/max:', self.minjitter, '/', self.sumjitter // self.frames, '/', self.maxjitter, 'usec')
+        if self.clock is not None:
+            print('Audio clock drift final/max:', self.drift, '/', self.maxdrift, 'usec  Total slew:', self.slewus, 'usec')
+
+############# Profiling Trace ################################
+import struct
+
+# Each trace record is one played frame:
+#   frame time (msec), lateness (usec), read/decode (usec), servo output (usec),
+#   digital output (usec), whole cycle (usec), lines skipped, garbage collections
+# Times are clipped to fit.  Must match commlib.py.
+TraceVersion = 1
+TraceFormat = '<IhHHHHBB'
+TraceRecordSize = struct.calcsize(TraceFormat)
+TraceRecords = 512
+
+class Trace:
+    # Fixed-size ring of binary frame records that costs next to nothing to fill
+    def __init__(self, records=TraceRecords):
+        self.records = records
+        self.buf = bytearray(records * TraceRecordSize)
+        self.count = 0
+        self.lastalloc = 0
+
+    def start(self):
+        # Begin a new run
+        self.count = 0
+        self.lastalloc = gc.mem_alloc()
+
+    def record(self, frametime, lateness, readus, servous, digitalus, cycleus, skips):
+        # A drop in allocated memory means the garbage collector ran during the frame
+        alloc = gc.mem_alloc()
+        gcs = 1 if alloc < self.lastalloc else 0
+        self.lastalloc = alloc
+        struct.pack_into(TraceFormat, self.buf, (self.count % self.records) * TraceRecordSize,
+            frametime, max(-32768, min(32767, lateness)), min(65535, readus), min(65535, servous),
+            min(65535, digitalus), min(65535, cycleus), min(255, skips), gcs)
+        self.count += 1
+
+    def dump(self):
+        # Send the records oldest first as hex to the desktop
+        n = min(self.count, self.records)
+        print('trace', TraceVersion, n, TraceRecordSize)
+        mv = memoryview(self.buf)
+        first = self.count - n
+        for i in range(first, self.count):
+            offset = (i % self.records) * TraceRecordSize
+            sys.stdout.write(binascii.hexlify(mv[offset:offset + TraceRecordSize]).decode('utf-8'))
+            sys.stdout.write('\n')
+        print('end')
+
+trace = Trace()
+
+############# SD Card Code #################################
 import os
 import sdcard
 
+# SPI clock rates to try for the SD card, fastest first
+SDBaudRates = (40000000, 31250000, 25000000, 20000000, 12500000)
+
 def mountSDCard(mountpoint='/sd'):
     # Assign chip select (CS) pin (and start it high)
     cs = machine.Pin(17, machine.Pin.OUT)
@@ -332,8 +672,9 @@ def mountSDCard(mountpoint='/sd'):
     sd = sdcard.SDCard(spi, cs)
 
     # Set the speed to fast enough for audio
-    # Have to set it here because the SDCard constructor above sets the baudrate back to 1,000,000
-    spi.init(baudrate=40000000)
+    # Have to set it here because the SDCard constructor above sets the baudrate back to 1,320,000
+    # Step down from the fastest rate until the card reads back reliably
+    sd.negotiate_spi(SDBaudRates)
 
     # Mount filesystem
     vfs = os.VfsFat(sd)
@@ -342,6 +683,7 @@ def mountSDCard(mountpoint='/sd'):
 ################ USB data transfer code ###############################################
 import select
 import sys
+import json
 
 try:
     # Create object for communicating over USB
@@ -369,6 +711,9 @@ def handleInput():
             blockSizes = tables.getBinarysizes()
             print(tables.PreferBinary)
             print(blockSizes[0], blockSizes[1], blockSizes[2], blockSizes[3])
+        elif inline[6] == 'd':
+            # Wants the whole capability descriptor on one line
+            print(json.dumps(getCapabilities()))
     elif inline[0] == 'a':
         # Trigger one playback
         return 1
@@ -408,15 +753,34 @@ def handleInput():
                 fsize -= len(line)
                 if fsize > 0: line = sys.stdin.buffer.read(min(fsize, 512))
             file.close()
+            # Catalog the file now that it is all there
+            root = filename[:filename.rfind('.')]
+            if root in _pendingCatalog:
+                writeCatalogEntry(root, _pendingCatalog.pop(root))
             if tables.PreferBinary:
                 # Convert the file to binary format
                 tables.csvToBin(filename)
+                if filename[-4:] == '.csv' and isfile(filename[:-4] + '.bin'):
+                    blockSizes = tables.getBinarysizes()
+                    writeCatalogEntry(filename[:-4], {'control':filename[:-4] + '.bin',
+                        'format':'bin', 'blocksize':blockSizes[0]})
             # Wait 2 seconds for commlib to close connection
             utime.sleep_ms(2000)
             machine.reset() # Reboot to get new files into playback list?
         except:
             # sys.stderr.write('\nWhoops - Unable to write file %d\n' % filename)
             pass
+    elif inline[0] == 't':
+        # Send the profiling trace of the last animation played
+        trace.dump()
+    elif inline[0] == 'k':
+        # Describe the file about to be uploaded for the animation catalog.  It is
+        # only cataloged once the upload has been written.
+        try:
+            vals = inline.split(None, 2)
+            _pendingCatalog[vals[1]] = json.loads(vals[2])
+        except:
+            pass
     elif inline[0] == 'c':
         try:
             vals = inline.split()
@@ -427,7 +791,32 @@ def handleInput():
             print(-1)
     return 0
 
+CapabilitiesVersion = 1
+
+def getCapabilities():
+    # Describes this controller so commlib can choose upload formats without asking again
+    blockSizes = tables.getBinarysizes()
+    return {
+        'version':CapabilitiesVersion,
+        'firmware':os.uname().release,
+        'preferbinary':tables.PreferBinary,
+        'blocksizes':list(blockSizes),
+        'tableshash':tables.getTablesHash(),
+        'flashfree':freeSpace('/'),
+        'sdfree':freeSpace('/sd'),
+    }
+
 ################################### File Utilities ############################
+def freeSpace(fs):
+    # Returns the free bytes on a mounted file system or -1 if it is not there
+    try:
+        if fs != '/' and fs.strip('/') not in os.listdir('/'):
+            return -1
+        stat = os.statvfs(fs)
+        return stat[0] * stat[3]
+    except:
+        return -1
+
 def filecrc16(fname):
     # Computes and returns a 16-bit Cyclic Redundancy Checksum of the specified file
     PRESET = 0xFFFF
@@ -466,6 +855,71 @@ def pathjoin(path, fname):
         fname = path + fname
     return fname
 
+# The animation catalog lists the animations in a directory with everything needed to
+# start them so nothing has to be probed at boot or play time.  It is a JSON file
+# written from the 'k' command commlib sends ahead of each upload, once the upload
+# has been written.  Its anims dict is
+# keyed by the animation path without extension, and each entry may have:
+#   control, format ('csv' or 'bin'), blocksize, duration (msec) from the control file
+#   audio, rate, channels, sampwidth, frames from the wave file
+CatalogName = 'animcatalog'
+CatalogVersion = 1
+animCatalog = {}    # Catalog entries indexed by control file path
+_pendingCatalog = {}    # Entries sent ahead of an upload, by animation path
+
+def readCatalog(dir):
+    # Returns the catalog in dir or None if there is not a usable one
+    try:
+        with open(pathjoin(dir, CatalogName), 'r') as infile:
+            catalog = json.load(infile)
+        if catalog.get('version') == CatalogVersion: return catalog
+    except:
+        pass
+    return None
+
+def writeCatalogEntry(root, entry):
+    # Merge entry into the catalog entry for animation root
+    dir = root[:root.rfind('/')] if root.rfind('/') > 0 else '/'
+    catalog = readCatalog(dir)
+    if catalog is None:
+        # Start a new catalog with the animations already in dir so none are lost
+        catalog = {'version':CatalogVersion, 'anims':{}}
+        animList,idler = scanAnimFiles(dir, '.bin' if tables.PreferBinary else '.csv')
+        if idler is not None: animList.append(idler)
+        for tpair in animList:
+            catalog['anims'][tpair[0][:-4]] = {'control':tpair[0], 'audio':tpair[1], 'format':tpair[0][-3:]}
+    current = catalog['anims'].get(root, {})
+    current.update(entry)
+    catalog['anims'][root] = current
+    with open(pathjoin(dir, CatalogName), 'w') as outfile:
+        json.dump(catalog, outfile)
+
+def catalogEntry(controlfile):
+    # Returns the catalog entry for controlfile or None if it is not cataloged
+    return animCatalog.get(controlfile)
+
+def scanAnimFiles(dir, ext):
+    # Find pairs of control files with extension ext and wave files in dir
+    animList = []
+    idler = None
+    try:
+        filelist = os.listdir(dir)
+        for filename in filelist:
+            tpair = []
+            if filename[-4:] == ext:
+                tpair.append(pathjoin(dir, filename))
+                tname = filename[:-4] + '.wav'
+                if tname in filelist:
+                    tpair.append(pathjoin(dir, tname))
+                    if tname == 'idle.wav':
+                        idler = tpair
+                    else:
+                        animList.append(tpair)
+    except:
+        # Ignore problems
+        pass
+    return animList,idler
+
 def findAnimFiles(dir='/anims'):
     # Find animation files
     # Create empty list of csv/audio file pairs
@@ -510,22 +964,18 @@ def findAnimFiles(dir='/anims'):
                 line = infile.readline()
     else:
         # Check for matching filename pairs
-        try:
-            filelist = os.listdir(dir)
-            for filename in filelist:
-                tpair = []
-                if filename[-4:] == ext:
-                    tpair.append(pathjoin(dir, filename))
-                    tname = filename[:-4] + '.wav'
-                    if tname in filelist:
-                        tpair.append(pathjoin(dir, tname))
-                        if tname == 'idle.wav':
-                            idler = tpair
-                        else:
-                            animList.append(tpair)
-        except:
-            # Ignore problems
-            pass
+        animList,idler = scanAnimFiles(dir, ext)
+
+        # Take what the catalog knows about the pairs found so the files need not be
+        # opened to check them.  Files copied by hand are still found by the scan and
+        # cataloged animations that are gone or only part uploaded are left out.
+        catalog = readCatalog(dir)
+        if catalog is not None:
+            anims = catalog['anims']
+            for tpair in animList + ([idler] if idler is not None else []):
+                entry = anims.get(tpair[0][:-4])
+                if entry is not None and entry.get('control') == tpair[0]:
+                    animCatalog[tpair[0]] = entry
 
     # Check for archived tabledefs
     if len(animList) > 0:
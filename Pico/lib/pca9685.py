@@ -67,6 +67,13 @@ class PCA9685:
         self.i2c.writeto_mem(self.address, 0x06 + 4 * start, thebytes)
         #self._write(0x00, old_mode) # Mode 1, original mode
 
+    def alloff(self):
+        """
+        The alloff method turns every output fully off with a single write to the
+        ALL_LED registers rather than writing the registers of all 16 outputs.
+        """
+        self.i2c.writeto_mem(self.address, 0xfa, b'\x00\x00\x00\x10')
+
     def allpwm(self, off=None, on=None, start=0):
         """
         The method allpwm implements use of autoincrement to allow faster writing
@@ -36,6 +36,8 @@ import time
 
 
 _CMD_TIMEOUT = 150
+_DATA_TIMEOUT = 100000
+_SLOW_BAUDRATE = 1320000
 
 _R1_IDLE_STATE = 1 << 0
 #R1_ERASE_RESET = 1 << 1
@@ -120,7 +122,41 @@ class SDCard:
             raise OSError("can't set 512 block size")
 
         # set to high data rate now that it's initialised
-        self.init_spi(1320000)
+        self.init_spi(_SLOW_BAUDRATE)
+        self.baudrate = _SLOW_BAUDRATE
+
+    def negotiate_spi(self, baudrates):
+        # Use the fastest of baudrates at which multi-block reads match those at the
+        # safe rate.  Returns the rate in use which is the safe rate if none pass.
+        ref = bytearray(1024)
+        check = bytearray(1024)
+        self.init_spi(_SLOW_BAUDRATE)
+        self.baudrate = _SLOW_BAUDRATE
+        try:
+            if self.readblocks(0, ref) != 0:
+                return self.baudrate
+        except OSError:
+            return self.baudrate
+        for baudrate in baudrates:
+            self.init_spi(baudrate)
+            try:
+                good = True
+                for _ in range(2):
+                    check[:] = bytes(len(check))    # So stale data can't pass
+                    if self.readblocks(0, check) != 0 or check != ref:
+                        good = False
+                        break
+            except OSError:
+                good = False
+            if good:
+                self.baudrate = baudrate
+                return baudrate
+            # Drop back and make sure the card is not left mid-transfer
+            self.init_spi(_SLOW_BAUDRATE)
+            self.cs.low()
+            self.cmd_nodata(b'\x0c')
+        self.init_spi(_SLOW_BAUDRATE)
+        return self.baudrate
 
     def init_card_v1(self):
         for i in range(_CMD_TIMEOUT):
@@ -195,9 +231,14 @@ class SDCard:
     def readinto(self, buf):
         self.cs.low()
 
-        # read until start byte (0xff)
-        while self.spi.read(1, 0xff)[0] != 0xfe:
-            pass
+        # read until start byte (0xfe)
+        for _ in range(_DATA_TIMEOUT):
+            if self.spi.read(1, 0xff)[0] == 0xfe:
+                break
+        else:
+            self.cs.high()
+            self.spi.write(b'\xff')
+            raise OSError("timeout waiting for SD card data")
 
         # read data
         mv = self.dummybuf_memoryview[:len(buf)]
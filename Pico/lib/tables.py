@@ -21,12 +21,19 @@ import pca9685
 import maestro
 import time
 import struct
+import json
+import hashlib
+import binascii
 from machine import Pin, I2C, PWM
 
 #/* Define block */
 verbosity = False
 PreferBinary = False
 
+I2CFrequency = 1000000      # Fast-mode Plus, the fastest the pca9685 supports
+BlockMergeGap = 8           # Unchanged bytes between changes that are cheaper to resend
+                            # than starting another I2C write
+
 class TableServos(servo.Servos):
     """
         The TableServos class extends the Servos based on their use in this table
@@ -38,6 +45,7 @@ class TableServos(servo.Servos):
 
         self.firstport = firstport
         self.numbytes = numports * 4
+        self.lastblock = None   # Last block sent by writeblock if still on the board
 
     def jambytes(self, thebytes, start=-1):
         if start < 0:
@@ -45,6 +53,58 @@ class TableServos(servo.Servos):
         if self.pca9685 is not None:
             self.pca9685.jambytes(thebytes, start)
 
+    def writeblock(self, thebytes):
+        # Send a full block of on/off values for the board but only write the
+        # registers that changed since the last block.  Changes close together
+        # go in a single write.
+        last = self.lastblock
+        if last is None:
+            self.pca9685.jambytes(thebytes)
+            self.lastblock = bytearray(thebytes)
+            return
+        mv = memoryview(thebytes)
+        start = -1
+        end = 0
+        for i in range(0, len(last), 4):
+            if (mv[i+2] != last[i+2] or mv[i+3] != last[i+3] or
+                    mv[i] != last[i] or mv[i+1] != last[i+1]):
+                if start >= 0 and i - end > BlockMergeGap:
+                    self.pca9685.jambytes(mv[start:end], start >> 2)
+                    start = -1
+                if start < 0: start = i
+                end = i + 4
+        if start >= 0:
+            self.pca9685.jambytes(mv[start:end], start >> 2)
+            last[:] = mv
+
+    def currentblock(self):
+        # Returns the block of on/off values the board is outputting now
+        if self.lastblock is not None:
+            return self.lastblock
+        block = bytearray(self.numbytes)
+        for i in range(min(self.numbytes // 4, len(self.positions))):
+            struct.pack_into('<HH', block, i*4, 0, int(self.positions[i]))
+        return block
+
+    # Anything else written to the board means the last block is no longer there
+    def duty(self, index, duty):
+        self.lastblock = None
+        servo.Servos.duty(self, index, duty)
+
+    def release(self, index):
+        self.lastblock = None
+        servo.Servos.release(self, index)
+
+    def pushValues(self):
+        self.lastblock = None
+        servo.Servos.pushValues(self)
+
+    def releaseAll(self):
+        # Turn all the outputs off in one go with the ALL_LED registers
+        self.lastblock = None
+        for i in range(16): self.positions[i] = 0
+        self.pca9685.alloff()
+
     def address(self):
         if self.pca9685 is not None:
             return self.pca9685.address
@@ -91,6 +151,7 @@ class TableMaestros():
 
 # PWM Definitions
 _i2c = None
+_I2CFrequency = I2CFrequency
 _PWMBoards = {}         # Dictionary of Servos objects, one for each pca9685 board
 _PWMGPIOs = {}          # Dictionary of GPIO pins set up for direct PWM control
 
@@ -100,18 +161,20 @@ pControl = None
 def dogpio(porttableentry, value, push=False):
     # Handle a PWM signal via a Pico GPIO pin
     if verbosity: print('Doing dogpio with porttableentry:', porttableentry, 'and value:', value)
-    if 'pin' not in porttableentry:
+    if 'pwm' not in porttableentry:
         if verbosity: print('Whoops - Wrong port table entry for dogpio')
         return False
 
-    shift = porttableentry['shift']
-    pin = porttableentry['pin']
+    # PWM object and its 50Hz frequency were set up once by addPWMPortTableEntry
+    value = value>>porttableentry['shift']    # Normally should be a shift of 0 for GPIO pins
+    porttableentry['pwm'].duty_u16(value)
+
+def _makePWM(pin):
+    # Create, or reuse, the PWM object for a GPIO pin and set it up for servos
     if pin not in _PWMGPIOs:
         _PWMGPIOs[pin] = PWM(Pin(pin, Pin.OUT))
-
-    value = value>>shift    # Normally should be a shift of 0 for GPIO pins
-    _PWMGPIOs[pin].freq(50)
-    _PWMGPIOs[pin].duty_u16(value)
+        _PWMGPIOs[pin].freq(50)
+    return _PWMGPIOs[pin]
 
 def dosomething(port, valuebytes):
     # Accept any set PWM but only process GPIO ones, if any
@@ -126,45 +189,25 @@ def dosomething(port, valuebytes):
 tickcounter = 0
 def dopca9685(porttableentry, value, push=False):
     # Handle a PWM signal via I2C and an external pca9685 board
-    global _i2c
-    global _PWMBoards
     global tickcounter
 
     if verbosity: print('Doing dopca9685 with port:', porttableentry)
-    if True: #try:
-        ticks = time.ticks_us()
-        board = porttableentry['board']
-        pwmout = porttableentry['pwmout']
-        shift = porttableentry['shift']
-        #print('Ticks to look up board, pwmout, and shift in dict:', time.ticks_diff(time.ticks_us(), ticks))
-        if board not in _PWMBoards:
-            ticks = time.ticks_us()
-            if verbosity: print('Whoops - PWMBoard id:', board, 'not in initialized list:', _PWMBoards)
-            if _i2c is None:
-                sda = Pin(0, Pin.OUT, pull=Pin.PULL_UP)
-                scl = Pin(1, Pin.OUT, pull=Pin.PULL_UP)
-                id = 0
-                _i2c = I2C(id=id, sda=sda, scl=scl, freq=1048576)   # Use 1MHz as that is max for pca9685
-            _PWMBoards[board] = servo.TableServos(i2c=_i2c, address=0x40+board)
-            #print('Ticks to nstantiate board if needed:', time.ticks_diff(time.ticks_us(), ticks))
-
-        # Normally should be a shift of 4 for pca9685
-        if verbosity: print('Pushing value:', value, 'to pwm board:',board,'port:',pwmout,'push:',push)
-        ticks = time.ticks_us()
-        # Normally should be a shift of 4 for pca9685
-        #_PWMBoards[board].position(pwmout, duty=value>>shift, push=push)
-        _PWMBoards[board].duty(pwmout, value>>shift)
-        #print('Ticks to set servo value:', time.ticks_diff(time.ticks_us(), ticks))
-        tickcounter += time.ticks_diff(time.ticks_us(), ticks)
-    else: #except:
+    if 'servos' not in porttableentry:
         if verbosity: print('Whoops - Wrong port table entry for dopca9685')
         return False
 
+    # Normally should be a shift of 4 for pca9685
+    if verbosity: print('Pushing value:', value, 'to pwm board:',porttableentry['board'],'port:',porttableentry['pwmout'],'push:',push)
+    ticks = time.ticks_us()
+    porttableentry['servos'].duty(porttableentry['pwmout'], value>>porttableentry['shift'])
+    tickcounter += time.ticks_diff(time.ticks_us(), ticks)
+
 def setPWM(port, value, push=False):
     # Handle a PWM signal to the specified port via the configured method
     #if port in PWMPortTable and 'func' in PWMPortTable[port]:
     try:
-        PWMPortTable[port]['func'](PWMPortTable[port], value, push)
+        entry = PWMPortTable[port]
+        entry['func'](entry, value, push)
     except:
         pass
 
@@ -227,35 +270,60 @@ def releaseAllPWMs():
     for pin in _PWMGPIOs:
         _PWMGPIOs[pin].duty_u16(0)
 
+def pushMaestros():
+    # Push any saved values to Maestro boards
+    if pControl:
+        pControl.sendCmds()
+
 def pushPWMs():
     # Push any PWMvalues to pca boards
     for board in _PWMBoards:
         _PWMBoards[board].pushValues()
     # Now push any saved values to Maestro boards
-    if pControl:
-        pControl.sendCmds()
+    pushMaestros()
     # Don't need to push to GPIO pins??
 
-def configurepca9685(firstport=0, boardid=0):
-    # Configure a single external pca9685 board
-    global PWMPortTable
+def _makeI2C():
+    # Create, or reuse, the I2C bus for the pca9685 boards
     global _i2c
+    if _i2c is None:
+        sda = Pin(0, Pin.OUT, pull=Pin.PULL_UP)
+        scl = Pin(1, Pin.OUT, pull=Pin.PULL_UP)
+        id = 0
+        _i2c = I2C(id=id, sda=sda, scl=scl, freq=_I2CFrequency)
+    return _i2c
+
+def _makeBoard(boardid, firstport=0):
+    # Create, or reuse, the TableServos object for a pca9685 board
     global _PWMBoards
 
-    # Generate 16 PWM entries per pca9685 board
-    for i in range(16):
-        PWMPortTable[firstport+i] = {'func':dopca9685, 'board':boardid, 'pwmout':i, 'shift':4}
+    if boardid not in _PWMBoards:
+        _PWMBoards[boardid] = TableServos(i2c=_makeI2C(), address=0x40+boardid, firstport=firstport)
+    return _PWMBoards[boardid]
+
+def configureI2C(frequency=I2CFrequency):
+    # Set the clock for the pca9685 I2C bus.  Use 400000 if long wires or weak
+    # pull-ups keep the boards from working at the default 1MHz.
+    global _I2CFrequency
+    global _i2c
+
+    _I2CFrequency = frequency
+    if _i2c is not None:
+        # Boards already configured get moved onto the new bus
+        _i2c = None
+        for boardid in _PWMBoards:
+            _PWMBoards[boardid].pca9685.i2c = _makeI2C()
+
+def configurepca9685(firstport=0, boardid=0):
+    # Configure a single external pca9685 board
+    global PWMPortTable
 
     # Explicitly create the TableServos object and put in list
-    if boardid not in _PWMBoards:
-        if verbosity: print('Whoops - PWMBoard id:', boardid, 'not in initialized list:', _PWMBoards)
-        if _i2c is None:
-            sda = Pin(0, Pin.OUT, pull=Pin.PULL_UP)
-            scl = Pin(1, Pin.OUT, pull=Pin.PULL_UP)
-            id = 0
-            _i2c = I2C(id=id, sda=sda, scl=scl, freq=1048576)   # Use 1MHz as that is max for pca9685
-        _PWMBoards[boardid] = TableServos(i2c=_i2c, address=0x40+boardid, firstport=firstport)
+    board = _makeBoard(boardid, firstport)
 
+    # Generate 16 PWM entries per pca9685 board, each bound to the board object
+    for i in range(16):
+        PWMPortTable[firstport+i] = {'func':dopca9685, 'board':boardid, 'servos':board, 'pwmout':i, 'shift':4}
 
     global _ExpectedPWMPorts
     _ExpectedPWMPorts += 16
@@ -268,19 +336,38 @@ def domaestroPWM(porttableentry, value, push=False):
     try:
         board = porttableentry['board']
         pwmout = porttableentry['pwmout']
-        mult = porttableentry['multiplier']
+        if 'cmd' not in porttableentry: _bindMaestroEntry(porttableentry, porttableentry['multiplier'])
 
-        # Normally should be a multiply of 1.22 for Maestros
-        if verbosity: print('Pushing value:', value, 'to pwm board:',board,'port:',pwmout,'multiplier:',mult)
-        value = int(value * mult)
-        if pControl is not None:
-            pControl.setBoard(board)
-            pControl.setTarget(pwmout, value)
-            if push: pControl.sendCmds()
+        if verbosity: print('Pushing value:', value, 'to pwm board:',board,'port:',pwmout,'multiplier:',porttableentry['multiplier'])
+        _queueMaestroTarget(porttableentry, value)
+        if push and pControl is not None: pControl.sendCmds()
     except:
         if verbosity: print('Whoops - Wrong port table entry for domaestroPWM')
         return False
 
+def _bindMaestroEntry(entry, mult):
+    # Attach the pre-encoded Set Target command head to a port entry along with the
+    # multiplier in 4096ths so values scale with an integer multiply and shift.
+    # There isn't RAM for a full value table per multiplier like on the desktop.
+    entry['cmd'] = chr(0x04) + chr(entry['pwmout'])
+    entry['multiplier'] = mult
+    entry['scale'] = int(mult * 4096 + 0.5)
+
+def _queueMaestroTarget(entry, value):
+    # Add the Set Target command for a value to the Maestro command list.  Ranges set
+    # on the controller with setRange still go through setTarget to be enforced.
+    if pControl is None: return
+    pwmout = entry['pwmout']
+    target = (int(value) * entry['scale']) >> 12
+    if pControl.Mins[pwmout] > 0 or pControl.Maxs[pwmout] > 0:
+        pControl.setBoard(entry['board'])
+        pControl.setTarget(pwmout, target)
+    else:
+        if target < 0: target = 0
+        elif target > 0x3fff: target = 0x3fff
+        pControl.Targets[pwmout] = target
+        pControl.commands.append((entry['board'], entry['cmd'] + chr(target & 0x7f) + chr(target >> 7)))
+
 def makePControl(TxPin=None):
     global pControl
     if pControl is None:
@@ -293,12 +380,23 @@ def configureMaestroUART(TxPin=None):
     if TxPin is not None:
         makePControl(TxPin=TxPin)
 
+def configureMaestroMultipleTargets(enable=True):
+    # Dummy method for compatibility with Pololu tabledefs.  The Pico sends each target
+    # as its own Set Target command.
+    pass
+
+def configureMaestroPort(boardid=12, port=None):
+    # Dummy method for compatibility with Pololu tabledefs.  The Pico sends to all the
+    # Maestros along the chain from its one UART.
+    pass
+
 def configureMaestroPWM(firstport=0, boardid=0, count=1, firstchannel=0):
     global PWMPortTable
 
     # Generate count PWM entries for this Maestro board
     for i in range(count):
         PWMPortTable[firstport+i] = {'func':domaestroPWM, 'board':boardid, 'pwmout':i+firstchannel, 'multiplier':1.2207}
+        _bindMaestroEntry(PWMPortTable[firstport+i], 1.2207)
 
     global _ExpectedPWMPorts
     _ExpectedPWMPorts += count
@@ -324,6 +422,12 @@ def addPWMPortTableEntry(port, entry):
     if 'shift' not in entry:
         entry['shift'] = 0
 
+    # Bind hardware objects now rather than on every value written
+    if entry.get('func') == dogpio and 'pin' in entry:
+        entry['pwm'] = _makePWM(entry['pin'])
+    elif entry.get('func') == dopca9685 and 'board' in entry and 'servos' not in entry:
+        entry['servos'] = _makeBoard(entry['board'], port - entry.get('pwmout', 0))
+
     PWMPortTable[port] = entry
     _ExpectedPWMPorts += 1
 
@@ -345,13 +449,11 @@ def doMaestroDigital(porttableentry, value, push=False):
     try:
         board = porttableentry['board']
         pwmout = porttableentry['pwmout']
+        if 'cmd' not in porttableentry: _bindMaestroEntry(porttableentry, 7000)
 
         if verbosity: print('Pushing value:', value, 'to pwm board:',board,'port:',pwmout)
-        value = int(value * 7000)
-        if pControl is not None:
-            pControl.setBoard(board)
-            pControl.setTarget(pwmout, value)
-            if push: pControl.sendCmds()
+        _queueMaestroTarget(porttableentry, value)
+        if push and pControl is not None: pControl.sendCmds()
     except:
         if verbosity: print('Whoops - Wrong port table entry for domaestroPWM')
         return False
@@ -363,6 +465,7 @@ def configureMaestroDigital(boardid=12, firstport=0, firstchannel=0, count=1):
     # Populate the port table
     for indx in range(count):
         DigitalPortTable[indx+firstport] = { 'func':doMaestroDigital, 'board':boardid, 'pwmout':indx+firstchannel }
+        _bindMaestroEntry(DigitalPortTable[indx+firstport], 7000)
 
     global _ExpectedDigitalPorts
     _ExpectedDigitalPorts += count
@@ -376,6 +479,7 @@ _DataPin = None
 _ClockPin = None
 _RclkPin = None
 _ClearPin = None
+_595Pins = None             # Pin objects (data, rclk, clock, clear) created once by configure595s
 
 def configure595s(firstport=0, portcount=24, datapin=26, clockpin=27, rclkpin=21, clearpin=20):
     # Configure a block of portcount ports supported by 595s at 8 ports per board
@@ -384,6 +488,7 @@ def configure595s(firstport=0, portcount=24, datapin=26, clockpin=27, rclkpin=21
     global _ClockPin
     global _RclkPin
     global _ClearPin
+    global _595Pins
     global DigitalPortTable
 
     # Set up buffer for values prior to shifting them out to the 595s
@@ -395,6 +500,10 @@ def configure595s(firstport=0, portcount=24, datapin=26, clockpin=27, rclkpin=21
     _RclkPin = rclkpin
     _ClearPin = clearpin
 
+    # Define the pins once so shifting out does not recreate them every frame
+    _595Pins = (Pin(_DataPin, Pin.OUT), Pin(_RclkPin, Pin.OUT), Pin(_ClockPin, Pin.OUT), Pin(_ClearPin, Pin.OUT))
+    _595Pins[3].on() # No want clearing here
+
     # Populate the port table
     for indx in range(portcount):
         DigitalPortTable[indx+firstport] = { 'func':do595, 'index':indx }
@@ -402,21 +511,26 @@ def configure595s(firstport=0, portcount=24, datapin=26, clockpin=27, rclkpin=21
     global _ExpectedDigitalPorts
     _ExpectedDigitalPorts += portcount
 
+def _makeDigitalPin(pin):
+    # Create, or reuse, the output Pin object for a GPIO pin
+    if pin not in _DigitalGPIOs:
+        _DigitalGPIOs[pin] = Pin(pin, Pin.OUT)
+    return _DigitalGPIOs[pin]
+
 def addDigitalPortTableEntry(port, entry):
     global DigitalPortTable
     global _ExpectedDigitalPorts
 
+    # Bind GPIO pins to their Pin objects now rather than on every value written
+    if entry.get('func') == dogpiodigital and 'pin' in entry:
+        entry['pinobj'] = _makeDigitalPin(entry['pin'])
+
     DigitalPortTable[port] = entry
     _ExpectedDigitalPorts += 1
 
 def output595s():
-    if _DataPin is None or _RclkPin is None or _ClockPin is None or _ClearPin is None: return
-    # Define the pins
-    dataPin = Pin(_DataPin, Pin.OUT)
-    clockPin = Pin(_RclkPin, Pin.OUT)
-    shiftPin = Pin(_ClockPin, Pin.OUT)
-    clearPin = Pin(_ClearPin, Pin.OUT)
-    clearPin.on() # No want clearing here
+    if _595Pins is None: return
+    dataPin, clockPin, shiftPin, clearPin = _595Pins
 
     # Cycle the digital state thru all the 74HC595 chips
     for i in range(len(_digitalCurrentState)):
@@ -431,13 +545,8 @@ def output595s():
     clockPin.off()
 
 def fast595s(bytes, count):
-    if _DataPin is None or _RclkPin is None or _ClockPin is None or _ClearPin is None: return
-    # Define the pins
-    dataPin = Pin(_DataPin, Pin.OUT)
-    clockPin = Pin(_RclkPin, Pin.OUT)
-    shiftPin = Pin(_ClockPin, Pin.OUT)
-    clearPin = Pin(_ClearPin, Pin.OUT)
-    clearPin.on() # No want clearing here
+    if _595Pins is None: return
+    dataPin, clockPin, shiftPin, clearPin = _595Pins
 
     valuebits = int.from_bytes(bytes, 'little')
 
@@ -453,6 +562,23 @@ def fast595s(bytes, count):
     clockPin.on()
     clockPin.off()
 
+def shift595s(bits):
+    # Shift out a list of 595 data bits already in shift order (last output first)
+    # and keep _digitalCurrentState up to date with them
+    if _595Pins is None: return
+    dataPin, clockPin, shiftPin, clearPin = _595Pins
+
+    index = len(bits)
+    for value in bits:
+        index -= 1
+        _digitalCurrentState[index] = value
+        dataPin.value(value)
+        shiftPin.on()
+        shiftPin.off()
+
+    # Clock all the bits to the outputs
+    clockPin.on()
+    clockPin.off()
 
 def do595(porttableentry, value):
     if verbosity: print('Doing do595 with porttableentry:', porttableentry)
@@ -464,30 +590,25 @@ def do595(porttableentry, value):
 
 def dogpiodigital(porttableentry, value):
     if verbosity: print('Doing dogpiodigital with porttableentry:', porttableentry)
-    if 'pin' not in porttableentry:
+    if 'pinobj' not in porttableentry:
         if verbosity: print('Whoops - Wrong port table entry for dogpiodigital')
         return False
-    pin = porttableentry['pin']
-    pin = Pin(pin, Pin.OUT)
     if value > 0.5:
-        pin.on()
+        porttableentry['pinobj'].on()
     else:
-        pin.off()
+        porttableentry['pinobj'].off()
 
 def setDigital(port, value, push=False):
-    if port in DigitalPortTable and 'func' in DigitalPortTable[port]:
-        DigitalPortTable[port]['func'](DigitalPortTable[port], value)
+    entry = DigitalPortTable.get(port)
+    if entry is not None and 'func' in entry:
+        entry['func'](entry, value)
     if push: outputDigital()
 
 def clearAllDigital():
     # Set all digital pins to OFF (0)
     # Using clear pin for speed
-    if _DataPin is None or _RclkPin is None or _ClockPin is None or _ClearPin is None: return
-    # Define the pins
-    dataPin = Pin(_DataPin, Pin.OUT)
-    clockPin = Pin(_RclkPin, Pin.OUT)
-    shiftPin = Pin(_ClockPin, Pin.OUT)
-    clearPin = Pin(_ClearPin, Pin.OUT)
+    if _595Pins is None: return
+    dataPin, clockPin, shiftPin, clearPin = _595Pins
 
     # Clear all the registers
     clearPin.on() # Make sure initially not clearing, then cycle bit
@@ -641,8 +762,24 @@ _ExpectedDigitalinputPorts = 0
 
 ############## Method to process an external file for table definition #################
 _parsedFile = None
+_tablesHash = None      # Hash of the tabledefs source the current tables were built from
+_tableCalls = []        # Configuration calls made by that source, saved as the table image
+
+# Configuration functions that tabledefs may call.  Only these calls are recorded in
+# the compiled table image and replayed from it, so tabledefs files should confine
+# themselves to them.
+_ConfigFunctions = (
+    'configurepca9685', 'configure595s', 'configureMaestroUART', 'configureMaestroPWM',
+    'configureMaestroDigital', 'addPWMPortTableEntry', 'addDigitalPortTableEntry',
+    'configureMaestroTriggerInput', 'configureMaestroRunInput', 'configureMaestroMainInput',
+    'configureMaestroDigitalInputs', 'setPreferBinary', 'configureI2C',
+    'configureMaestroPort', 'configureMaestroMultipleTargets',
+)
+TableImageVersion = 1
 
 def clearTables():
+    global _I2CFrequency
+    _I2CFrequency = I2CFrequency
     global _PWMBoards
     _PWMBoards = {}         # Dictionary of Servos objects, one for each pca9685 board
     global _PWMGPIOs
@@ -653,6 +790,8 @@ def clearTables():
     _ExpectedPWMPorts = 0
     global _DigitalGPIOs
     _DigitalGPIOs = {}          # Dictionary of GPIO pins set up for Digital control
+    global _595Pins
+    _595Pins = None
     global DigitalPortTable
     DigitalPortTable = { }
     global _ExpectedDigitalPorts
@@ -669,12 +808,109 @@ def clearTables():
     _ExpectedDigitalinputPorts = 0
     global _parsedFile
     _parsedFile = None
+    global _tablesHash
+    _tablesHash = None
+    global _tableCalls
+    _tableCalls = []
 
 
 def setPreferBinary(flag):
     global PreferBinary
     PreferBinary = flag
 
+def getTablesHash():
+    # Returns the hash of the tabledefs source in use or None if none was parsed
+    return _tablesHash
+
+def _hashSource(source):
+    # Short hex digest identifying the exact content of a tabledefs file
+    return binascii.hexlify(hashlib.sha256(source).digest()).decode()[0:16]
+
+def _imageName(tablefile):
+    return tablefile + '.json'
+
+def _encode(value):
+    # Make configuration call arguments JSON friendly by naming any functions
+    if isinstance(value, dict):
+        return {key:_encode(value[key]) for key in value}
+    elif isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    elif callable(value):
+        return {'__func__':value.__name__}
+    return value
+
+def _decode(value):
+    # Undo _encode by looking up named functions in this module
+    if isinstance(value, dict):
+        if '__func__' in value:
+            return globals()[value['__func__']]
+        return {key:_decode(value[key]) for key in value}
+    elif isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+def _recorder(name):
+    # Wrap a configuration function so its calls are saved for the table image
+    func = globals()[name]
+    def record(*args, **kwargs):
+        _tableCalls.append([name, _encode(args), _encode(kwargs)])
+        return func(*args, **kwargs)
+    return record
+
+def _loadImage(tablefile, thehash):
+    # Rebuild the tables from the compiled image if it matches the tabledefs source
+    try:
+        with open(_imageName(tablefile), 'r') as f:
+            image = json.load(f)
+    except:
+        return False
+    if image.get('version') != TableImageVersion or image.get('hash') != thehash:
+        if verbosity: print('Table image is stale for:', tablefile)
+        return False
+    try:
+        for name, args, kwargs in image['calls']:
+            if name not in _ConfigFunctions:
+                raise ValueError(name)
+            globals()[name](*_decode(args), **_decode(kwargs))
+    except:
+        if verbosity: print('Whoops - Unable to replay table image for:', tablefile)
+        clearTables()
+        return False
+    return True
+
+def _saveImage(tablefile, thehash):
+    # Save the recorded configuration calls so the next load need not exec tabledefs
+    try:
+        with open(_imageName(tablefile), 'w') as f:
+            json.dump({'version':TableImageVersion, 'hash':thehash, 'calls':_tableCalls}, f)
+    except:
+        # Read-only file systems just keep executing tabledefs
+        if verbosity: print('Unable to write table image for:', tablefile)
+
+def _readTables(tablefile):
+    # Build the tables from tablefile, preferring its compiled image when up to date
+    global _tablesHash
+    global _tableCalls
+
+    with open(tablefile, 'rb') as f:
+        source = f.read()
+    thehash = _hashSource(source)
+
+    if _loadImage(tablefile, thehash):
+        if verbosity: print('Loaded table image for:', tablefile)
+    else:
+        # Execute tabledefs a line at a time while recording the configuration calls
+        _tableCalls = []
+        namespace = dict(globals())
+        for name in _ConfigFunctions:
+            namespace[name] = _recorder(name)
+        for line in source.decode('utf-8').split('\n'):
+            if verbosity: print('Executing line:', line)
+            exec(line, namespace)
+        _saveImage(tablefile, thehash)
+
+    _tablesHash = thehash
+
 def parsefile(tablefile=None):
     global _parsedFile
     clearTables()
@@ -683,12 +919,7 @@ def parsefile(tablefile=None):
         for path in sys.path:
             if verbosity: print('Looking for tabledefs in:', path)
             try:
-                with open(path + '/tabledefs', 'r') as f:
-                    line = f.readline()
-                    while len(line) > 0:
-                        if verbosity: print('Executing line:', line)
-                        exec(line)
-                        line = f.readline()
+                _readTables(path + '/tabledefs')
                 _parsedFile = path + '/tabledefs'
                 break   # Quit if we successfully found and processed the file
 
@@ -697,13 +928,8 @@ def parsefile(tablefile=None):
     else:
         if verbosity: print('Looking for tabledefs in:', tablefile)
         try:
-            with open(tablefile, 'r') as f:
-                line = f.readline()
-                while len(line) > 0:
-                    if verbosity: print('Executing line:', line)
-                    exec(line)
-                    line = f.readline()
-                _parsedFile = tablefile
+            _readTables(tablefile)
+            _parsedFile = tablefile
 
         except:
             pass
@@ -21,3 +21,6 @@ def ticks_us():
 
 def ticks_diff(now, then):
     return now-then
+
+def ticks_add(ticks, delta):
+    return ticks+delta
@@ -105,16 +105,17 @@ class Chunk:
         return self.size_read
 
     def readinto(self, buffer):
-        BLOCKSIZE = 512 ## a sector of SD card and should work with flash also
+        # Read the whole buffer at once so sector-aligned runs go to the SD card as
+        # multi-block reads instead of one command per 512-byte sector
         size = len(buffer)
         if size > self.chunksize - self.size_read:
             size = self.chunksize - self.size_read
         mv = memoryview(buffer)
         bytes_read = 0
-        for i in range(0, size - BLOCKSIZE, BLOCKSIZE):
-            bytes_read += self.file.readinto(mv[i:i + BLOCKSIZE])
-        if bytes_read < size:
-            bytes_read += self.file.readinto(mv[bytes_read:size])
+        while bytes_read < size:
+            nread = self.file.readinto(mv[bytes_read:size])
+            if not nread: break
+            bytes_read += nread
         self.size_read = self.size_read + bytes_read
         return bytes_read
 
@@ -279,6 +280,10 @@ class Wave_read:
         """Get the sample rate in Hz"""
         return self._framerate
 
+    def getdataoffset(self):
+        """Get the offset of the audio data from the start of the file"""
+        return self._data_chunk.offset
+
     def setpos(self, pos):
         """Seek to a particular position in the audio data"""
         if pos < 0 or pos > self._nframes:
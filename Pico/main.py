@@ -24,6 +24,8 @@ BIN = 7
 
 firstTime = True    # Flag to prevent idle animation running until started
 
+scheduler = helpers.FrameScheduler()    # Latches control frames at their timestamps
+
 verbose=False
                 # Analysis of memory usage severely affects timing data so keep that in mind
 memuse = 0      # 0 = no memory usage stats, 1 = garbage collection count, 2 = debug memuse printing
@@ -39,6 +41,16 @@ led_offboard = machine.Pin(26, machine.Pin.OUT)
 # Pin 27 is the opto-isolated Trigger 2 for external stimuli
 trigger2 = machine.Pin(27, machine.Pin.IN, machine.Pin.PULL_UP)
 trigger2_laststate = True   # True indicates NOT pressed
+trigger2_latched = False    # Set by the interrupt as soon as Trigger 2 is pressed
+
+def trigger2_irq(pin):
+    global trigger2_latched
+    trigger2_latched = True
+
+try:
+    trigger2.irq(trigger=machine.Pin.IRQ_FALLING, handler=trigger2_irq)
+except:
+    pass    # No pin interrupts on the desktop
 
 def opto_button_pressed():
     global trigger2_laststate
@@ -69,13 +81,15 @@ def on_LEDs():
     led_offboard.on()
 
 def do_the_thing(animList, idleanimation=None, randomize=False, continuous=False, skip=False, doOnce=False):
-    global firstTime
+    global firstTime, trigger2_latched
 
     helpers.clearAllDigital()   # All digital channels off
     helpers.releaseAllServos()  # All servos relaxed
 
     # Don't bother with anything if list of animations is empty
     playIndex = 0
+    preloaded = None    # Next animation prepared during the current one in continuous mode
+    idleprepared = None # Idle animation kept loaded and rewound each time it is played
     msecPerBlink = 1000    # We will flash at 0.5Hz if we have animations available and 5 Hz if not
     if len(animList) > 0:
         if randomize: playIndex = random.randint(0, len(animList)-1)
@@ -86,6 +100,7 @@ def do_the_thing(animList, idleanimation=None, randomize=False, continuous=False
     # Swallow strange initially pressed state
     while button_pressed() or opto_button_pressed():
         utime.sleep_ms(100)
+    trigger2_latched = False
 
     # Turn off all our status LEDs so they are always synced
     led_onboard.off()
@@ -97,9 +112,17 @@ def do_the_thing(animList, idleanimation=None, randomize=False, continuous=False
     while True:
         # Toggle LED every second until button pressed
         if not continuous and not skip:
-            while not button_pressed() and not opto_button_pressed():
+            while not button_pressed() and not trigger2_latched and not opto_button_pressed():
                 if idleanimation is not None and not firstTime:
-                    play_one_anim(idleanimation[0], idleanimation[1], idle=True)
+                    # Load the idle animation once and then just rewind it each time round
+                    if idleprepared is None:
+                        idleprepared = prepare_anim(idleanimation[0], idleanimation[1])
+                        if idleprepared is not None: idleprepared.resident = True
+                    else:
+                        idleprepared.rewind()
+                    if idleprepared is not None:
+                        play_one_anim(idleanimation[0], idleanimation[1], idle=True, prepared=idleprepared, relax=False)
+                    if trigger2_latched: break
                 code = 0
                 toggle_LEDs()
                 for i in range(msecPerBlink):
@@ -110,7 +133,7 @@ def do_the_thing(animList, idleanimation=None, randomize=False, continuous=False
                         utime.sleep_ms(1)
                     if button_pressed():
                         break
-                    if opto_button_pressed():
+                    if trigger2_latched or opto_button_pressed():
                         break
                 if code == 1: break
 
@@ -131,12 +154,24 @@ def do_the_thing(animList, idleanimation=None, randomize=False, continuous=False
                     break
             continuous = True
 
+        nextIndex = playIndex
+        if len(animList) > 0:
+            # Pick the animation to follow this one
+            nextIndex = playIndex + 1
+            if nextIndex >= len(animList): nextIndex = 0
+            if randomize: nextIndex = random.randint(0, len(animList)-1)
+
         if playIndex < len(animList):
             firstTime = False
+            trigger2_latched = False
             # Get next animation to play
             if verbose: print('Print playing animation:', playIndex,'named:',animList[playIndex][0])
-            # Play it
-            play_one_anim(animList[playIndex][0], animList[playIndex][1])
+            # Play it, getting the following one ready to go straight on in continuous mode
+            nextanim = animList[nextIndex] if continuous and not doOnce else None
+            preloaded = play_one_anim(animList[playIndex][0], animList[playIndex][1],
+                prepared=preloaded, nextanim=nextanim, relax=(nextanim is None))
+            if nextanim is not None and preloaded is None:
+                helpers.releaseAllServos()
 
         # Revert to normal operations
         skip = False
@@ -155,12 +190,16 @@ def do_the_thing(animList, idleanimation=None, randomize=False, continuous=False
         # Pause here to let opto button be released so it doesn't get caught again
         while opto_button_pressed():
             utime.sleep_ms(10)
+        trigger2_latched = False
 
-        if len(animList) > 0:
-            # Go to next anim in list
-            playIndex += 1
-            if playIndex >= len(animList): playIndex = 0
-            if randomize: playIndex = random.randint(0, len(animList)-1)
+        # Drop the preloaded animation if we are no longer running continuously
+        if preloaded is not None and not continuous:
+            preloaded.close()
+            preloaded = None
+            helpers.releaseAllServos()
+
+        # Go to next anim in list
+        playIndex = nextIndex
 
         if(verbose): print('At end of loop')
 
@@ -172,6 +211,8 @@ class LocalSource:
         self.file = None
         self.binblocksize = binblocksize
         self.readlock = readlock
+        self.slot = 0           # Records are decoded into the one and only slot
+        self.decoder = None
         if self.readlock: self.readlock.acquire()
         if binblocksize > 0:
             self.file = open(filename, 'rb')
@@ -179,8 +220,11 @@ class LocalSource:
             self.file = open(filename, 'r')
         if self.readlock: self.readlock.release()
 
+    def setdecoder(self, decoder):
+        # Decode each record with decoder(slot, record) as it is read
+        self.decoder = decoder
+
     def readline(self, returnblock=None):
-        BLOCKSIZE = 512  # Don't read more than 512 bytes per read
         if self.file is None: return ''
         if self.readlock: self.readlock.acquire()
         if self.binblocksize > 0:
@@ -189,118 +233,369 @@ class LocalSource:
             mv = memoryview(returnblock)
             bytes_read = 0
             n = self.binblocksize
-            for i in range(0, n - BLOCKSIZE, BLOCKSIZE):
-                bytes_read += self.file.readinto(mv[i:i + BLOCKSIZE])
-            if bytes_read < n:
-                bytes_read += self.file.readinto(mv[bytes_read:n])
+            while bytes_read < n:
+                nread = self.file.readinto(mv[bytes_read:min(n, bytes_read + helpers.ControlReadSize)])
+                if not nread: break
+                bytes_read += nread
             if bytes_read == 0:
                 # At end of file
+                if self.readlock: self.readlock.release()
                 return ''
         else:
             returnblock = self.file.readline()
         if self.readlock: self.readlock.release()
+        if self.decoder is not None and len(returnblock) > 0:
+            self.decoder(self.slot, returnblock)
         return returnblock
 
+    def rewind(self):
+        if self.file is not None:
+            if self.readlock: self.readlock.acquire()
+            self.file.seek(0)
+            if self.readlock: self.readlock.release()
+
     def close(self):
         if self.file is not None:
             self.file.close()
             self.file = None
 
 
-def play_one_anim(csvfile, wavefile, idle=False):
-    # Initially assume ascii file format
-    binblocksize = 0
+class FrameDecoder:
+    # Turns control records into frames that are ready to go straight out to the
+    # hardware.  When there is audio, decode() is called on core 1 as the records are
+    # read and core 0 just calls output() when each frame is due.  Every ring slot
+    # has its own frame buffers so the two cores never work on the same ones.
+    def __init__(self, prepared, depth):
+        tables = helpers.tables
+        self.csvformat = prepared.csvformat
+        self.blockSizes = prepared.blockSizes
+        self.pwmlist = prepared.pwmlist
+        self.times = [0] * depth    # Frame time in msec for each slot
+
+        # Work out where each 595 output is in the shift order, last output first
+        self.shiftcount = len(tables._digitalCurrentState) if tables._595Pins is not None else 0
+        self.shiftports = {}    # Digital port to position in shift order
+        self.otherdigital = []  # Digital ports not on the 595s
+        for port in tables.DigitalPortTable:
+            entry = tables.DigitalPortTable[port]
+            if entry.get('func') == tables.do595:
+                self.shiftports[port] = self.shiftcount - 1 - entry['index']
+            else:
+                self.otherdigital.append(port)
+        self.bits = [bytearray(self.shiftcount) for slot in range(depth)]
+
+        # Time spent for stats
+        self.decodeticks = 0
+        self.servoticks = 0
+        self.digitalticks = 0
+
+        if self.csvformat == BIN:
+            # The board blocks are sent straight from the records
+            self.boards = prepared.boardlist
+            self.records = [None] * depth
+        else:
+            self.compilecolumns(prepared.ports, prepared.porttypes)
+            self.blocks = [[bytearray(board.numbytes) for board in self.boards] for slot in range(depth)]
+            self.values = [[0] * len(prepared.porttypes) for slot in range(depth)]
+
+    def compilecolumns(self, ports, porttypes):
+        # Work out once where each CSV column goes so rows can be output in bulk.
+        # Servos on pca9685 boards are put into an on/off block for each board that
+        # goes out in a single jambytes just like the binary format and digital
+        # ports on 595s go into the list of bits to shift out.
+        self.boards = []        # Boards with servos in the file
+        self.columns = []       # Columns with a port assigned
+        self.pcacolumns = []    # (column, bit, board, offset of off value, shift)
+        self.bitcolumns = []    # (column, bit, position in shift order)
+        self.servocolumns = []  # (column, bit, port) for servos not on pca9685s
+        self.digitalcolumns = [] # (column, bit, port) for digital ports not on 595s
+        # A bit of -1 means the column holds a single value rather than compacted ones
+        pwmtable = helpers.tables.PWMPortTable
+
+        def locate(port):
+            # Returns the board, offset of the off value and shift for a pca9685 port
+            entry = pwmtable.get(port)
+            if entry is None or entry.get('func') != helpers.tables.dopca9685: return None
+            if entry['servos'] not in self.boards:
+                self.boards.append(entry['servos'])
+            return (self.boards.index(entry['servos']), entry['pwmout'] * 4 + 2, entry['shift'])
+
+        for i in range(1, len(porttypes)):
+            if porttypes[i] is None: continue
+            self.columns.append(i)
+            if porttypes[i] == PWM:
+                if ports[i] >= 0:
+                    servos = [(-1, ports[i])]
+                else:
+                    # Negative port indicates compacted controls in a single value
+                    servos = [(port * 16, port) for port in range(32)]
+                for bit, port in servos:
+                    where = locate(port)
+                    if where is not None:
+                        self.pcacolumns.append((i, bit) + where)
+                    elif port in pwmtable:
+                        self.servocolumns.append((i, bit, port))
+            else:
+                if ports[i] >= 0:
+                    digitals = [(-1, ports[i])]
+                else:
+                    # Negative port indicates compacted controls in a single value
+                    digitals = [(port, port) for port in helpers.tables.DigitalPortTable]
+                for bit, port in digitals:
+                    if port in self.shiftports:
+                        self.bitcolumns.append((i, bit, self.shiftports[port]))
+                    elif port in helpers.tables.DigitalPortTable:
+                        self.digitalcolumns.append((i, bit, port))
+
+        # Outputs with no column are never written by decode, see seed
+        self.freeoffsets = []   # Offsets in each board block of outputs with no column
+        for board in range(len(self.boards)):
+            used = [offset - 2 for i, bit, b, offset, shift in self.pcacolumns if b == board]
+            self.freeoffsets.append([offset for offset in range(0, self.boards[board].numbytes, 4) if offset not in used])
+        used = [position for i, bit, position in self.bitcolumns]
+        self.freebits = [position for position in range(self.shiftcount) if position not in used]
+
+    def seed(self):
+        # Copy the current state of the outputs that have no column in a CSV file into
+        # every slot so they keep their last values rather than being forced off.  Done
+        # just before playing since the animation may have been prepared well ahead.
+        if self.csvformat == BIN: return
+        state = helpers.tables._digitalCurrentState
+        for bits in self.bits:
+            for position in self.freebits:
+                bits[position] = 1 if state[self.shiftcount - 1 - position] else 0
+        for board in range(len(self.boards)):
+            current = self.boards[board].currentblock()
+            for blocks in self.blocks:
+                for offset in self.freeoffsets[board]:
+                    blocks[board][offset:offset+4] = current[offset:offset+4]
+
+    def decode(self, slot, record):
+        # Decode a control record into the frame buffers for its ring slot
+        ticks = utime.ticks_us()
+        bits = self.bits[slot]
+        if self.csvformat == BIN:
+            self.times[slot] = int.from_bytes(record[0:4], 'little')
+            self.records[slot] = record
+            digital = int.from_bytes(record[self.blockSizes[1]:self.blockSizes[1] + self.blockSizes[2]], 'little')
+            for port in self.shiftports:
+                bits[self.shiftports[port]] = (digital >> port) & 1
+        else:
+            values = record.split(',')
+            self.times[slot] = int(values[0])
+            ivalues = self.values[slot]
+            for i in self.columns:
+                ivalues[i] = int(values[i])
+            blocks = self.blocks[slot]
+            for i, bit, board, offset, shift in self.pcacolumns:
+                value = ivalues[i] if bit < 0 else (ivalues[i] >> bit) & 0xFFFF
+                value = min(value >> shift, 4095)
+                blocks[board][offset] = value & 0xFF
+                blocks[board][offset+1] = value >> 8
+            for i, bit, position in self.bitcolumns:
+                value = ivalues[i] if bit < 0 else (ivalues[i] >> bit) & 1
+                bits[position] = 1 if value else 0
+        self.decodeticks += utime.ticks_diff(utime.ticks_us(), ticks)
+
+    def output(self, slot):
+        # Send a decoded frame out to the hardware
+        ticks = utime.ticks_us()
+        if self.csvformat == BIN:
+            record = self.records[slot]
+            boardstart = self.blockSizes[1] + self.blockSizes[2]
+            for board in self.boards:
+                board.writeblock(record[board.firstport*4+boardstart:board.firstport*4+boardstart+board.numbytes])
+            # Now process all the PWMs on GPIO pins
+            for port in self.pwmlist:
+                addr = port*4 + boardstart
+                helpers.tables.dosomething(port, record[addr+2:addr+4])
+        else:
+            blocks = self.blocks[slot]
+            for board in range(len(self.boards)):
+                self.boards[board].writeblock(blocks[board])
+            ivalues = self.values[slot]
+            for i, bit, port in self.servocolumns:
+                helpers.tables.setPWM(port, ivalues[i] if bit < 0 else (ivalues[i] >> bit) & 0xFFFF)
+        ticks2 = utime.ticks_us()
+        self.servoticks += utime.ticks_diff(ticks2, ticks)
+
+        # Digital ports not on the 595s are set a port at a time
+        if self.csvformat == BIN:
+            if len(self.otherdigital) > 0:
+                helpers.tables.intToDigital(int.from_bytes(record[self.blockSizes[1]:self.blockSizes[1] + self.blockSizes[2]], 'little'))
+        else:
+            for i, bit, port in self.digitalcolumns:
+                helpers.tables.setDigital(port, ivalues[i] if bit < 0 else (ivalues[i] >> bit) & 1)
+        helpers.tables.shift595s(self.bits[slot])
+        helpers.tables.pushMaestros()
+        self.digitalticks += utime.ticks_diff(utime.ticks_us(), ticks2)
+
+
+class PreparedAnim:
+    # An animation with its files open, buffers primed and header decoded ready to play
+    def __init__(self, csvfile, player, source, csvformat, binblocksize):
+        self.csvfile = csvfile
+        self.player = player
+        self.source = source
+        self.csvformat = csvformat
+        self.binblocksize = binblocksize
+        self.resident = False   # Set to keep the files open after playing so it can be rewound
 
-    # Get expected binary file block sizes just in case
-    blockSizes = helpers.tables.getBinarysizes()
+        # Get expected binary file block sizes and the output boards just in case
+        self.blockSizes = helpers.tables.getBinarysizes()
+        self.boardlist = helpers.tables.boardList()
+        self.pwmlist = helpers.tables.pwmList()
 
-    boardlist = helpers.tables.boardList()
-    if verbose:
-        for board in boardlist:
-            print('Board ID:', board.pca9685.address, 'First port:', board.firstport, 'First byte:', board.firstport+blockSizes[1]+blockSizes[2])
+        # Decode the header of CSV files to get ports
+        self.ports = None
+        self.porttypes = None
+        if self.source is not None and self.csvformat == CSV:
+            # Read the first line to get ports
+            hdr = self.source.readline()
+            if verbose: print('Processing header:', hdr)
+            titles = hdr.split(',')
+            self.ports = [None]      # No port for frame column
+            self.porttypes = [None]  # List of port types
+            for i in range(1,len(titles)):
+                self.ports.append(None)
+                self.porttypes.append(None)
+                indicator = titles[i][0]
+                self.ports[i] = int(titles[i][1:])
+                # Skip all channels with port number < 0 meaning unassigned
+                if indicator == 'D':
+                    self.porttypes[i] = DIGITAL
+                elif indicator == 'S':
+                    self.porttypes[i] = PWM
+
+        # Have the records decoded as they are read, on core 1 if there is audio
+        self.decoder = None
+        if self.source is not None:
+            self.decoder = FrameDecoder(self, self.player.queuesize if self.source == self.player else 1)
+            self.source.setdecoder(self.decoder.decode)
+
+    def rewind(self):
+        # Get ready to play again from the top without reopening anything
+        if self.source is not None:
+            self.source.setdecoder(None)
+        if self.player is not None:
+            self.player.rewind()
+        elif self.source is not None:
+            self.source.rewind()
+        if self.source is not None:
+            if self.csvformat == CSV:
+                self.source.readline()  # Skip the header already decoded
+            self.source.setdecoder(self.decoder.decode)
 
-    # Get the list of PWMs on GPIO pins
-    pwmlist = helpers.tables.pwmList()
-    if verbose:
-        for port in pwmlist:
-            print('PWM Port:', port, 'is on a GPIO pin')
+    def close(self):
+        # Close the files
+        if self.player is not None:
+            self.player.closefiles()
+        elif self.source is not None:
+            self.source.close()
 
-    # Sample the control file to see what format it is in
-    try:
-        with open(csvfile, 'rb') as source:
-            testbyte = source.read(1)
-            if testbyte == b'T':
-                # Ascii CSV file
-                csvformat = CSV
-                pass
-            elif testbyte == b'0':
-                # ASCII hex-encoded file
-                csvformat = HEX
-                print('Whoops - HEX format no longer supported!!')
-                pass
-            elif testbyte == b'\x00':
-                # Binary encoded file
-                csvformat = BIN
-                binblocksize = blockSizes[0]
-                pass
-            else:
-                # bad
-                if verbose: print('Whoops - Unrecognized control file format:', csvfile)
-                return
-    except:
-        if verbose: print('Whoops - Unable to open and read control file:', csvfile)
-        # Continue on for case of csvfile is None
-        csvfile = None
+
+def prepare_anim(csvfile, wavefile):
+    # Opens an animation's files and primes its buffers ready to play
+    # Returns a PreparedAnim or None if the control file is unusable
+    csvformat = CSV
+    binblocksize = 0
+    blockSizes = helpers.tables.getBinarysizes()
+
+    # Cataloged animations already say what format they are in
+    entry = helpers.catalogEntry(csvfile)
+    if entry is None:
+        # Sample the control file to see what format it is in
+        try:
+            with open(csvfile, 'rb') as source:
+                testbyte = source.read(1)
+                if testbyte == b'T':
+                    # Ascii CSV file
+                    csvformat = CSV
+                    pass
+                elif testbyte == b'0':
+                    # ASCII hex-encoded file
+                    csvformat = HEX
+                    print('Whoops - HEX format no longer supported!!')
+                    pass
+                elif testbyte == b'\x00':
+                    # Binary encoded file
+                    csvformat = BIN
+                    binblocksize = blockSizes[0]
+                    pass
+                else:
+                    # bad
+                    if verbose: print('Whoops - Unrecognized control file format:', csvfile)
+                    return None
+        except:
+            if verbose: print('Whoops - Unable to open and read control file:', csvfile)
+            # Continue on for case of csvfile is None
+            csvfile = None
+    elif entry.get('format') == 'bin':
+        if entry.get('blocksize', blockSizes[0]) != blockSizes[0]:
+            if verbose: print('Whoops - Control file does not match tables:', csvfile)
+            return None
+        csvformat = BIN
+        binblocksize = blockSizes[0]
+    else:
+        csvformat = CSV
 
     # Create the player
     player = None   # Set player to None so later we know if it exists
-    if helpers.isfile(wavefile):
+    if (entry is not None and entry.get('audio') == wavefile) or helpers.isfile(wavefile):
         player = helpers.WavePlayer(wavefile, csvfilename=csvfile, binblocksize=binblocksize, verbose=(0 if not verbose else 1))
+        if player.file is None: player = None   # Audio file is missing after all
 
 
     # Open the default CSV file if there is no player
     source = None
-    if helpers.isfile(csvfile):
+    if entry is not None or helpers.isfile(csvfile):
         if player is None:
-            source = LocalSource(csvfile, binblocksize)
-        else:
+            try:
+                source = LocalSource(csvfile, binblocksize)
+            except:
+                if verbose: print('Whoops - Unable to open control file:', csvfile)
+        elif player.csvfile is not None:
             source = player
 
+    return PreparedAnim(csvfile, player, source, csvformat, binblocksize)
+
+def play_one_anim(csvfile, wavefile, idle=False, prepared=None, nextanim=None, relax=True):
+    # Plays one animation, from its PreparedAnim if given
+    # If nextanim is given, it is prepared once this one's audio has all been read and
+    # returned.  Servos are left where they are at the end if relax is False.
+    # Open the files and fill the buffers unless that was done ahead of time
+    if prepared is None:
+        prepared = prepare_anim(csvfile, wavefile)
+        if prepared is None: return None
+    csvfile = prepared.csvfile
+    player = prepared.player
+    source = prepared.source
+    csvformat = prepared.csvformat
+    blockSizes = prepared.blockSizes
+    boardlist = prepared.boardlist
+    pwmlist = prepared.pwmlist
+    decoder = prepared.decoder
+    interrupted = False
+
+    if verbose:
+        for board in boardlist:
+            print('Board ID:', board.pca9685.address, 'First port:', board.firstport, 'First byte:', board.firstport+blockSizes[1]+blockSizes[2])
+
+    # Get the list of PWMs on GPIO pins
+    if verbose:
+        for port in pwmlist:
+            print('PWM Port:', port, 'is on a GPIO pin')
+
     if source is not None:
         if verbose: print('Playing animation file:', csvfile)
-        if csvformat == CSV:
-            # Read the first line to get ports
-            hdr = source.readline()
-            if verbose: print('Processing header:', hdr)
-            titles = hdr.split(',')
-            ports = [None]      # No port for frame column
-            porttypes = [None]  # List of port types
-            for i in range(1,len(titles)):
-                ports.append(None)
-                porttypes.append(None)
-                indicator = titles[i][0]
-                ports[i] = int(titles[i][1:])
-                # Skip all channels with port number < 0 meaning unassigned
-                if indicator == 'D':
-                    porttypes[i] = DIGITAL
-                elif indicator == 'S':
-                    porttypes[i] = PWM
-        elif csvformat == BIN:
-            # Get information from tables
-            pass
 
 
     # Initialize stats for optional display
     setTicks = 0
-    digTicks = 0
-    servoTicks = 0
     servoCount = 0
     lockTicks = 0
     skips = 0
     readTicks = 0
-    splitTicks = 0
-    dataTicks = 0
-    servodataTicks = 0
     buttonTicks = 0
     garbageTicks = 0
     LEDTicks = 0
@@ -316,32 +611,26 @@ def play_one_anim(csvfile, wavefile, idle=False):
     if memuse > 0:
         memused = gc.mem_alloc()
 
+    # Outputs the control file does not set keep their current values
+    if decoder is not None: decoder.seed()
+
     # Start the audio playing whether there is a CSV file or not
     if verbose: print('Playing file:', wavefile)
     if player is not None: player.play()
 
     if source:
-        # Get the current time
-        startTicks = utime.ticks_ms()
+        # Start the frame clock, locked to the audio if there is any
+        scheduler.start(clock=(player.clockus if player is not None else None))
+        helpers.trace.start()
 
         # Gather waittime stats
         waitTime = 0
 
-        # Get first line of real data
-        if csvformat == CSV:
-            line = source.readline()
-        elif csvformat == BIN:
-            line = source.readline()
-
-        # Run animatronics until done or button is pressed
-        # Parse the line
-        ticks1 = utime.ticks_us()
-        if csvformat == CSV:
-            values = line.split(',')   # Initial split
-            nextTicks = int(values[0])
-        elif csvformat == BIN:
-            nextTicks = int.from_bytes(line[0:4], 'little')
-        splitTicks += utime.ticks_diff(utime.ticks_us(), ticks1)
+        # Get first line of real data, already decoded into its slot
+        nextTicks = 0
+        line = source.readline()
+        if len(line) > 0:
+            nextTicks = decoder.times[source.slot]
 
         collectioncount = 0
         loopTicks = utime.ticks_us()
@@ -350,98 +639,36 @@ def play_one_anim(csvfile, wavefile, idle=False):
             if memuse > 1:
                 print('At loop start, memory use:', gc.mem_alloc())
             cycleTicks = utime.ticks_us()
-            # Wait until it is 20msec before time to go to next state
-            while(utime.ticks_diff(utime.ticks_ms(), startTicks) < nextTicks - 20):
-                utime.sleep_ms(1)
-                waitTime += 1
+            # Wait until exactly time to go to next state
+            lateness = scheduler.wait(nextTicks)
+            frameTicks = nextTicks
+            workTicks = utime.ticks_us()
+            # Snapshot the stats so the trace gets just this frame's share
+            readBase = readTicks
+            servoBase = decoder.servoticks
+            digitalBase = decoder.digitalticks
+            skipBase = skips
             if memuse > 1:
                 print('After loop wait, memory use:', gc.mem_alloc())
 
-            # Send all values in the row to the Pins
-            #if verbose: print('Sending data at time:',utime.ticks_diff(utime.ticks_ms(), startTicks), 'which should be:', nextTicks)
+            # Send the frame, decoded ahead of time, out to the hardware
+            #if verbose: print('Sending data at time:',scheduler.nowms(), 'which should be:', nextTicks)
             ticks1 = utime.ticks_us()
-            if csvformat == BIN:
-                boardstart = blockSizes[1] + blockSizes[2]
-                for board in boardlist:
-                    board.pca9685.jambytes(line[board.firstport*4+boardstart:board.firstport*4+boardstart+board.numbytes])
-                if memuse > 1:
-                    print('After jambytes, memory use:', gc.mem_alloc())
-                # Now process all the PWMs on GPIO pins
-                for port in pwmlist:
-                    addr = port*4 + blockSizes[1] + blockSizes[2]
-                    helpers.tables.dosomething(port, line[addr+2:addr+4])
-                servodataTicks += utime.ticks_diff(utime.ticks_us(), ticks1)
-                if memuse > 1:
-                    print('After servos, memory use:', gc.mem_alloc())
-                bits = int.from_bytes(line[blockSizes[1]:blockSizes[1] + blockSizes[2]], 'little')
-                helpers.tables.intToDigital(bits)
-                if memuse > 1:
-                    print('After intToDigital, memory use:', gc.mem_alloc())
-                helpers.tables.outputDigital()
-                if memuse > 1:
-                    print('After outputDigital, memory use:', gc.mem_alloc())
-                setTicks += utime.ticks_diff(utime.ticks_us(), ticks1)
-                servoCount += 1
-                pass
-            else:
-                for i in range(1,len(titles)):
-                    if porttypes[i] is not None:
-                        if porttypes[i] == DIGITAL:
-                            # Must be a digital channel
-                            #if verbose: print('Channel', ports[i],'is DIGITAL')
-                            if csvformat == CSV:
-                                value = int(values[i])
-                            if ports[i] >= 0:
-                                # Nonnegative ports go directly to that port
-                                ticks2 = utime.ticks_us()
-                                helpers.setDigital(ports[i], value)
-                                dataTicks += utime.ticks_diff(utime.ticks_us(), ticks2)
-                                #if verbose: print('Setting digital port:', ports[i], 'to:', value)
-                            else:
-                                # Negative port indicates compacted controls in a single value
-                                ticks2 = utime.ticks_us()
-                                helpers.tables.intToDigital(value)
-                                dataTicks += utime.ticks_diff(utime.ticks_us(), ticks2)
-                        elif porttypes[i] == PWM:
-                            #if verbose: print('Channel', ports[i],'is PWM')
-                            if ports[i] >= 0:
-                                value = int(values[i])
-                                # Nonnegative ports go directly to that port
-                                ticks2 = utime.ticks_us()
-                                helpers.setServo(ports[i], value, push=False)
-                                servodataTicks += utime.ticks_diff(utime.ticks_us(), ticks2)
-                            else:
-                                # Negative port indicates compacted controls in a single value
-                                ticks2 = utime.ticks_us()
-                                if csvformat == CSV:
-                                    value = int(values[i])
-                                    vals = []
-                                    port = 0
-                                    for port in range(32):
-                                        vals.append(value & 0xFFFF)
-                                        value >>= 16
-                                    helpers.tables.intsToPWM(vals)
-                                servodataTicks += utime.ticks_diff(utime.ticks_us(), ticks2)
-                setTicks += utime.ticks_diff(utime.ticks_us(), ticks1)
-
-                # Make sure all the digital channels are output
-                ticks1 = utime.ticks_us()
-                helpers.outputDigital()
-                digTicks += utime.ticks_us() - ticks1
-
-                # Push out all the servo values as well
-                ticks1 = utime.ticks_us()
-                helpers.pushServos()
-                servoTicks += utime.ticks_us() - ticks1
-                servoCount += 1
+            decoder.output(source.slot)
+            setTicks += utime.ticks_diff(utime.ticks_us(), ticks1)
+            servoCount += 1
+            if memuse > 1:
+                print('After output, memory use:', gc.mem_alloc())
 
             # Check to see if button is pressed and quit if so
             ticks1 = utime.ticks_us()
             if button_pressed():
                 if verbose: print('Caught Stop button')
+                interrupted = True
                 break
-            if idle and opto_button_pressed():
+            if idle and (trigger2_latched or opto_button_pressed()):
                 if verbose: print('Caught Trigger 2 so interrupting idle animation')
+                interrupted = True
                 break
             buttonTicks += utime.ticks_us() - ticks1
 
@@ -450,28 +677,15 @@ def play_one_anim(csvfile, wavefile, idle=False):
             toggle_LEDs()
             LEDTicks += utime.ticks_us() - ticks1
 
-            # Read another line from CSV file
+            # Read another line from the control file
             ticks1 = utime.ticks_us()
-            if csvformat == CSV:
-                line = source.readline()
-            elif csvformat == BIN:
-                line = source.readline(line)
+            line = source.readline(line)
             # If our time is already past the next time, continue reading
             while len(line) > 0:
-                ticks2 = utime.ticks_us()
-                if csvformat == CSV:
-                    values = line.split(',')
-                    nextTicks = int(values[0])
-                    splitTicks += utime.ticks_diff(utime.ticks_us(), ticks2)
-                elif csvformat == BIN:
-                    nextTicks = int.from_bytes(line[0:4], 'little')
-                    splitTicks += utime.ticks_diff(utime.ticks_us(), ticks2)
-                if nextTicks >= utime.ticks_diff(utime.ticks_ms(), startTicks): break
+                nextTicks = decoder.times[source.slot]
+                if nextTicks >= scheduler.nowms(): break
                 skips += 1
-                if csvformat == CSV:
-                    line = source.readline()
-                elif csvformat == BIN:
-                    line = source.readline(line)
+                line = source.readline(line)
             readTicks += utime.ticks_diff(utime.ticks_us(), ticks1)
 
             if memuse > 0:
@@ -488,11 +702,18 @@ def play_one_anim(csvfile, wavefile, idle=False):
             cycleTicks = utime.ticks_diff(utime.ticks_us(), cycleTicks)
             if cycleTicks > maxCycleTicks: maxCycleTicks = cycleTicks
 
+            # Add this frame to the profiling trace
+            helpers.trace.record(frameTicks, lateness, readTicks - readBase,
+                decoder.servoticks - servoBase, decoder.digitalticks - digitalBase,
+                utime.ticks_diff(utime.ticks_us(), workTicks), skips - skipBase)
+
         # Compute how much time it took to perform the entire animation
         loopTime = utime.ticks_diff(utime.ticks_us(), loopTicks)
+        waitTime = scheduler.waitus // 1000
 
         # If source is a local file then close it but not if it is the audio player
-        if source != player: source.close()
+        # or the animation is being kept around to play again
+        if source != player and not prepared.resident: source.close()
 
         if(verbose): print('At end of read file loop')
 
@@ -500,7 +721,7 @@ def play_one_anim(csvfile, wavefile, idle=False):
         if(verbose):
             print('-------------------------------------------------------------------')
             print('General statistics')
-            print('Total time:', utime.ticks_diff(utime.ticks_ms(), startTicks), 'msec')
+            print('Total time:', scheduler.nowms(), 'msec')
             print('Wait time :', waitTime, 'msec')
             print('Duration  :', nextTicks, 'msec')
             print('Wait frac :', waitTime/nextTicks)
@@ -518,20 +739,20 @@ def play_one_anim(csvfile, wavefile, idle=False):
                 print('For an average of', garbageTicks/(servoCount+skips), 'usec per cycle')
             print('    Processing performed for all', servoCount+skips, 'lines in control file:')
             print('Used', readTicks, 'usec to input the line for an average of', readTicks/(servoCount+skips), 'usec per cycle')
-            print('Used', splitTicks, 'usec to split the line for an average of', splitTicks/(servoCount+skips), 'usec per cycle')
+            print('Used', decoder.decodeticks, 'usec to decode the line for an average of', decoder.decodeticks/(servoCount+skips), 'usec per cycle',
+                '(on core 1)' if source == player else '')
             print('Used', buttonTicks, 'usec to read stop button for an average of', buttonTicks/(servoCount+skips),'usec per cycle')
             print('Used', LEDTicks, 'usec to toggle LEDs for an average of', LEDTicks/(servoCount+skips),'usec per cycle')
             print('    Processing performed for', servoCount, 'unskipped lines in control file:')
-            print('Used', setTicks, 'usec to read and interpret control values for an average of', setTicks/servoCount,'usec per cycle')
-            print('Used', dataTicks, 'usec to save the digital data for an average of', dataTicks/servoCount, 'usec per cycle')
-            print('Used', servodataTicks, 'usec to save the servo data for an average of', servodataTicks/servoCount, 'usec per cycle')
-            print('Used', servoTicks, 'usec to push to servos for an average of', servoTicks/servoCount, 'usec per cycle')
-            print('Used', digTicks, 'usec to shift out digital values for an average of', digTicks/servoCount,'usec per cycle')
+            print('Used', setTicks, 'usec to output control values for an average of', setTicks/servoCount,'usec per cycle')
+            print('Used', decoder.servoticks, 'usec to push to servos for an average of', decoder.servoticks/servoCount, 'usec per cycle')
+            print('Used', decoder.digitalticks, 'usec to shift out digital values for an average of', decoder.digitalticks/servoCount,'usec per cycle')
             print('-------------------------------------------------------------------')
             print('Key Timing')
             print('Used', loopTime, 'usec to run', (servoCount), 'processed cycles')
             print('For an average of', (loopTime-waitTime*1000)/(servoCount)/1000,'msec per cycle')
             print('Maximum cycle duration:', maxCycleTicks/1000, 'msec')
+            scheduler.printstats()
 
             #print('Time spent waiting for lock:', lockTicks, 'usec')
             print('-------------------------------------------------------------------')
@@ -541,14 +762,24 @@ def play_one_anim(csvfile, wavefile, idle=False):
     if player is not None:
         while player.playing():
             # If button is pressed, abort playback
-            if button_pressed() or (idle and opto_button_pressed()):
+            if button_pressed() or (idle and (trigger2_latched or opto_button_pressed())):
                 if verbose: print('Caught Stop button')
+                interrupted = True
                 player.stop()
             # Waiting a bit to see if audio is done
             utime.sleep_ms(1)
+        player.join()
+
+    # Get the next animation ready while the last of the audio drains from I2S
+    preloaded = None
+    if nextanim is not None and not interrupted:
+        preloaded = prepare_anim(nextanim[0], nextanim[1])
 
     # Let all the servos relax
-    helpers.releaseAllServos()
+    if relax:
+        helpers.releaseAllServos()
+
+    return preloaded
 
 
 def main():
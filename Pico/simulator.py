@@ -0,0 +1,665 @@
+#!/usr/bin/env python3
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+#**********************************
+# Program simulator.py
+# Created by john
+# Created Mon Oct 19 09:12:40 AM PDT 2026
+#*********************************/
+'''
+simulator.py runs the Pico playback code (main.py, helpers.py and tables.py) on the
+desktop against virtual hardware so animations can be checked without a controller.
+
+The machine, utime and gc hooks the Pico code uses are replaced before it is imported:
+    Pins feed a model of the 74HC595 chain and any GPIO digital outputs
+    PWM duty cycles on GPIO pins are recorded
+    I2C register writes are decoded as a pca9685 would see them
+    I2S accepts audio at the rate the wave file would drain from the I2S buffer
+    Time is simulated so sleeps, timers and idle cost nothing but advance the clock
+
+Every change on an output port is logged with its simulated time.  The state of all
+the ports just before each following frame is latched is written as a timeline in
+the same layout as the source CSV file and compared against the source values as
+the hardware would quantize them.
+'''
+
+#/* Import block */
+import os
+import sys
+import time
+import heapq
+import shutil
+import struct
+import tempfile
+import importlib
+import threading
+import gc
+
+# Get path to the Pico libraries and put them ahead of the standard ones because
+# helpers.py needs the Pico wave.py rather than the standard library one
+_Path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'lib')
+sys.path.insert(0, _Path)
+import machine
+import utime
+
+#/* Define block */
+verbosity = False
+
+TickCostUsec = 1        # Simulated time used by each ticks_us() call on the main thread
+IdleStepUsec = 1000     # Simulated time machine.idle() waits if nothing is scheduled
+IrqWaitSec = 1.0        # Longest real time to let the audio thread answer an I2S irq
+ShowMismatches = 10     # Number of mismatched cells to list in the report
+
+PCA9685LEDBase = 0x06   # First pca9685 output register
+PCA9685AllLED = 0xFA    # pca9685 ALL_LED registers that set all outputs at once
+PCA9685FullBit = 0x1000 # Full on or full off bit in the upper on/off register
+
+#######################################################################
+# Simulated clock
+class SimClock:
+    def __init__(self):
+        self.now = 0
+        self.events = []
+        self.count = 0
+        self.lock = threading.Lock()
+        self.mainthread = threading.get_ident()
+        self.dispatching = False
+
+    def onmain(self):
+        return threading.get_ident() == self.mainthread
+
+    def schedule(self, when, callback, arg=None):
+        # Run callback(arg) on the main thread once simulated time reaches when
+        with self.lock:
+            self.count += 1
+            heapq.heappush(self.events, (when, self.count, callback, arg))
+
+    def advance(self, usec):
+        # Move simulated time forward, running everything that falls due on the way
+        target = self.now + max(0, usec)
+        while True:
+            with self.lock:
+                if len(self.events) == 0 or self.events[0][0] > target: break
+                when, count, callback, arg = heapq.heappop(self.events)
+            self.now = max(self.now, when)
+            self.dispatching = True
+            try:
+                callback(arg)
+            finally:
+                self.dispatching = False
+        self.now = max(self.now, target)
+
+    def ticks_us(self):
+        # The main thread pays a little simulated time for each look at the clock so
+        # spin loops terminate.  Other threads and callbacks just read it.
+        if self.onmain() and not self.dispatching:
+            self.advance(TickCostUsec)
+        return self.now
+
+    def ticks_ms(self):
+        return self.ticks_us() // 1000
+
+    def sleep_us(self, usec):
+        if self.onmain() and not self.dispatching:
+            self.advance(usec)
+        time.sleep(0)   # Let the audio thread have a go
+
+    def sleep_ms(self, msec):
+        self.sleep_us(msec * 1000)
+
+    def idle(self):
+        # Wait for the next thing to happen
+        with self.lock:
+            if len(self.events) > 0:
+                step = self.events[0][0] - self.now
+            else:
+                step = IdleStepUsec
+        self.sleep_us(step)
+
+clock = SimClock()
+
+#######################################################################
+# Virtual hardware shared by all the virtual peripherals
+class VirtualHardware:
+    def __init__(self):
+        self.pins = {}          # Pin number to current level
+        self.pinmodes = {}      # Pin number to mode
+        self.irqs = {}          # Pin number to (trigger, handler, pin object)
+        self.pwmpins = {}       # Pin number to (PWM port, shift)
+        self.pcaports = {}      # (I2C address, output) to (PWM port, shift)
+        self.digitalpins = {}   # Pin number to digital port
+        self.shiftports = {}    # 595 output index to digital port
+        self.datapin = None
+        self.shiftpin = None
+        self.latchpin = None
+        self.clearpin = None
+        self.shiftreg = []
+        self.registers = {}     # I2C address to pca9685 register image
+        self.state = {}         # ('D' or 'S', port) to current output value
+        self.events = []        # (usec, 'D' or 'S', port, value) for every output change
+        self.player = None      # WavePlayer currently playing
+        self.i2s = None
+
+        # Traffic counters
+        self.i2cwrites = 0
+        self.i2cbytes = 0
+        self.uartbytes = 0
+        self.pinchanges = 0
+        self.latches = 0
+        self.audiobytes = 0
+        self.underruns = 0
+        self.underrunus = 0
+
+    def mapports(self, tables):
+        # Find out from the port tables which output drives which port
+        for port in tables.PWMPortTable:
+            entry = tables.PWMPortTable[port]
+            if entry.get('func') == tables.dopca9685:
+                self.pcaports[(0x40 + entry['board'], entry['pwmout'])] = (port, entry['shift'])
+            elif entry.get('func') == tables.dogpio:
+                self.pwmpins[entry['pin']] = (port, entry['shift'])
+        for port in tables.DigitalPortTable:
+            entry = tables.DigitalPortTable[port]
+            if entry.get('func') == tables.do595:
+                self.shiftports[entry['index']] = port
+            elif entry.get('func') == tables.dogpiodigital:
+                self.digitalpins[entry['pin']] = port
+        if tables._595Pins is not None:
+            self.datapin = tables._DataPin
+            self.shiftpin = tables._ClockPin
+            self.latchpin = tables._RclkPin
+            self.clearpin = tables._ClearPin
+            self.shiftreg = [0] * len(tables._digitalCurrentState)
+
+    def modelled(self, kind, port):
+        # True if the simulator can see the output for a port
+        if kind == 'D':
+            return port < 0 or port in self.shiftports.values() or port in self.digitalpins.values()
+        return port >= 0 and (port in [p for p, s in self.pcaports.values()] or
+                              port in [p for p, s in self.pwmpins.values()])
+
+    def shift(self, port):
+        for p, s in list(self.pcaports.values()) + list(self.pwmpins.values()):
+            if p == port: return s
+        return 0
+
+    def output(self, kind, port, value):
+        if self.state.get((kind, port), 0) != value or (kind, port) not in self.state:
+            self.state[(kind, port)] = value
+            self.events.append((clock.now, kind, port, value))
+
+    def setpin(self, pin, value):
+        old = self.pins.get(pin, 0)
+        self.pins[pin] = value
+        if old == value: return
+        self.pinchanges += 1
+
+        if pin == self.shiftpin and value:
+            # Rising shift clock moves the data pin into the 595 chain
+            self.shiftreg.insert(0, self.pins.get(self.datapin, 0))
+            self.shiftreg.pop()
+        elif pin == self.latchpin and value:
+            # Rising latch clock copies the chain to the outputs
+            self.latches += 1
+            for index in self.shiftports:
+                if index < len(self.shiftreg):
+                    self.output('D', self.shiftports[index], self.shiftreg[index])
+        elif pin == self.clearpin and not value:
+            self.shiftreg = [0] * len(self.shiftreg)
+        elif pin in self.digitalpins:
+            self.output('D', self.digitalpins[pin], value)
+
+        if pin in self.irqs:
+            trigger, handler, pinobj = self.irqs[pin]
+            if (value and trigger & VirtualPin.IRQ_RISING) or (not value and trigger & VirtualPin.IRQ_FALLING):
+                handler(pinobj)
+
+    def setduty(self, pin, duty):
+        if pin in self.pwmpins:
+            port, shift = self.pwmpins[pin]
+            self.output('S', port, duty << shift)
+
+    def writeregs(self, address, reg, data):
+        # Registers auto-increment as a pca9685 does once set up by freq()
+        regs = self.registers.setdefault(address, bytearray(256))
+        self.i2cwrites += 1
+        self.i2cbytes += len(data) + 2      # Address and register bytes too
+        end = min(256, reg + len(data))
+        regs[reg:end] = bytes(data[:end - reg])
+
+        if reg < PCA9685AllLED + 4 and end > PCA9685AllLED:
+            # ALL_LED writes land on every output
+            for channel in range(16):
+                first = PCA9685LEDBase + 4 * channel
+                regs[first:first + 4] = regs[PCA9685AllLED:PCA9685AllLED + 4]
+                self.pcaoutput(address, channel)
+        for channel in range(16):
+            first = PCA9685LEDBase + 4 * channel
+            if reg < first + 4 and end > first:
+                self.pcaoutput(address, channel)
+
+    def readregs(self, address, reg, count):
+        regs = self.registers.setdefault(address, bytearray(256))
+        return bytes(regs[reg:reg + count])
+
+    def pcaoutput(self, address, channel):
+        # Work out the duty cycle a pca9685 output now has
+        if (address, channel) not in self.pcaports: return
+        on, off = struct.unpack_from('<HH', self.registers[address], PCA9685LEDBase + 4 * channel)
+        if off & PCA9685FullBit:
+            duty = 0
+        elif on & PCA9685FullBit:
+            duty = 4095
+        else:
+            duty = (off - on) & 0xFFF
+        port, shift = self.pcaports[(address, channel)]
+        self.output('S', port, duty << shift)
+
+hw = VirtualHardware()
+
+#######################################################################
+# Virtual peripherals that stand in for those in the machine library
+class VirtualPin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id, mode=-1, pull=-1, value=None, **kwargs):
+        self.id = int(id)
+        if mode != -1: hw.pinmodes[self.id] = mode
+        if value is not None: self.value(value)
+
+    def value(self, value=None):
+        if value is None:
+            # Inputs are pulled up so buttons read as not pressed
+            return hw.pins.get(self.id, 1 if hw.pinmodes.get(self.id) == VirtualPin.IN else 0)
+        hw.setpin(self.id, 1 if value else 0)
+
+    def __call__(self, value=None):
+        return self.value(value)
+
+    def on(self):
+        hw.setpin(self.id, 1)
+
+    def off(self):
+        hw.setpin(self.id, 0)
+
+    def toggle(self):
+        hw.setpin(self.id, 1 - hw.pins.get(self.id, 0))
+
+    def irq(self, trigger=IRQ_FALLING | IRQ_RISING, handler=None):
+        hw.irqs[self.id] = (trigger, handler, self)
+
+class VirtualPWM:
+    def __init__(self, pin, **kwargs):
+        self.pin = pin.id if isinstance(pin, VirtualPin) else int(pin)
+        self._freq = 0
+        self._duty = 0
+
+    def freq(self, hz=None):
+        if hz is not None: self._freq = hz
+        return self._freq
+
+    def duty_u16(self, duty=None):
+        if duty is not None:
+            self._duty = duty
+            hw.setduty(self.pin, duty)
+        return self._duty
+
+    def deinit(self):
+        pass
+
+class VirtualI2C:
+    def __init__(self, id=0, *, scl=None, sda=None, freq=400000, timeout=50000):
+        self.frequency = freq
+
+    def writeto_mem(self, addr, memaddr, buf, *, addrsize=8):
+        hw.writeregs(addr, memaddr, buf)
+
+    def readfrom_mem(self, addr, memaddr, nbytes, *, addrsize=8):
+        return hw.readregs(addr, memaddr, nbytes)
+
+    def scan(self):
+        return sorted(set([address for address, channel in hw.pcaports]))
+
+class VirtualUART:
+    # Takes the Maestro commands and throws them away as Maestros are not simulated
+    def __init__(self, id=0, baudrate=115200, tx=None, rx=None, **kwargs):
+        pass
+
+    def write(self, buf):
+        hw.uartbytes += len(buf)
+        return len(buf)
+
+class VirtualI2S:
+    TX = 0
+    RX = 1
+    MONO = 0
+    STEREO = 1
+
+    def __init__(self, id, sck=None, ws=None, sd=None, mode=TX, bits=16, format=MONO, rate=44100, ibuf=8192):
+        self.bytespersec = rate * (bits // 8) * (2 if format == VirtualI2S.STEREO else 1)
+        self.ibufus = ibuf * 1000000 // self.bytespersec
+        self.handler = None
+        self.writes = 0
+        self.queuedend = None   # Simulated time when all the audio written so far has played
+        hw.i2s = self
+
+    def irq(self, handler):
+        self.handler = handler
+
+    def write(self, buf):
+        # Never blocks.  The irq comes once the data fits in the internal buffer.
+        size = len(buf)
+        now = clock.now
+        if self.queuedend is None or self.queuedend < now:
+            if self.queuedend is not None:
+                hw.underruns += 1
+                hw.underrunus += now - self.queuedend
+            self.queuedend = now
+        self.queuedend += size * 1000000 // self.bytespersec
+        hw.audiobytes += size
+        self.writes += 1
+        if self.handler is not None:
+            clock.schedule(max(now, self.queuedend - self.ibufus), self._irq)
+        return size
+
+    def _irq(self, arg):
+        writes = self.writes
+        self.handler(self)
+        # Give the audio thread the chance to queue its next block before time moves on
+        deadline = time.monotonic() + IrqWaitSec
+        while self.writes == writes and time.monotonic() < deadline:
+            player = hw.player
+            if player is None or player.stopflag or not player.threadrunning: break
+            time.sleep(0.0001)
+
+    def deinit(self):
+        pass
+
+class VirtualTimer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, **kwargs):
+        self.generation = 0
+        if len(kwargs) > 0: self.init(**kwargs)
+
+    def init(self, mode=PERIODIC, period=-1, callback=None, freq=None):
+        self.deinit()
+        if freq is not None: period = 1000 // freq
+        self.mode = mode
+        self.period = max(1, period) * 1000
+        self.callback = callback
+        clock.schedule(clock.now + self.period, self._fire, self.generation)
+
+    def _fire(self, generation):
+        if generation != self.generation: return    # Cancelled or restarted since
+        if self.mode == VirtualTimer.PERIODIC:
+            clock.schedule(clock.now + self.period, self._fire, generation)
+        if self.callback is not None: self.callback(self)
+
+    def deinit(self):
+        self.generation += 1
+
+def installVirtualHardware():
+    # Swap the virtual hardware into the stub libraries before the Pico code imports them
+    machine.Pin = VirtualPin
+    machine.PWM = VirtualPWM
+    machine.I2C = VirtualI2C
+    machine.I2S = VirtualI2S
+    machine.UART = VirtualUART
+    machine.Timer = VirtualTimer
+    machine.idle = clock.idle
+    utime.ticks_us = clock.ticks_us
+    utime.ticks_ms = clock.ticks_ms
+    utime.sleep_us = clock.sleep_us
+    utime.sleep_ms = clock.sleep_ms
+    # tables.py and servo.py use the MicroPython time module names directly
+    time.ticks_us = clock.ticks_us
+    time.ticks_diff = utime.ticks_diff
+    # MicroPython gc memory figures, roughly those of a Pico running main.py
+    gc.mem_free = lambda: 120000
+    gc.mem_alloc = lambda: 60000
+
+#######################################################################
+# Timeline generation and comparison
+def readSource(csvfile):
+    with open(csvfile, 'r') as f:
+        titles = f.readline().strip().split(',')
+        rows = []
+        for line in f:
+            if len(line.strip()) > 0:
+                rows.append([int(value) for value in line.strip().split(',')])
+    columns = [None]
+    for title in titles[1:]:
+        try:
+            columns.append((title[0], int(title[1:])))
+        except:
+            columns.append(None)
+    return titles, columns, rows
+
+def expectedValue(kind, port, value, digitalports):
+    # The value a port should end up with once the hardware has quantized it
+    if kind == 'D':
+        if port < 0:
+            mask = 0
+            for p in digitalports: mask |= 1 << p
+            return value & mask
+        return 1 if value > 0 else 0
+    shift = hw.shift(port)
+    return (value >> shift) << shift
+
+def sampledValue(kind, port, state, digitalports):
+    if kind == 'D' and port < 0:
+        value = 0
+        for p in digitalports:
+            if state.get(('D', p), 0): value |= 1 << p
+        return value
+    return state.get((kind, port), 0)
+
+def buildTimeline(columns, rows, latches, endus):
+    # Sample every output just before the next frame is latched
+    digitalports = sorted(set(list(hw.shiftports.values()) + list(hw.digitalpins.values())))
+    rowbytime = {}
+    for row in rows:
+        if row[0] not in rowbytime: rowbytime[row[0]] = row
+
+    timeline = []
+    mismatches = []
+    compared = 0
+    state = {}
+    e = 0
+    for j in range(len(latches)):
+        framems, latchus = latches[j]
+        sampleus = (latches[j+1][1] if j + 1 < len(latches) else endus) - 1
+        while e < len(hw.events) and hw.events[e][0] <= sampleus:
+            usec, kind, port, value = hw.events[e]
+            state[(kind, port)] = value
+            e += 1
+        source = rowbytime.get(framems)
+        if source is None: continue
+        result = [framems]
+        for i in range(1, len(columns)):
+            if columns[i] is None or not hw.modelled(*columns[i]) or i >= len(source):
+                # Not something we can see so pass the source value through
+                result.append(source[i] if i < len(source) else 0)
+                continue
+            kind, port = columns[i]
+            got = sampledValue(kind, port, state, digitalports)
+            expected = expectedValue(kind, port, source[i], digitalports)
+            compared += 1
+            if got != expected: mismatches.append((framems, i, expected, got))
+            result.append(got)
+        timeline.append(result)
+    return timeline, mismatches, compared
+
+#/* Usage method */
+def print_usage(name):
+    """ Simple method to output usage when needed """
+    sys.stderr.write("\nUsage: %s [-/-h/-help] [-v/-verbose] [-t/-tabledefs file] -c/-control file.csv\n" % name);
+    sys.stderr.write("       [-w/-wave file.wav] [-b/-binary] [-o/-output timeline.csv] [-e/-events events.csv]\n");
+    sys.stderr.write("Plays an animation through main.py on simulated Pico hardware and checks\n");
+    sys.stderr.write("that the outputs follow the control file.  Maestro outputs are not simulated.\n");
+    sys.stderr.write("-/-h/-help            :show this information\n");
+    sys.stderr.write("-v/-verbose           :run more verbosely (main.py statistics too)\n");
+    sys.stderr.write("-t/-tabledefs file    :tabledefs file describing the controller (default lib/tabledefs)\n");
+    sys.stderr.write("-c/-control file.csv  :CSV control file to play\n");
+    sys.stderr.write("-w/-wave file.wav     :audio file to play with it\n");
+    sys.stderr.write("-b/-binary            :convert the control file to binary and play that\n");
+    sys.stderr.write("-o/-output file.csv   :write the simulated outputs in the control file layout\n");
+    sys.stderr.write("-e/-events file.csv   :write every output change with its time in usec\n");
+    sys.stderr.write("\n\n");
+
+#/* Main */
+def main():
+    global verbosity
+
+    tablefile = None
+    csvfile = None
+    wavefile = None
+    binary = False
+    outfile = None
+    eventfile = None
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == '-' or sys.argv[i] == '-h' or sys.argv[i] == '-help':
+            print_usage(sys.argv[0]);
+            sys.exit(0);
+        elif sys.argv[i] == '-v' or sys.argv[i] == '-verbose':
+            verbosity = True
+        elif sys.argv[i] == '-t' or sys.argv[i] == '-tabledefs':
+            i += 1
+            if i < len(sys.argv):
+                tablefile = sys.argv[i]
+        elif sys.argv[i] == '-c' or sys.argv[i] == '-control':
+            i += 1
+            if i < len(sys.argv):
+                csvfile = sys.argv[i]
+        elif sys.argv[i] == '-w' or sys.argv[i] == '-wave':
+            i += 1
+            if i < len(sys.argv):
+                wavefile = sys.argv[i]
+        elif sys.argv[i] == '-b' or sys.argv[i] == '-binary':
+            binary = True
+        elif sys.argv[i] == '-o' or sys.argv[i] == '-output':
+            i += 1
+            if i < len(sys.argv):
+                outfile = sys.argv[i]
+        elif sys.argv[i] == '-e' or sys.argv[i] == '-events':
+            i += 1
+            if i < len(sys.argv):
+                eventfile = sys.argv[i]
+        else:
+            sys.stderr.write("\nWhoops - Unrecognized argument: %s\n" % sys.argv[i]);
+            print_usage(sys.argv[0]);
+            sys.exit(10);
+
+        i += 1
+
+    if csvfile is None:
+        sys.stderr.write("\nWhoops - A control file must be specified\n");
+        print_usage(sys.argv[0]);
+        sys.exit(10);
+
+    # The Pico code must only ever see the virtual hardware
+    installVirtualHardware()
+    import tables
+    import helpers
+
+    # Work on copies so tables images and binary files stay out of the source tree
+    workdir = tempfile.mkdtemp()
+    try:
+        if tablefile is not None:
+            shutil.copy(tablefile, os.path.join(workdir, 'tabledefs'))
+            if tables.parsefile(os.path.join(workdir, 'tabledefs')):
+                sys.exit(11)
+        elif tables._parseStatus:
+            sys.exit(11)
+        hw.mapports(tables)
+
+        control = os.path.join(workdir, os.path.basename(csvfile))
+        shutil.copy(csvfile, control)
+        if binary:
+            control = tables.csvToBin(control)
+            if control is None:
+                sys.stderr.write("\nWhoops - Unable to convert control file to binary\n");
+                sys.exit(12);
+
+        firmware = importlib.import_module('main')
+        firmware.verbose = verbosity
+
+        # Note when each frame is latched and when the servos are released
+        latches = []
+        wait = firmware.scheduler.wait
+        def latchframe(framems):
+            lateness = wait(framems)
+            latches.append((framems, clock.now))
+            return lateness
+        firmware.scheduler.wait = latchframe
+
+        released = []
+        release = helpers.releaseAllServos
+        def releaseservos():
+            released.append(clock.now)
+            release()
+        helpers.releaseAllServos = releaseservos
+
+        play = helpers.WavePlayer.play
+        def playaudio(player):
+            hw.player = player
+            if hw.i2s is not None: hw.i2s.queuedend = None
+            play(player)
+        helpers.WavePlayer.play = playaudio
+
+        # Play it
+        startus = clock.now
+        realstart = time.monotonic()
+        firmware.play_one_anim(control, wavefile)
+        endus = released[0] if len(released) > 0 else clock.now
+
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # Compare what came out with what went in
+    titles, columns, rows = readSource(csvfile)
+    timeline, mismatches, compared = buildTimeline(columns, rows, latches, endus)
+
+    if outfile is not None:
+        with open(outfile, 'w') as f:
+            f.write(','.join(titles) + '\n')
+            for row in timeline:
+                f.write(','.join([str(value) for value in row]) + '\n')
+
+    if eventfile is not None:
+        with open(eventfile, 'w') as f:
+            f.write('Usec,Type,Port,Value\n')
+            for usec, kind, port, value in hw.events:
+                f.write('%d,%s,%d,%d\n' % (usec - startus, kind, port, value))
+
+    print('-------------------------------------------------------------------')
+    print('Simulated', (clock.now - startus) / 1000000, 'sec in', round(time.monotonic() - realstart, 2), 'sec')
+    print('Frames in control file:', len(rows), ' Latched:', len(latches), ' Skipped:', len(rows) - len(latches))
+    print('Port values compared:', compared, ' Mismatched:', len(mismatches))
+    for framems, i, expected, got in mismatches[:ShowMismatches]:
+        print('    At', framems, 'msec', titles[i], 'expected', expected, 'but was', got)
+    firmware.scheduler.printstats()
+    if len(latches) > 0:
+        print('I2C writes:', hw.i2cwrites, ' Bytes:', hw.i2cbytes, ' Per frame:', hw.i2cbytes // len(latches))
+        print('Pin changes:', hw.pinchanges, ' 595 latches:', hw.latches, ' Per frame:', hw.pinchanges // len(latches))
+        if hw.uartbytes > 0:
+            print('Maestro UART bytes (not simulated):', hw.uartbytes, ' Per frame:', hw.uartbytes // len(latches))
+    if hw.i2s is not None:
+        print('Audio played:', hw.audiobytes / hw.i2s.bytespersec, 'sec  Underruns:', hw.underruns, ' Total gap:', hw.underrunus, 'usec')
+    print('-------------------------------------------------------------------')
+
+    # Do not hang around for any leftover audio thread
+    sys.stdout.flush()
+    os._exit(1 if len(mismatches) > 0 or len(latches) < len(rows) else 0)
+
+if __name__ == "__main__":
+    main()
@@ -43,19 +43,30 @@ import AnimClasses
 
 #/* Define block */
 verbosity = False
+FrameTime = 0.02        # Seconds between animation frames
+InputPollTime = 0.01    # Seconds between sweeps of the Maestro inputs and key presses
+DriftSmoothing = 0.1    # Weight of each new audio position in the smoothed drift
+SlewThreshold = 0.005   # Slew the frame clock toward the audio when drift exceeds this
+SlewStep = 0.002        # Largest correction in seconds applied per frame
 
 animPlayer = None
 animList = None
-commdev = None
+commdevs = []           # FIFO and socket connections to Hauntimator and other clients
 printer = None
+head = True
+pendingEvents = []      # Events from the Maestro inputs and FIFO waiting to be handled
 
 # This is a simple class that will help us print to the screen.
 # It has nothing to do with the joysticks, just outputting the
-# information.
+# information.  Without a screen, the text is logged to stdout
+# only when it changes.
 class TextPrint:
     def __init__(self, screen=None):
-        self.font = pygame.font.Font(None, 25)
+        self.font = None
+        if screen is not None: self.font = pygame.font.Font(None, 25)
         self.screen = screen
+        self.lines = []
+        self.lastLines = []
         self.reset()
 
     def tprint(self, text):
@@ -63,6 +74,8 @@ class TextPrint:
             text_bitmap = self.font.render(text, True, (0, 0, 0))
             self.screen.blit(text_bitmap, (self.x, self.y))
             self.y += self.line_height
+        else:
+            self.lines.append(text)
 
     def reset(self):
         self.x = 10
@@ -81,6 +94,11 @@ class TextPrint:
         if self.screen is not None:
             pygame.display.flip()
             self.reset()
+        else:
+            if self.lines != self.lastLines:
+                print(' '.join([line for line in self.lines if len(line) > 0]))
+                self.lastLines = self.lines
+            self.lines = []
 
 
 class AnimPlayer():
@@ -95,6 +113,11 @@ class AnimPlayer():
         self.mode = AnimPlayer.StopMode
         self.digitalMap = {}
         self.pwmMap = {}
+        self.times = None
+        self.frames = None
+        self.frame = 0
+        self.lastFrame = None
+        self.drift = 0.0
 
     def setAnimation(self, animation):
         self.currAudio = None
@@ -104,18 +127,39 @@ class AnimPlayer():
         self.currAnim = None
         self.digitalMap = {}
         self.pwmMap = {}
+        self.times = None
+        self.frames = None
+        self.frame = 0
+        self.lastFrame = None
+        self.inline = ''
         self.currAnim = animation[0]
         self.currAudio = animation[1]
 
     def play(self, animation=None):
         if animation is not None: self.setAnimation(animation)
         self.mode = AnimPlayer.PlayMode
+        self.drift = 0.0
+        binary = self.currAnim is not None and self.currAnim[-4:] == '.bin'
+        if binary:
+            # Build all the Maestro frames before the audio starts so it is not held up
+            self.frame = 0
+            self.lastFrame = None
+            frames = tables.binToMaestroFrames(self.currAnim)
+            if frames is not None:
+                self.times, self.frames = frames
+            else:
+                print('Whoops - Unable to play binary animation file:', self.currAnim)
         if self.currAudio is not None:
             # Do this before setState(0.0) so player is busy
             # print('Playing audio file:', self.currAudio)
             pygame.mixer.music.load(self.currAudio)
             pygame.mixer.music.play()
-        if self.currAnim is not None:
+        if binary:
+            if self.frames is None:
+                self.stop()
+            else:
+                self.setState(0.0)
+        elif self.currAnim is not None:
             # print('Playing animation file:', self.currAnim)
             if os.path.exists(self.currAnim) and os.path.isfile(self.currAnim):
                 self.currAnimFile = open(self.currAnim, 'r')
@@ -140,6 +184,22 @@ class AnimPlayer():
         self.mode = AnimPlayer.StopMode
         pygame.mixer.music.stop()
 
+    def slewStep(self, animtime):
+        '''
+        Compares animtime with the position of the playing audio and returns the correction,
+        in seconds, to add to the frame clock so the frames follow the audio.  The audio
+        position only moves in mixer buffer sized jumps so the drift is smoothed first and
+        then corrected a little each frame.  Returns 0.0 if no audio is playing.
+        '''
+        if self.mode != AnimPlayer.PlayMode or self.currAudio is None: return 0.0
+        position = pygame.mixer.music.get_pos()
+        if position < 0: return 0.0
+        self.drift += (position / 1000.0 - animtime - self.drift) * DriftSmoothing
+        if abs(self.drift) <= SlewThreshold: return 0.0
+        step = max(-SlewStep, min(SlewStep, self.drift))
+        self.drift -= step
+        return step
+
     def setState(self, animtime):
         if self.mode == AnimPlayer.PlayMode:
             if self.currAnimFile is not None:
@@ -156,15 +216,32 @@ class AnimPlayer():
                         tables.setDigital(self.digitalMap[indx], int(value))
                     elif indx in self.pwmMap:
                         tables.setPWM(self.pwmMap[indx], float(value))
-                # Push out all the values to the Maestro
-                tables.pushPWMs()
+                # Push out all the values to the Maestro as a whole frame
+                tables.pushPWMs(wholeFrame=True)
+
+            elif self.frames is not None:
+                animtime = int(animtime * 1000)     # Convert to milliseconds
+
+                # Same as the CSV file, the first frame later than now is the one sent
+                while self.frame < len(self.times) and self.times[self.frame] <= animtime:
+                    self.frame += 1
+
+                # Frames are prebuilt Maestro commands so just write the new ones
+                if self.frame < len(self.frames) and self.frames[self.frame] is not self.lastFrame:
+                    self.lastFrame = self.frames[self.frame]
+                    tables.sendMaestroFrame(self.lastFrame)
 
             stillrunning = pygame.mixer.music.get_busy() or len(self.inline) > 1
+            stillrunning = stillrunning or (self.frames is not None and self.frame < len(self.frames))
         else:
             stillrunning = False
 
         return not stillrunning
 
+def postEvent(event):
+    # Queue an event for the main loop without needing the pygame display
+    pendingEvents.append(event)
+
 def setServo(channel, value, push=False):
         tables.setPWM(channel, value, push)
 
@@ -183,14 +260,15 @@ def mainEventLoop():
     lastRun = False
     lastTrigger = False
     lastInput = None
+    inputs = {}
 
     def getMain():
         '''
-        Checks input status of specific input, makes sure it is the same as 1 msec ago for debouncing,
-        and returns button state.  Returns False if input has not been configured.
+        Checks input status of specific input, makes sure it is the same as the previous sweep
+        for debouncing, and returns button state.  Returns False if input has not been configured.
         '''
         nonlocal lastMain
-        newMain = tables.getMainInput()
+        newMain = inputs.get('main')
         if newMain is not None:
             retvalue = lastMain
             if newMain != lastMain:
@@ -201,7 +279,7 @@ def mainEventLoop():
 
     def getRun():
         nonlocal lastRun
-        newRun = tables.getRunInput()
+        newRun = inputs.get('run')
         if newRun is not None:
             retvalue = lastRun
             if newRun != lastRun:
@@ -212,7 +290,7 @@ def mainEventLoop():
 
     def getTrigger():
         nonlocal lastTrigger
-        newTrigger = tables.getTriggerInput()
+        newTrigger = inputs.get('trigger')
         if newTrigger is not None:
             retvalue = lastTrigger
             if newTrigger != lastTrigger:
@@ -221,16 +299,61 @@ def mainEventLoop():
         else:
             return False
 
+    def doCommand(inline):
+        '''
+        Carries out a text command from Hauntimator or another client.  Returns False if the
+        command is not recognized.
+        '''
+        #print('Got line:', inline)
+        if len(inline) < 1:
+            return False
+        if inline[0] == 'a':
+            # Trigger one playback
+            trigger = pygame.event.Event(pygame.KEYDOWN, {'key':pygame.K_m})
+            postEvent(trigger)
+            trigger = pygame.event.Event(pygame.KEYUP, {'key':pygame.K_m})
+            postEvent(trigger)
+        elif inline[0] == 'x':
+            # Reset everything
+            trigger = pygame.event.Event(pygame.KEYUP, {'key':pygame.K_r})
+            postEvent(trigger)
+        elif inline[0] == 'd':
+            # Set an individual digital port
+            try:
+                vals = inline.split()
+                channel = int(vals[1]) # - MaxTotalServos # Move down
+                value = int(vals[2])
+                setDigital(channel, value, push=True)
+            except:
+                return False
+        elif inline[0] == 's':
+            # Set an individual servo
+            try:
+                vals = inline.split()
+                channel = int(vals[1])
+                value = int(vals[2])
+                setServo(channel, value, push=True)
+            except:
+                return False
+        else:
+            return False
+        return True
+
     triggerTime = 0.0
     prevTime = 0.0
+    pollTime = 0.0
     startTime = time.monotonic()
-    while True:     # 20 msec outer loop
+    while True:     # FrameTime outer loop
         currTime = time.monotonic() - startTime
-        while currTime < prevTime + 0.02:       # 1.0 msec inner loop
-            for event in pygame.event.get():
+        while currTime < prevTime + FrameTime:  # Wakes for input sweeps, FIFO input, and the frame
+            # Events posted by inputs and the FIFO plus key presses if we have a window
+            events = pendingEvents[:]
+            del pendingEvents[:]
+            if head: events.extend(pygame.event.get())
+            for event in events:
                 if event.type == pygame.QUIT or (event.type == pygame.KEYUP and event.key == pygame.K_q):
                     pygame.quit()
-                    if commdev is not None and commdev.isReady():
+                    for commdev in commdevs:
                         commdev.cleanup()
                     sys.exit(0)
                 elif (event.type == pygame.KEYDOWN and event.key == pygame.K_m):
@@ -263,100 +386,112 @@ def mainEventLoop():
                         animPlayer.stop()
                         if playMode:
                             # Go to next animation and start it
+                            nextAnim = animList.getNextAnim()
+                            animPlayer.play(nextAnim)
+                            # Start the clock once play has built any frames and started the audio
                             startTime = time.monotonic()
                             currTime = time.monotonic() - startTime
                             prevTime = currTime
-                            nextAnim = animList.getNextAnim()
-                            animPlayer.play(nextAnim)
                         else:
                             # Stop the current animation and maybe go to idle animation
                             nextAnim = animList.getIdleAnim()
                             if nextAnim is not None:
                                 idleMode = True
                                 animPlayer.play(nextAnim)
+                                startTime = time.monotonic()
+                                currTime = time.monotonic() - startTime
+                                prevTime = currTime
                         pass
                     elif event.key == pygame.K_t:
                         # Opto-isolated trigger button
                         if not playMode:
                             playMode = True
                             # Go to next animation and start it
-                            startTime = time.monotonic()
-                            currTime = time.monotonic() - startTime
-                            prevTime = currTime
                             nextAnim = animList.getNextAnim(lastInput)
                             lastInput = None
                             animPlayer.play(nextAnim)
+                            # Start the clock once play has built any frames and started the audio
+                            startTime = time.monotonic()
+                            currTime = time.monotonic() - startTime
+                            prevTime = currTime
                         pass
                     else:
                         pass
                 else:
                     pass
 
-            # Now deal with input from Maestro
-            newMain = getMain()
-            if newMain != prevMain:
-                if prevMain:
-                    trigger = pygame.event.Event(pygame.KEYUP, {'key':pygame.K_m})
-                    pygame.event.post(trigger)
-                else:
-                    trigger = pygame.event.Event(pygame.KEYDOWN, {'key':pygame.K_m})
-                    pygame.event.post(trigger)
-                prevMain = newMain
-            if getTrigger():
-                trigger = pygame.event.Event(pygame.KEYUP, {'key':pygame.K_t})
-                pygame.event.post(trigger)
-            for trigger in animList.triggers:
-                if tables.getInput(trigger):
-                    lastInput = trigger
-                    trigger = pygame.event.Event(pygame.KEYUP, {'key':pygame.K_t})
-                    pygame.event.post(trigger)
-                    break
-            if getRun():
-                trigger = pygame.event.Event(pygame.KEYUP, {'key':pygame.K_r})
-                pygame.event.post(trigger)
-
-            # Now deal with fifo input
-            if commdev and commdev.isReady():
-                while commdev.isThereInput():
-                    inline = commdev.readline()
-                    if len(inline) < 2: continue
-                    #print('Got line:', inline)
-                    if inline[0] == 'a':
-                        # Trigger one playback
-                        trigger = pygame.event.Event(pygame.KEYDOWN, {'key':pygame.K_m})
-                        pygame.event.post(trigger)
+            # Now deal with input from Maestro, all read in one sweep when due
+            if currTime >= pollTime or currTime < pollTime - InputPollTime:
+                pollTime = currTime + InputPollTime
+                inputs = tables.pollInputs()
+                newMain = getMain()
+                if newMain != prevMain:
+                    if prevMain:
                         trigger = pygame.event.Event(pygame.KEYUP, {'key':pygame.K_m})
-                        pygame.event.post(trigger)
-                    elif inline[0] == 'x':
-                        # Reset everything
-                        trigger = pygame.event.Event(pygame.KEYUP, {'key':pygame.K_r})
-                        pygame.event.post(trigger)
-                    elif inline[0] == 'd':
-                        # Set an individual digital port
-                        try:
-                            vals = inline.split()
-                            channel = int(vals[1]) # - MaxTotalServos # Move down
-                            value = int(vals[2])
-                            setDigital(channel, value, push=True)
-                        except:
-                            pass
-                    elif inline[0] == 's':
-                        # Set an individual servo
-                        try:
-                            vals = inline.split()
-                            channel = int(vals[1])
-                            value = int(vals[2])
-                            setServo(channel, value, push=True)
-                        except:
-                            pass
-
-            time.sleep(0.001)
+                        postEvent(trigger)
+                    else:
+                        trigger = pygame.event.Event(pygame.KEYDOWN, {'key':pygame.K_m})
+                        postEvent(trigger)
+                    prevMain = newMain
+                if getTrigger():
+                    trigger = pygame.event.Event(pygame.KEYUP, {'key':pygame.K_t})
+                    postEvent(trigger)
+                for trigger in animList.triggers:
+                    if inputs.get(trigger):
+                        lastInput = trigger
+                        trigger = pygame.event.Event(pygame.KEYUP, {'key':pygame.K_t})
+                        postEvent(trigger)
+                        break
+                if getRun():
+                    trigger = pygame.event.Event(pygame.KEYUP, {'key':pygame.K_r})
+                    postEvent(trigger)
+
+            # Now deal with input from the FIFOs and socket clients
+            for commdev in commdevs:
+                if not commdev.isReady(): continue
+                for msgtype, inline in commdev.readMessages():
+                    if msgtype == transcomm.MsgPorts:
+                        # Set a batch of ports and push them all out together
+                        for kind, channel, value in inline:
+                            if kind == transcomm.PortDigital:
+                                setDigital(channel, value)
+                            elif kind == transcomm.PortServo:
+                                setServo(channel, value)
+                        tables.outputDigital()
+                    elif msgtype == transcomm.MsgRequest:
+                        replyto, inline = inline
+                        if doCommand(inline):
+                            commdev.respond(replyto, 'ok')
+                        else:
+                            commdev.respond(replyto, 'unknown')
+                    elif msgtype == transcomm.MsgText:
+                        doCommand(inline)
+
+            # Sleep until the next input sweep or frame, waking early for FIFO or socket input
+            currTime = time.monotonic() - startTime
+            timeout = min(pollTime, prevTime + FrameTime) - currTime
+            if timeout > 0.0:
+                fds = []
+                for commdev in commdevs: fds.extend(commdev.filenos())
+                if len(fds) > 0:
+                    try:
+                        select.select(fds, [], [], timeout)
+                    except:
+                        time.sleep(timeout)
+                else:
+                    time.sleep(timeout)
             currTime = time.monotonic() - startTime
 
-        prevTime = currTime
+        # Keep to a fixed frame tick unless we have fallen more than a frame behind
+        prevTime += FrameTime
+        if currTime - prevTime > FrameTime:
+            prevTime = currTime
 
-        # Process an animation frame
+        # Process an animation frame on the frame clock slewed toward the audio
         if playMode or idleMode:
+            step = animPlayer.slewStep(currTime)
+            startTime -= step
+            currTime += step
             done = animPlayer.setState(currTime)
             if done:
                 # print('Done with animation:', animPlayer.currAnim)
@@ -365,19 +500,21 @@ def mainEventLoop():
                     # start next animation
                     idleMode = False
                     playMode = True
+                    nextAnim = animList.getNextAnim()
+                    animPlayer.play(nextAnim)
+                    # Start the clock once play has built any frames and started the audio
                     startTime = time.monotonic()
                     currTime = time.monotonic() - startTime
                     prevTime = currTime
-                    nextAnim = animList.getNextAnim()
-                    animPlayer.play(nextAnim)
                 elif animList.getIdleAnim() is not None:
                     playMode = False
                     idleMode = True
+                    nextAnim = animList.getIdleAnim()
+                    animPlayer.play(nextAnim)
+                    # Start the clock once play has built any frames and started the audio
                     startTime = time.monotonic()
                     currTime = time.monotonic() - startTime
                     prevTime = currTime
-                    nextAnim = animList.getIdleAnim()
-                    animPlayer.play(nextAnim)
                 else:
                     playMode = False
                     idleMode = False
@@ -403,14 +540,15 @@ def mainEventLoop():
             audiotext = 'Audio:'
             printer.tprint(animtext)
             printer.tprint(audiotext)
-        printer.tprint('')
-        printer.tprint('R:Reset   M:Main   T:Trigger   Q: Quit')
+        if head:
+            printer.tprint('')
+            printer.tprint('R:Reset   M:Main   T:Trigger   Q: Quit')
         printer.flip()
 
 def signal_handler(signum, frame):
     signal.signal(signum, signal.SIG_IGN) # ignore additional signals
     pygame.quit()
-    if commdev is not None: commdev.cleanup()
+    for commdev in commdevs: commdev.cleanup()
     sys.stdout.write('\n')
     sys.stdout.flush()
     sys.exit(0)
@@ -422,7 +560,8 @@ def print_usage(name):
     sys.stderr.write("Enter purpose here.\n");
     sys.stderr.write("-/-h/-help            :show this information\n");
     sys.stderr.write("-v/-verbose           :run more verbosely\n");
-    sys.stderr.write("-nohead               :do not open window or accept key commands\n")
+    sys.stderr.write("-nohead               :run headless with no window or key commands, logging status changes\n")
+    sys.stderr.write("-b/-binary            :play binary (.bin) control files instead of CSV\n")
     sys.stderr.write("-a/-animpath dirpath  :specify path to anims and sd/anims directories\n")
     sys.stderr.write("\n\n");
 
@@ -430,6 +569,7 @@ def print_usage(name):
 if __name__ == "__main__":
     # Initial values
     head = True
+    binary = False
     path = _Dir
 
     i = 1
@@ -441,6 +581,8 @@ if __name__ == "__main__":
             verbosity = True
         elif sys.argv[i] == '-nohead':
             head = False
+        elif sys.argv[i] == '-b' or sys.argv[i] == '-binary':
+            binary = True
         elif sys.argv[i] == '-a' or sys.argv[i] == '-animpath':
             i += 1
             if i < len(sys.argv):
@@ -456,16 +598,19 @@ if __name__ == "__main__":
     # Interrupt handler
     signal.signal(signal.SIGINT, signal_handler)
 
+    # Find the Maestros in the background while everything else starts up
+    tables.startMaestros()
+
     # Animations
     inDir = path
-    animList = AnimClasses.AnimList(inDir=inDir)
+    animList = AnimClasses.AnimList(inDir=inDir, binary=binary)
     if len(animList.theAnims) > 0:
         tablefile = os.path.join(inDir, 'tabledefs')
         if os.path.isfile(tablefile):
             tables.parsefile(tablefile=tablefile)
     else:
         inDir = os.path.join(path, 'sd/anims')
-        animList = AnimClasses.AnimList(inDir=inDir)
+        animList = AnimClasses.AnimList(inDir=inDir, binary=binary)
         if len(animList.theAnims) > 0:
             tablefile = os.path.join(inDir, 'tabledefs')
             if os.path.isfile(tablefile):
@@ -490,29 +635,38 @@ if __name__ == "__main__":
         if verbosity:
             print(anim)
 
-    # Pygame
-    pygame.init()
+    # Pygame, only the mixer when headless
+    display = None
+    if head:
+        pygame.init()
+        pygame.display.set_caption('Maestro_Animator')
+        display = pygame.display.set_mode((maxWidth, 100))
     pygame.mixer.init()
     pygame.mixer.music.set_volume(0.5)
-
-    pygame.display.set_caption('Maestro_Animator')
-    display = None
-    if head: display = pygame.display.set_mode((maxWidth, 100))
     printer = TextPrint(display)
 
     # FIFOs
     try:
         # FIFOs are optional connection to Hauntimator
         # Windows Python does not support them
-        commdev = transcomm.FIFOComm(
+        commdevs.append(transcomm.FIFOComm(
             inputFIFOName = '/tmp/fifo.commtocontrol',
             outputFIFOName = '/tmp/fifo.controltocomm'
-        )
+        ))
     except:
         # Can still play without FIFOs
         pass
 
-    # Maestro
+    # Unix domain socket for any number of clients such as Hauntimator and scripts
+    try:
+        server = transcomm.SocketServerComm(socketName=transcomm.SocketName)
+        if server.listener is not None: commdevs.append(server)
+    except:
+        # Windows Python may not support them either
+        pass
+
+    # Maestro, connected now rather than on the first frame
+    tables.makePControl()
 
     # Start the main loop
     mainEventLoop()
@@ -64,15 +64,22 @@ _Path = os.path.join(_Dir, 'lib')
 sys.path.append(_Path)
 # Now import tables from our extended path
 import tables
+import maestro
 
 import transcomm
 
 # Read port id from local cache file
+# It now holds the Maestro ports found by maestro.discoverPorts so only use an older root
 portRoot = '/dev/ttyACM'    # May be set by Hauntimator prior to comms
 cachefile = os.path.join(_Dir, '.portid')
 if os.path.exists(cachefile):
     with open(cachefile, 'r') as file:
-        portRoot = file.read()
+        content = file.read()
+        if not content.startswith('{'): portRoot = content
+
+# Find the Maestros in the background so openPort does not have to probe.  openPort
+# opens the port itself so it must not also be held open in the connection pool.
+maestro.startDiscovery(openFirst=False)
 
 # Remove path so other code can't accidentally get to it
 sys.path.remove(_Path)
@@ -85,13 +92,35 @@ commdev = transcomm.FIFOComm(
     inputFIFOName = '/tmp/fifo.controltocomm'
 )
 
+# Maestro_Animator also listens on a Unix domain socket that allows more than one client
+sockdev = transcomm.SocketComm(socketName=transcomm.SocketName)
+
+def activeComm():
+    # Use the socket if Maestro_Animator is listening on it, else the FIFOs, else None
+    if sockdev.isReady():
+        return sockdev
+    if commdev.isReady():
+        return commdev
+    return None
+
 ################# Serial Comm Code #########################
 
 def openPort():
     global portRoot
     global controller
 
-    # Try a whole bunch of port options
+    # Open the Maestro found at startup with our own timeout.  Discovery was started
+    # without opening it so the port is free unless the tables are also in use here.
+    device = maestro.getFirstPort()
+    if device is not None:
+        try:
+            ser = serial.Serial(device, 115200, timeout=5)
+            portRoot = device
+            return ser
+        except:
+            if verbosity: print('Whoops - Unable to open Maestro port:', device)
+
+    # Else try a whole bunch of port options
     for suffix in ['', '0', '1', '2', '3', '4', '5', '6', '7', '8', '9']:
         try:
             ser = serial.Serial(portRoot + suffix, 115200, timeout=5)
@@ -115,8 +144,9 @@ def toPico(ser, instring):
 
 def stringToPico(instring):
     if verbosity: print('Sending instring:', instring)
-    if commdev.isReady():
-        commdev.writeline(instring)
+    comm = activeComm()
+    if comm is not None:
+        comm.writeline(instring)
     return
 
 def lineFromPico():
@@ -129,7 +159,7 @@ def lineFromPico():
 
 #################### Status Request Functions #################
 def isReady():
-    if commdev.isReady():
+    if activeComm() is not None:
         return True
     else:
         # Should probably check something here but for now we are assuming
@@ -138,6 +168,7 @@ def isReady():
 
 def cleanup():
     # Pololu uses FIFOs to communicate with Hauntimator so careful cleanup is needed
+    sockdev.cleanup()
     commdev.cleanup()
 
 def getBinarySizes():
@@ -310,9 +341,11 @@ def playOnce():
     stringToPico('a\n')
 
 def setServo(channel, cyclefrac):
-    if commdev.isReady():
-        outstring = 's %d %d\n' % (channel, cyclefrac)
-        stringToPico(outstring)
+    comm = activeComm()
+    if comm is not None:
+        # Batched with any other port updates the connection has not taken yet
+        if verbosity: print('Sending servo:', channel, cyclefrac)
+        comm.writePorts([(transcomm.PortServo, channel, cyclefrac)])
     else:
         setServoValue(channel, cyclefrac, True)
 
@@ -320,9 +353,10 @@ def releaseServo(channel):
     setServo(channel, 0)
 
 def setDigitalChannel(channel, value):
-    if commdev.isReady():
-        outstring = 'd %d %d\n' % (channel, value)
-        stringToPico(outstring)
+    comm = activeComm()
+    if comm is not None:
+        if verbosity: print('Sending digital:', channel, value)
+        comm.writePorts([(transcomm.PortDigital, channel, value)])
     else:
         setDigitalValue(channel, value, True)
 
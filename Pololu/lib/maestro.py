@@ -1,7 +1,10 @@
 import serial
 from serial.tools import list_ports
 
+import os
 import sys
+import json
+import threading
 from sys import version_info
 
 PY2 = version_info[0] == 2   #Running Python 2.x?
@@ -64,6 +67,33 @@ def find_maestro_command_port(vid=POLOLU_VID, pid=None, serial_number=None):
         and (pid is None or p.pid == pid)
         and (serial_number is None or p.serial_number == serial_number)
     ]
+    return _command_port(candidates)
+
+
+def find_maestro_command_ports(vid=POLOLU_VID, pid=None):
+    """
+    Find the Command Ports of all connected Pololu Maestros.
+
+    Args:
+        vid: USB vendor ID to match (default: Pololu's 0x1FFB).
+        pid: USB product ID to match, or None to match any Maestro model.
+
+    Returns:
+        A dictionary of Command Port device strings keyed by board serial
+        number.  Empty if no Maestro was found.
+    """
+    boards = {}
+    for p in list_ports.comports():
+        if p.vid == vid and (pid is None or p.pid == pid):
+            boards.setdefault(p.serial_number, []).append(p)
+    ports = {}
+    for serial_number in boards:
+        ports[serial_number] = _command_port(boards[serial_number])
+    return ports
+
+
+def _command_port(candidates):
+    """Pick the Command Port out of the ports of one Maestro, or None if there are none."""
     if not candidates:
         return None
     if len(candidates) == 1:
@@ -86,6 +116,161 @@ def find_maestro_command_port(vid=POLOLU_VID, pid=None, serial_number=None):
     # 3. macOS (and any other platform lacking the above info): lowest device name.
     return sorted(candidates, key=lambda p: _natural_sort_key(p.device))[0].device
 
+
+#---------------------------
+# Maestro Port Registry
+#---------------------------
+#
+# Maestros are found once, in the background when startDiscovery is called at startup,
+# and their Command Ports are cached by USB serial number in the .portid file.  Open
+# connections are kept in a pool and handed out by getConnection so nothing is probed
+# or opened on the playback path.
+#
+PortCacheFile = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), '.portid')
+DiscoveryWait = 10.0        # Seconds getConnection waits for a background discovery
+
+_Ports = None               # Command Port device by serial number once discovered
+_Connections = {}           # Open serial connections by device
+_Writers = {}               # Writer threads by device for boards split across ports
+_Discovery = None           # Background discovery thread
+_RegistryLock = threading.Lock()
+
+def readPortCache():
+    # Returns the cached Command Ports by serial number.  Older .portid files hold a
+    # port root rather than the cache so they are ignored here.
+    try:
+        with open(PortCacheFile, 'r') as file:
+            cache = json.load(file)
+        if isinstance(cache, dict):
+            return cache
+    except:
+        pass
+    return {}
+
+def writePortCache(ports):
+    try:
+        with open(PortCacheFile, 'w') as file:
+            json.dump(ports, file)
+    except:
+        sys.stderr.write('\nWarning - Could not write Maestro port cache: ' + PortCacheFile + '\n')
+
+def discoverPorts():
+    # Find the Command Ports of all connected Maestros and update the cache
+    # Falls back on cached ports that still exist if none can be found by USB id
+    global _Ports
+    try:
+        ports = find_maestro_command_ports()
+    except:
+        ports = {}
+    if len(ports) > 0:
+        if ports != readPortCache():
+            writePortCache(ports)
+    else:
+        ports = {}
+        cache = readPortCache()
+        for serial_number in cache:
+            if os.path.exists(cache[serial_number]):
+                ports[serial_number] = cache[serial_number]
+    with _RegistryLock:
+        _Ports = ports
+    return ports
+
+def _discoverAndOpen():
+    # Background discovery that also opens the first Maestro ready for the controller
+    ports = discoverPorts()
+    if len(ports) > 0:
+        getConnection(ports[sorted(ports, key=str)[0]])
+
+def startDiscovery(openFirst=True):
+    # Start finding the Maestros in the background, call once at startup.  Set
+    # openFirst to False when the caller opens the ports itself since a Maestro
+    # held open in the pool cannot be opened again on Windows.
+    global _Discovery
+    if _Discovery is None and _Ports is None:
+        _Discovery = threading.Thread(target=_discoverAndOpen if openFirst else discoverPorts, daemon=True)
+        _Discovery.start()
+
+def getPorts():
+    # Returns the Command Ports by serial number, waiting on or running discovery if needed
+    if _Discovery is not None:
+        _Discovery.join(DiscoveryWait)
+    if _Ports is None:
+        discoverPorts()
+    return _Ports
+
+def getFirstPort():
+    # Returns the Command Port device of the first Maestro by serial number, or None
+    ports = getPorts()
+    if ports is None or len(ports) == 0:
+        return None
+    return ports[sorted(ports, key=str)[0]]
+
+def getConnection(device=None):
+    # Returns an open connection to the device, or the first Maestro found if None,
+    # opening it only if the pool does not have it open already
+    if device is None:
+        device = getFirstPort()
+        if device is None:
+            return None
+    with _RegistryLock:
+        usb = _Connections.get(device)
+        try:
+            if usb is None:
+                # Open the command port without timeout and leave it open for normal operations
+                usb = serial.Serial(device, baudrate=115200)
+                _Connections[device] = usb
+            elif not usb.is_open:
+                usb.open()
+        except:
+            return None
+    return usb
+
+def getWriter(usb):
+    # Returns the writer thread for an open connection, starting it if needed
+    with _RegistryLock:
+        writer = _Writers.get(usb.port)
+        if writer is None:
+            writer = PortWriter(usb)
+            _Writers[usb.port] = writer
+    return writer
+
+class PortWriter(threading.Thread):
+    # Writes the bytes queued for one Command Port from a thread of its own so that
+    # Maestros on separate USB ports are all sent their frames at the same time rather
+    # than one after another.  Bytes are written in the order they were queued except
+    # that only the newest whole frame is kept, see queue.
+    def __init__(self, usb):
+        threading.Thread.__init__(self, daemon=True)
+        self.usb = usb
+        self.pending = []           # (wholeFrame, bytes) pairs waiting to be written
+        self.ready = threading.Condition()
+        self.start()
+
+    # Queue bytes to be written and return without waiting for the port.  A whole frame,
+    # which sets every port it has, replaces any whole frame still waiting so a port
+    # that falls behind skips to the newest frame rather than lagging ever further
+    # behind the audio.  Other commands are always written and in order.
+    def queue(self, data, wholeFrame=False):
+        with self.ready:
+            if wholeFrame:
+                self.pending = [item for item in self.pending if not item[0]]
+            self.pending.append((wholeFrame, data))
+            self.ready.notify()
+
+    def run(self):
+        while True:
+            with self.ready:
+                while len(self.pending) == 0:
+                    self.ready.wait()
+                data = b''.join([item[1] for item in self.pending])
+                self.pending = []
+            try:
+                if not self.usb.is_open:
+                    self.usb.open()
+                self.usb.write(data)
+            except:
+                sys.stderr.write('\nWHOOPS - Could not write to Maestro Command Port ' + str(self.usb.port) + '\n')
+
 #
 #---------------------------
 # Maestro Servo Controller
@@ -119,39 +304,90 @@ class Controller:
         self.Mins = [0] * 24
         self.Maxs = [0] * 24
         self.commands = []
-
-        # Find the Pololu Command Port
+        # Runs of neighbouring targets are sent as one Set Multiple Targets command.
+        # Micro Maestros do not have that command so set this False for them.
+        self.multipleTargets = True
+        # Boards given Command Ports of their own by setBoardPort, by board id.  Other
+        # boards are chained off the first Maestro found, or ttyStr, on mainUsb.
+        self.boardPorts = {}
+        self.mainUsb = None
+        self.chainWarned = []
+
+        # Get the Pololu Command Port from the registry, already open if discovery has run
         if ttyStr is None:
-            try:
-                ttyStr = find_maestro_command_port()
-            except:
-                pass
-            if ttyStr is None:
+            usb = getConnection()
+            if usb is None:
                 sys.stderr.write('\nWHOOPS - Could not find Maestro Command Port\n')
                 return
         else:
             # Needs methods to verify also
             sys.stderr.write('\nWarning - Could not verify specified command device:' + ttyStr + ' is a Maestro Command Port\n')
             sys.stderr.write('Using anyway!!!\n')
+            usb = getConnection(ttyStr)
+            if usb is None:
+                sys.stderr.write('\nWHOOPS - Could not open Maestro Command Port ' + ttyStr + '\n')
+                return
 
-        print('Device:', ttyStr)
-        # Open the command port without timeout for normal operations
-        self.usb = serial.Serial(ttyStr, baudrate=115200)
-        self.usb.close()
+        print('Device:', usb.port)
+        self.usb = usb
+        self.mainUsb = usb
 
     # Cleanup by closing USB serial port
     def close(self):
         self.usb.close()
 
-    # Reopen the USB serial port
+    # Reopen the USB serial port if it has been closed
     def open(self):
-        self.usb.open()
+        if not self.usb.is_open:
+            self.usb.open()
 
     # Set the board id for the current device
     def setBoard(self, device):
         if device != self.boardID:
             self.boardID = device
             self.PololuCmd = chr(0xaa) + chr(device)
+            if len(self.boardPorts) > 0:
+                self.usb = self.portFor(device)
+
+    # Send the commands for a board out a Command Port of its own, given by device or
+    # Maestro serial number, rather than along the chain.  Once any board has its own
+    # port all the ports are written by writer threads so they are sent in parallel.
+    def setBoardPort(self, brd, port):
+        ports = getPorts()
+        if ports is not None and port in ports:
+            port = ports[port]
+        usb = getConnection(port)
+        if usb is None:
+            sys.stderr.write('\nWHOOPS - Could not open Maestro Command Port ' + str(port) + ' for board ' + str(brd) + '\n')
+            return False
+        self.boardPorts[brd] = usb
+        if self.mainUsb is None:
+            self.mainUsb = usb
+            self.usb = usb
+        if brd == self.boardID:
+            self.usb = usb
+        return True
+
+    # Returns the connection the commands for a board are sent on
+    # Boards without a port of their own go to mainUsb, the first Maestro by serial number
+    # unless ttyStr was given, so with several USB Maestros every board should be listed.
+    def portFor(self, brd):
+        usb = self.boardPorts.get(brd)
+        if usb is None:
+            usb = self.mainUsb
+            if len(self.boardPorts) > 0 and brd not in self.chainWarned:
+                self.chainWarned.append(brd)
+                sys.stderr.write('\nWarning - Maestro board ' + str(brd) + ' has no port of its own so it is sent along the chain from ' + str(usb.port) + '\n')
+        return usb
+
+    # Write bytes to a connection, through its writer thread if boards are split across ports
+    def writeTo(self, usb, data, wholeFrame=False):
+        if len(self.boardPorts) > 0:
+            getWriter(usb).queue(data, wholeFrame)
+        else:
+            if not usb.is_open:
+                usb.open()
+            usb.write(data)
 
     # Do everything to send a single command to current device
     def sendOneCmd(self, cmd):
@@ -161,8 +397,7 @@ class Controller:
             self.usb.write(cmdStr)
         else:
             # print('Sending:', bytes(cmdStr,'latin-1'))
-            self.usb.write(bytes(cmdStr,'latin-1'))
-        self.close()
+            self.writeTo(self.usb, bytes(cmdStr,'latin-1'))
 
     # Send a Pololu command out the serial port to current device
     def sendCmd(self, cmd):
@@ -171,22 +406,89 @@ class Controller:
             self.usb.write(cmdStr)
         else:
             # print('Sending:', bytes(cmdStr,'latin-1'))
-            self.usb.write(bytes(cmdStr,'latin-1'))
+            self.writeTo(self.usb, bytes(cmdStr,'latin-1'))
 
-    # Send a stream of commands while holding the port open
+    # Send a stream of commands in a single write
     # Defaults to sending the internal command list
-    def sendCmds(self, cmds=None):
+    # Set wholeFrame if the commands set every port of an animation frame so a port
+    # that has fallen behind may skip them in favour of a newer frame
+    def sendCmds(self, cmds=None, wholeFrame=False):
         if cmds is None:
             cmds = self.commands
-        self.open()
-        for brd,cmd in cmds:
-            self.setBoard(brd)
-            cmdStr = self.PololuCmd + cmd
-            # print('Sending from cmd list:', bytes(cmdStr,'latin-1'))
-            self.usb.write(bytes(cmdStr,'latin-1'))
-        self.close()
+        if len(cmds) > 0:
+            # print('Sending from cmd list:', self.packFrame(cmds))
+            self.sendBytes(self.packFrame(cmds), wholeFrame)
+            self.setBoard(cmds[-1][0])
         self.clearCmds()
 
+    # Send bytes that were already packed by packFrame, one write per Command Port
+    def sendBytes(self, cmdBytes, wholeFrame=False):
+        if isinstance(cmdBytes, tuple):
+            for usb,data in cmdBytes:
+                self.writeTo(usb, data, wholeFrame)
+        else:
+            self.writeTo(self.mainUsb, cmdBytes, wholeFrame)
+
+    # Pack a list of (board, command) pairs into the bytes for sendBytes.  When all
+    # the boards are on one port this is just the bytes from packCmds.  Otherwise it
+    # is a tuple of (connection, bytes) pairs, one for each Command Port used.
+    def packFrame(self, cmds):
+        if len(self.boardPorts) == 0:
+            return bytes(self.packCmds(cmds), 'latin-1')
+        ports = []
+        portCmds = {}
+        for brd,cmd in cmds:
+            usb = self.portFor(brd)
+            if usb not in portCmds:
+                ports.append(usb)
+                portCmds[usb] = []
+            portCmds[usb].append((brd, cmd))
+        frame = []
+        for usb in ports:
+            frame.append((usb, bytes(self.packCmds(portCmds[usb]), 'latin-1')))
+        return tuple(frame)
+
+    # Pack a list of (board, command) pairs into one command string.  Set Target
+    # commands in a row for the same board are merged with the last target for a
+    # channel winning and sent by packTargets.  Other commands go as they are.
+    def packCmds(self, cmds):
+        cmdStr = ''
+        targets = {}
+        targetBoard = None
+        for brd,cmd in cmds:
+            if len(targets) > 0 and (brd != targetBoard or cmd[0] != chr(0x04)):
+                cmdStr += self.packTargets(targetBoard, targets)
+                targets = {}
+            if cmd[0] == chr(0x04):
+                targetBoard = brd
+                targets[ord(cmd[1])] = cmd[2:]
+            else:
+                cmdStr += chr(0xaa) + chr(brd) + cmd
+        if len(targets) > 0:
+            cmdStr += self.packTargets(targetBoard, targets)
+        return cmdStr
+
+    # Pack the targets, a dictionary of channel to lsb/msb string, for one board.
+    # Each run of neighbouring channels becomes a Set Multiple Targets command.
+    def packTargets(self, brd, targets):
+        lead = chr(0xaa) + chr(brd)
+        channels = sorted(targets)
+        cmdStr = ''
+        first = 0
+        while first < len(channels):
+            last = first + 1
+            while last < len(channels) and channels[last] == channels[last-1] + 1:
+                last += 1
+            if last - first > 1 and self.multipleTargets:
+                cmdStr += lead + chr(0x1f) + chr(last - first) + chr(channels[first])
+                for chan in channels[first:last]:
+                    cmdStr += targets[chan]
+            else:
+                for chan in channels[first:last]:
+                    cmdStr += lead + chr(0x04) + chr(chan) + targets[chan]
+            first = last
+        return cmdStr
+
     # Clear the current command list
     def clearCmds(self):
         self.commands = []
@@ -270,9 +572,47 @@ class Controller:
         self.sendCmd(cmd)
         lsb = ord(self.usb.read())
         msb = ord(self.usb.read())
-        self.close()
         return (msb << 8) + lsb
 
+    # Get the positions of several channels, given as a list of (board, channel) pairs,
+    # with one write of all the Get Position commands and one read of all the replies.
+    # Chained boards answer in the order asked so the replies line up with the list.
+    def getPositions(self, chans):
+        if len(chans) == 0:
+            return []
+        if len(self.boardPorts) == 0:
+            cmdStr = ''
+            for brd,chan in chans:
+                cmdStr += chr(0xaa) + chr(brd) + chr(0x10) + chr(chan)
+            self.open()
+            self.usb.write(bytes(cmdStr,'latin-1'))
+            reply = self.usb.read(2 * len(chans))
+            positions = []
+            for i in range(len(chans)):
+                positions.append((reply[2*i+1] << 8) + reply[2*i])
+            return positions
+
+        # Boards on separate ports are all asked first and then the replies collected
+        ports = []
+        portChans = {}
+        for i in range(len(chans)):
+            usb = self.portFor(chans[i][0])
+            if usb not in portChans:
+                ports.append(usb)
+                portChans[usb] = []
+            portChans[usb].append(i)
+        for usb in ports:
+            cmdStr = ''
+            for i in portChans[usb]:
+                cmdStr += chr(0xaa) + chr(chans[i][0]) + chr(0x10) + chr(chans[i][1])
+            self.writeTo(usb, bytes(cmdStr,'latin-1'))
+        positions = [0] * len(chans)
+        for usb in ports:
+            reply = usb.read(2 * len(portChans[usb]))
+            for j in range(len(portChans[usb])):
+                positions[portChans[usb][j]] = (reply[2*j+1] << 8) + reply[2*j]
+        return positions
+
     # Test to see if a servo has reached the set target position.  This only provides
     # useful results if the Speed parameter is set slower than the maximum speed of
     # the servo.  Servo range must be defined first using setRange. See setRange comment.
@@ -294,7 +634,6 @@ class Controller:
         self.open()
         self.sendCmd(cmd)
         readval = self.usb.read()
-        self.close()
         if readval == chr(0):
             return False
         else:
@@ -309,14 +648,12 @@ class Controller:
         # cmd = chr(0x28) + chr(subNumber) + chr(lsb) + chr(msb)
         self.open()
         self.sendCmd(cmd)
-        self.close()
 
     # Stop the current Maestro Script
     def stopScript(self):
         cmd = chr(0x24)
         self.open()
         self.sendCmd(cmd)
-        self.close()
 
 
 if __name__ == "__main__":
@@ -21,6 +21,9 @@ import sys
 import maestro
 import time
 import struct
+import json
+import hashlib
+import binascii
 # from machine import Pin, I2C, PWM
 
 #/* Define block */
@@ -40,18 +43,24 @@ pControl = None
 def dogpio(porttableentry, value, push=False):
     # Handle a PWM signal via a Pico GPIO pin
     if verbosity: print('Doing dogpio with porttableentry:', porttableentry, 'and value:', value)
-    if 'pin' not in porttableentry:
+    if porttableentry.get('pwm') is None:
         if verbosity: print('Whoops - Wrong port table entry for dogpio')
         return False
 
-    shift = porttableentry['shift']
-    pin = porttableentry['pin']
-    if pin not in _PWMGPIOs:
-        _PWMGPIOs[pin] = PWM(Pin(pin, Pin.OUT))
+    # PWM object and its 50Hz frequency were set up once by addPWMPortTableEntry
+    value = value>>porttableentry['shift']    # Normally should be a shift of 0 for GPIO pins
+    porttableentry['pwm'].duty_u16(value)
 
-    value = value>>shift    # Normally should be a shift of 0 for GPIO pins
-    _PWMGPIOs[pin].freq(50)
-    _PWMGPIOs[pin].duty_u16(value)
+def _makePWM(pin):
+    # Create, or reuse, the PWM object for a GPIO pin and set it up for servos
+    # There are no GPIO pins on the desktop so just leave the entry unbound
+    try:
+        if pin not in _PWMGPIOs:
+            _PWMGPIOs[pin] = PWM(Pin(pin, Pin.OUT))
+            _PWMGPIOs[pin].freq(50)
+        return _PWMGPIOs[pin]
+    except:
+        return None
 
 def dosomething(port, valuebytes):
     # Accept any set PWM but only process GPIO ones, if any
@@ -66,45 +75,25 @@ def dosomething(port, valuebytes):
 tickcounter = 0
 def dopca9685(porttableentry, value, push=False):
     # Handle a PWM signal via I2C and an external pca9685 board
-    global _i2c
-    global _PWMBoards
     global tickcounter
 
     if verbosity: print('Doing dopca9685 with port:', porttableentry)
-    if True: #try:
-        ticks = time.ticks_us()
-        board = porttableentry['board']
-        pwmout = porttableentry['pwmout']
-        shift = porttableentry['shift']
-        #print('Ticks to look up board, pwmout, and shift in dict:', time.ticks_diff(time.ticks_us(), ticks))
-        if board not in _PWMBoards:
-            ticks = time.ticks_us()
-            if verbosity: print('Whoops - PWMBoard id:', board, 'not in initialized list:', _PWMBoards)
-            if _i2c is None:
-                sda = Pin(0, Pin.OUT, pull=Pin.PULL_UP)
-                scl = Pin(1, Pin.OUT, pull=Pin.PULL_UP)
-                id = 0
-                _i2c = I2C(id=id, sda=sda, scl=scl, freq=1048576)   # Use 1MHz as that is max for pca9685
-            _PWMBoards[board] = servo.TableServos(i2c=_i2c, address=0x40+board)
-            #print('Ticks to nstantiate board if needed:', time.ticks_diff(time.ticks_us(), ticks))
-
-        # Normally should be a shift of 4 for pca9685
-        if verbosity: print('Pushing value:', value, 'to pwm board:',board,'port:',pwmout,'push:',push)
-        ticks = time.ticks_us()
-        # Normally should be a shift of 4 for pca9685
-        #_PWMBoards[board].position(pwmout, duty=value>>shift, push=push)
-        _PWMBoards[board].duty(pwmout, value>>shift)
-        #print('Ticks to set servo value:', time.ticks_diff(time.ticks_us(), ticks))
-        tickcounter += time.ticks_diff(time.ticks_us(), ticks)
-    else: #except:
+    if 'servos' not in porttableentry:
         if verbosity: print('Whoops - Wrong port table entry for dopca9685')
         return False
 
+    # Normally should be a shift of 4 for pca9685
+    if verbosity: print('Pushing value:', value, 'to pwm board:',porttableentry['board'],'port:',porttableentry['pwmout'],'push:',push)
+    ticks = time.ticks_us()
+    porttableentry['servos'].duty(porttableentry['pwmout'], value>>porttableentry['shift'])
+    tickcounter += time.ticks_diff(time.ticks_us(), ticks)
+
 def setPWM(port, value, push=False):
     # Handle a PWM signal to the specified port via the configured method
     #if port in PWMPortTable and 'func' in PWMPortTable[port]:
     try:
-        PWMPortTable[port]['func'](PWMPortTable[port], value, push)
+        entry = PWMPortTable[port]
+        entry['func'](entry, value, push)
     except:
         pass
 
@@ -167,36 +156,41 @@ def releaseAllPWMs():
     for pin in _PWMGPIOs:
         _PWMGPIOs[pin].duty_u16(0)
 
-def pushPWMs():
+def pushPWMs(wholeFrame=False):
     # Push any PWMvalues to pca boards
+    # Set wholeFrame when pushing every port of an animation frame, see Controller.sendCmds
     for board in _PWMBoards:
         _PWMBoards[board].pushValues()
     # Now push any saved values to Maestro boards
     makePControl()
     if pControl:
-        pControl.sendCmds()
+        pControl.sendCmds(wholeFrame=wholeFrame)
     # Don't need to push to GPIO pins??
 
-def configurepca9685(firstport=0, boardid=0):
-    # Configure a single external pca9685 board
-    global PWMPortTable
+def _makeBoard(boardid, firstport=0):
+    # Create, or reuse, the TableServos object for a pca9685 board
     global _i2c
     global _PWMBoards
 
-    # Generate 16 PWM entries per pca9685 board
-    for i in range(16):
-        PWMPortTable[firstport+i] = {'func':dopca9685, 'board':boardid, 'pwmout':i, 'shift':4}
-
-    # Explicitly create the TableServos object and put in list
     if boardid not in _PWMBoards:
-        if verbosity: print('Whoops - PWMBoard id:', boardid, 'not in initialized list:', _PWMBoards)
         if _i2c is None:
             sda = Pin(0, Pin.OUT, pull=Pin.PULL_UP)
             scl = Pin(1, Pin.OUT, pull=Pin.PULL_UP)
             id = 0
             _i2c = I2C(id=id, sda=sda, scl=scl, freq=1048576)   # Use 1MHz as that is max for pca9685
         _PWMBoards[boardid] = TableServos(i2c=_i2c, address=0x40+boardid, firstport=firstport)
+    return _PWMBoards[boardid]
+
+def configurepca9685(firstport=0, boardid=0):
+    # Configure a single external pca9685 board
+    global PWMPortTable
+
+    # Explicitly create the TableServos object and put in list
+    board = _makeBoard(boardid, firstport)
 
+    # Generate 16 PWM entries per pca9685 board, each bound to the board object
+    for i in range(16):
+        PWMPortTable[firstport+i] = {'func':dopca9685, 'board':boardid, 'servos':board, 'pwmout':i, 'shift':4}
 
     global _ExpectedPWMPorts
     _ExpectedPWMPorts += 16
@@ -209,34 +203,114 @@ def doMaestroPWM(porttableentry, value, push=False):
     try:
         board = porttableentry['board']
         pwmout = porttableentry['pwmout']
-        mult = porttableentry['multiplier']
-
-        # Normally should be a multiply of 1.22 for Maestros
-        if verbosity: print('Pushing value:', value, 'to pwm board:',board,'port:',pwmout,'multiplier:',mult)
-        value = int(value * mult)
-        if pControl is not None:
-            pControl.setBoard(board)
-            pControl.setTarget(pwmout, value)
-            if push: pControl.sendCmds()
+        if 'cmd' not in porttableentry: _bindMaestroEntry(porttableentry, porttableentry['multiplier'])
+
+        if verbosity: print('Pushing value:', value, 'to pwm board:',board,'port:',pwmout,'multiplier:',porttableentry['multiplier'])
+        _queueMaestroTarget(porttableentry, value)
+        if push and pControl is not None: pControl.sendCmds()
     except:
         if verbosity: print('Whoops - Wrong port table entry for doMaestroPWM')
         return False
 
+# Maestro value tables shared by every port with the same multiplier
+_MaestroLUTs = {}
+
+def _maestroLUT(mult):
+    # Build, or reuse, the list of Maestro-ready lsb/msb pairs for every value a port
+    # with this multiplier can send.  Maestro targets are 14 bits so the list stops
+    # at the last value that fits.
+    if mult not in _MaestroLUTs:
+        lut = []
+        value = 0
+        target = 0
+        while target <= 0x3fff:
+            lut.append(chr(target & 0x7f) + chr(target >> 7))
+            value += 1
+            target = int(value * mult)
+        _MaestroLUTs[mult] = lut
+    return _MaestroLUTs[mult]
+
+def _bindMaestroEntry(entry, mult):
+    # Attach the pre-encoded Set Target command head to a port entry and build the
+    # value table for its multiplier
+    entry['cmd'] = chr(0x04) + chr(entry['pwmout'])
+    entry['multiplier'] = mult
+    _maestroLUT(mult)
+
+def _encodeMaestroTarget(entry, value):
+    # Look up the Set Target command for a value on a bound Maestro port
+    lut = _MaestroLUTs[entry['multiplier']]
+    if value < 0: value = 0
+    elif value >= len(lut): value = len(lut) - 1
+    return entry['cmd'] + lut[value]
+
+def _queueMaestroTarget(entry, value):
+    # Add the Set Target command for a value to the Maestro command list.  Ranges set
+    # on the controller with setRange still go through setTarget to be enforced.
+    if pControl is None: return
+    pwmout = entry['pwmout']
+    if pControl.Mins[pwmout] > 0 or pControl.Maxs[pwmout] > 0:
+        pControl.setBoard(entry['board'])
+        pControl.setTarget(pwmout, int(value * entry['multiplier']))
+    else:
+        # Keep the target for isMoving just as setTarget would, clamped like the table
+        value = int(value)
+        last = len(_MaestroLUTs[entry['multiplier']]) - 1
+        if value < 0: value = 0
+        elif value > last: value = last
+        pControl.Targets[pwmout] = int(value * entry['multiplier'])
+        pControl.commands.append((entry['board'], _encodeMaestroTarget(entry, value)))
+
 def makePControl():
     global pControl
     if pControl is None:
         pControl = maestro.Controller()
+        pControl.multipleTargets = _MultipleTargets
+        for board in _MaestroPorts:
+            pControl.setBoardPort(board, _MaestroPorts[board])
+
+def startMaestros():
+    # Begin finding and opening the Maestros in the background at startup so that
+    # makePControl does not stall the first frame doing it
+    maestro.startDiscovery()
 
 def configureMaestroUART(TxPin=None, RxPin=None):
     # Dummy method for compatibility with Pico tabledefs
     pass
 
+def configureI2C(frequency=None):
+    # Dummy method for compatibility with Pico tabledefs
+    pass
+
+_MultipleTargets = True
+
+def configureMaestroMultipleTargets(enable=True):
+    # Micro Maestros lack the Set Multiple Targets command so it must be turned off
+    # if any of them are in the chain
+    global _MultipleTargets
+    _MultipleTargets = enable
+    if pControl is not None:
+        pControl.multipleTargets = enable
+
+_MaestroPorts = {}
+
+def configureMaestroPort(boardid=12, port=None):
+    # Put a Maestro board on a USB Command Port of its own, given by device name such
+    # as /dev/ttyACM2 or COM5, or better by the Maestro's serial number which does not
+    # change when it is plugged in elsewhere.  Boards on separate ports are written in
+    # parallel rather than all sharing the one 115200 baud chain.
+    global _MaestroPorts
+    _MaestroPorts[boardid] = port
+    if pControl is not None:
+        pControl.setBoardPort(boardid, port)
+
 def configureMaestroPWM(firstport=0, boardid=0, count=1, firstchannel=0):
     global PWMPortTable
 
     # Generate count PWM entries for this Maestro board
     for i in range(count):
-        PWMPortTable[firstport+i] = {'func':doMaestroPWM, 'board':boardid, 'pwmout':i+firstchannel, 'multiplier':1.2207}
+        PWMPortTable[firstport+i] = {'func':doMaestroPWM, 'board':boardid, 'pwmout':i+firstchannel, 'multiplier':1.2207, 'shift':0}
+        _bindMaestroEntry(PWMPortTable[firstport+i], 1.2207)
 
     global _ExpectedPWMPorts
     _ExpectedPWMPorts += count
@@ -262,6 +336,12 @@ def addPWMPortTableEntry(port, entry):
     if 'shift' not in entry:
         entry['shift'] = 0
 
+    # Bind hardware objects now rather than on every value written
+    if entry.get('func') == dogpio and 'pin' in entry:
+        entry['pwm'] = _makePWM(entry['pin'])
+    elif entry.get('func') == dopca9685 and 'board' in entry and 'servos' not in entry:
+        entry['servos'] = _makeBoard(entry['board'], port - entry.get('pwmout', 0))
+
     PWMPortTable[port] = entry
     _ExpectedPWMPorts += 1
 
@@ -283,15 +363,13 @@ def doMaestroDigital(porttableentry, value, push=False):
     try:
         board = porttableentry['board']
         pwmout = porttableentry['pwmout']
+        if 'cmd' not in porttableentry: _bindMaestroEntry(porttableentry, 7000)
 
         if verbosity: print('Pushing value:', value, 'to pwm board:',board,'port:',pwmout)
-        value = int(value * 7000)
-        if pControl is not None:
-            pControl.setBoard(board)
-            pControl.setTarget(pwmout, value)
-            if push: pControl.sendCmds()
+        _queueMaestroTarget(porttableentry, value)
+        if push and pControl is not None: pControl.sendCmds()
     except:
-        if verbosity: print('Whoops - Wrong port table entry for doMaestroPWM')
+        if verbosity: print('Whoops - Wrong port table entry for domaestroPWM')
         return False
 
 def configureMaestroDigital(boardid=12, firstport=0, firstchannel=0, count=1):
@@ -301,6 +379,7 @@ def configureMaestroDigital(boardid=12, firstport=0, firstchannel=0, count=1):
     # Populate the port table
     for indx in range(count):
         DigitalPortTable[indx+firstport] = { 'func':doMaestroDigital, 'board':boardid, 'pwmout':indx+firstchannel }
+        _bindMaestroEntry(DigitalPortTable[indx+firstport], 7000)
 
     global _ExpectedDigitalPorts
     _ExpectedDigitalPorts += count
@@ -314,6 +393,7 @@ _DataPin = None
 _ClockPin = None
 _RclkPin = None
 _ClearPin = None
+_595Pins = None             # Pin objects (data, rclk, clock, clear) created once by configure595s
 
 def configure595s(firstport=0, portcount=24, datapin=26, clockpin=27, rclkpin=21, clearpin=20):
     # Configure a block of portcount ports supproted by 595s at 8 ports per board
@@ -322,6 +402,7 @@ def configure595s(firstport=0, portcount=24, datapin=26, clockpin=27, rclkpin=21
     global _ClockPin
     global _RclkPin
     global _ClearPin
+    global _595Pins
     global DigitalPortTable
 
     # Set up buffer for values prior to shifting them out to the 595s
@@ -333,6 +414,14 @@ def configure595s(firstport=0, portcount=24, datapin=26, clockpin=27, rclkpin=21
     _RclkPin = rclkpin
     _ClearPin = clearpin
 
+    # Define the pins once so shifting out does not recreate them every frame
+    # There are no GPIO pins on the desktop so just leave them undefined
+    try:
+        _595Pins = (Pin(_DataPin, Pin.OUT), Pin(_RclkPin, Pin.OUT), Pin(_ClockPin, Pin.OUT), Pin(_ClearPin, Pin.OUT))
+        _595Pins[3].on() # No want clearing here
+    except:
+        _595Pins = None
+
     # Populate the port table
     for indx in range(portcount):
         DigitalPortTable[indx+firstport] = { 'func':do595, 'index':indx }
@@ -340,21 +429,30 @@ def configure595s(firstport=0, portcount=24, datapin=26, clockpin=27, rclkpin=21
     global _ExpectedDigitalPorts
     _ExpectedDigitalPorts += portcount
 
+def _makeDigitalPin(pin):
+    # Create, or reuse, the output Pin object for a GPIO pin
+    # There are no GPIO pins on the desktop so just leave the entry unbound
+    try:
+        if pin not in _DigitalGPIOs:
+            _DigitalGPIOs[pin] = Pin(pin, Pin.OUT)
+        return _DigitalGPIOs[pin]
+    except:
+        return None
+
 def addDigitalPortTableEntry(port, entry):
     global DigitalPortTable
     global _ExpectedDigitalPorts
 
+    # Bind GPIO pins to their Pin objects now rather than on every value written
+    if entry.get('func') == dogpiodigital and 'pin' in entry:
+        entry['pinobj'] = _makeDigitalPin(entry['pin'])
+
     DigitalPortTable[port] = entry
     _ExpectedDigitalPorts += 1
 
 def output595s():
-    if _DataPin is None or _RclkPin is None or _ClockPin is None or _ClearPin is None: return
-    # Define the pins
-    dataPin = Pin(_DataPin, Pin.OUT)
-    clockPin = Pin(_RclkPin, Pin.OUT)
-    shiftPin = Pin(_ClockPin, Pin.OUT)
-    clearPin = Pin(_ClearPin, Pin.OUT)
-    clearPin.on() # No want clearing here
+    if _595Pins is None: return
+    dataPin, clockPin, shiftPin, clearPin = _595Pins
 
     # Cycle the digital state thru all the 74HC595 chips
     for i in range(len(_digitalCurrentState)):
@@ -369,13 +467,8 @@ def output595s():
     clockPin.off()
 
 def fast595s(bytes, count):
-    if _DataPin is None or _RclkPin is None or _ClockPin is None or _ClearPin is None: return
-    # Define the pins
-    dataPin = Pin(_DataPin, Pin.OUT)
-    clockPin = Pin(_RclkPin, Pin.OUT)
-    shiftPin = Pin(_ClockPin, Pin.OUT)
-    clearPin = Pin(_ClearPin, Pin.OUT)
-    clearPin.on() # No want clearing here
+    if _595Pins is None: return
+    dataPin, clockPin, shiftPin, clearPin = _595Pins
 
     valuebits = int.from_bytes(bytes, 'little')
 
@@ -402,30 +495,25 @@ def do595(porttableentry, value):
 
 def dogpiodigital(porttableentry, value):
     if verbosity: print('Doing dogpiodigital with porttableentry:', porttableentry)
-    if 'pin' not in porttableentry:
+    if porttableentry.get('pinobj') is None:
         if verbosity: print('Whoops - Wrong port table entry for dogpiodigital')
         return False
-    pin = porttableentry['pin']
-    pin = Pin(pin, Pin.OUT)
     if value > 0.5:
-        pin.on()
+        porttableentry['pinobj'].on()
     else:
-        pin.off()
+        porttableentry['pinobj'].off()
 
 def setDigital(port, value, push=False):
-    if port in DigitalPortTable and 'func' in DigitalPortTable[port]:
-        DigitalPortTable[port]['func'](DigitalPortTable[port], value)
+    entry = DigitalPortTable.get(port)
+    if entry is not None and 'func' in entry:
+        entry['func'](entry, value)
     if push: outputDigital()
 
 def clearAllDigital():
     # Set all digital pins to OFF (0)
     # Using clear pin for speed
-    if _DataPin is None or _RclkPin is None or _ClockPin is None or _ClearPin is None: return
-    # Define the pins
-    dataPin = Pin(_DataPin, Pin.OUT)
-    clockPin = Pin(_RclkPin, Pin.OUT)
-    shiftPin = Pin(_ClockPin, Pin.OUT)
-    clearPin = Pin(_ClearPin, Pin.OUT)
+    if _595Pins is None: return
+    dataPin, clockPin, shiftPin, clearPin = _595Pins
 
     # Clear all the registers
     clearPin.on() # Make sure initially not clearing, then cycle bit
@@ -568,6 +656,31 @@ def getInput(portid):
             return InputPort['func'](InputPort)
     return None
 
+def pollInputs():
+    # Read every configured Maestro input in a single sweep rather than a serial round
+    # trip per input.  Returns a dictionary of input states keyed by 'run', 'main',
+    # 'trigger' and the digital input indices.  Unconfigured inputs are left out.
+    sweep = []
+    for key, InputPort in (('run', RunInputPort), ('main', MainInputPort), ('trigger', TriggerInputPort)):
+        if InputPort is not None:
+            sweep.append((key, InputPort['boardid'], InputPort['firstchannel'], InputPort['level']))
+    for port in DigitalInputPortTable:
+        InputPort = DigitalInputPortTable[port]
+        sweep.append((port, InputPort['boardid'], InputPort['channel'], InputPort['level']))
+
+    inputs = {}
+    if len(sweep) == 0:
+        return inputs
+    makePControl()
+    try:
+        positions = pControl.getPositions([(board, chan) for key, board, chan, level in sweep])
+        for indx in range(len(sweep)):
+            key, board, chan, level = sweep[indx]
+            inputs[key] = not ((positions[indx] > 512) ^ level)
+    except:
+        if verbosity: print('Whoops - Unable to read Maestro inputs')
+    return inputs
+
 ########################################################
 
 # Digital Input Definitions
@@ -581,6 +694,20 @@ _ExpectedDigitalinputPorts = 0
 
 ############## Method to process an external file for table definition #################
 _parsedFile = None
+_tablesHash = None      # Hash of the tabledefs source the current tables were built from
+_tableCalls = []        # Configuration calls made by that source, saved as the table image
+
+# Configuration functions that tabledefs may call.  Only these calls are recorded in
+# the compiled table image and replayed from it, so tabledefs files should confine
+# themselves to them.
+_ConfigFunctions = (
+    'configurepca9685', 'configure595s', 'configureMaestroUART', 'configureMaestroPWM',
+    'configureMaestroDigital', 'addPWMPortTableEntry', 'addDigitalPortTableEntry',
+    'configureMaestroTriggerInput', 'configureMaestroRunInput', 'configureMaestroMainInput',
+    'configureMaestroDigitalInputs', 'setPreferBinary', 'configureMaestroMultipleTargets',
+    'configureMaestroPort', 'configureI2C',
+)
+TableImageVersion = 1
 
 def clearTables():
     global _PWMBoards
@@ -593,6 +720,8 @@ def clearTables():
     _ExpectedPWMPorts = 0
     global _DigitalGPIOs
     _DigitalGPIOs = {}          # Dictionary of GPIO pins set up for Digital control
+    global _595Pins
+    _595Pins = None
     global DigitalPortTable
     DigitalPortTable = { }
     global _ExpectedDigitalPorts
@@ -609,12 +738,113 @@ def clearTables():
     _ExpectedDigitalinputPorts = 0
     global _parsedFile
     _parsedFile = None
+    global _tablesHash
+    _tablesHash = None
+    global _tableCalls
+    _tableCalls = []
+    global _MultipleTargets
+    _MultipleTargets = True
+    global _MaestroPorts
+    _MaestroPorts = {}
 
 
 def setPreferBinary(flag):
     global PreferBinary
     PreferBinary = flag
 
+def getTablesHash():
+    # Returns the hash of the tabledefs source in use or None if none was parsed
+    return _tablesHash
+
+def _hashSource(source):
+    # Short hex digest identifying the exact content of a tabledefs file
+    return binascii.hexlify(hashlib.sha256(source).digest()).decode()[0:16]
+
+def _imageName(tablefile):
+    return tablefile + '.json'
+
+def _encode(value):
+    # Make configuration call arguments JSON friendly by naming any functions
+    if isinstance(value, dict):
+        return {key:_encode(value[key]) for key in value}
+    elif isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    elif callable(value):
+        return {'__func__':value.__name__}
+    return value
+
+def _decode(value):
+    # Undo _encode by looking up named functions in this module
+    if isinstance(value, dict):
+        if '__func__' in value:
+            return globals()[value['__func__']]
+        return {key:_decode(value[key]) for key in value}
+    elif isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+def _recorder(name):
+    # Wrap a configuration function so its calls are saved for the table image
+    func = globals()[name]
+    def record(*args, **kwargs):
+        _tableCalls.append([name, _encode(args), _encode(kwargs)])
+        return func(*args, **kwargs)
+    return record
+
+def _loadImage(tablefile, thehash):
+    # Rebuild the tables from the compiled image if it matches the tabledefs source
+    try:
+        with open(_imageName(tablefile), 'r') as f:
+            image = json.load(f)
+    except:
+        return False
+    if image.get('version') != TableImageVersion or image.get('hash') != thehash:
+        if verbosity: print('Table image is stale for:', tablefile)
+        return False
+    try:
+        for name, args, kwargs in image['calls']:
+            if name not in _ConfigFunctions:
+                raise ValueError(name)
+            globals()[name](*_decode(args), **_decode(kwargs))
+    except:
+        if verbosity: print('Whoops - Unable to replay table image for:', tablefile)
+        clearTables()
+        return False
+    return True
+
+def _saveImage(tablefile, thehash):
+    # Save the recorded configuration calls so the next load need not exec tabledefs
+    try:
+        with open(_imageName(tablefile), 'w') as f:
+            json.dump({'version':TableImageVersion, 'hash':thehash, 'calls':_tableCalls}, f)
+    except:
+        # Read-only file systems just keep executing tabledefs
+        if verbosity: print('Unable to write table image for:', tablefile)
+
+def _readTables(tablefile):
+    # Build the tables from tablefile, preferring its compiled image when up to date
+    global _tablesHash
+    global _tableCalls
+
+    with open(tablefile, 'rb') as f:
+        source = f.read()
+    thehash = _hashSource(source)
+
+    if _loadImage(tablefile, thehash):
+        if verbosity: print('Loaded table image for:', tablefile)
+    else:
+        # Execute tabledefs a line at a time while recording the configuration calls
+        _tableCalls = []
+        namespace = dict(globals())
+        for name in _ConfigFunctions:
+            namespace[name] = _recorder(name)
+        for line in source.decode('utf-8').split('\n'):
+            if verbosity: print('Executing line:', line)
+            exec(line, namespace)
+        _saveImage(tablefile, thehash)
+
+    _tablesHash = thehash
+
 def parsefile(tablefile=None):
     global _parsedFile
     clearTables()
@@ -623,12 +853,7 @@ def parsefile(tablefile=None):
         for path in sys.path:
             if verbosity: print('Looking for tabledefs in:', path)
             try:
-                with open(path + '/tabledefs', 'r') as f:
-                    line = f.readline()
-                    while len(line) > 0:
-                        if verbosity: print('Executing line:', line)
-                        exec(line)
-                        line = f.readline()
+                _readTables(path + '/tabledefs')
                 _parsedFile = path + '/tabledefs'
                 break   # Quit if we successfully found and processed the file
 
@@ -637,12 +862,7 @@ def parsefile(tablefile=None):
     else:
         if verbosity: print('Looking for tabledefs in:', tablefile)
         try:
-            with open(tablefile, 'r') as f:
-                line = f.readline()
-                while len(line) > 0:
-                    if verbosity: print('Executing line:', line)
-                    exec(line)
-                    line = f.readline()
+            _readTables(tablefile)
             _parsedFile = tablefile
 
         except:
@@ -749,6 +969,77 @@ def csvToBin(fname):
 
     return None
 
+def binToMaestroFrames(fname):
+    # Read a binary control file made by csvToBin and build the Maestro command bytes
+    # for every record up front so playback only has to write one buffer per Command Port
+    # each frame
+    # Returns a list of times in msec and a matching list of frames or None if a problem occurred
+    makePControl()
+    if pControl is None: return None
+
+    try:
+        message = 'Trying to read input file'
+        with open(fname, 'rb') as f:
+            data = f.read()
+
+        recsize, timesize, digsize, pwmsize = getBinarysizes()
+        if len(data) % recsize != 0:
+            if verbosity: print('Whoops - Binary file', fname, 'does not match the port tables')
+            return None
+
+        # Find where each Maestro port lives in a record, sorted by board and channel so
+        # neighbouring channels can be packed into Set Multiple Targets commands
+        # Digital ports are entered as bit numbers with negative offsets
+        message = 'Laying out Maestro ports'
+        layout = []
+        for port in PWMPortTable:
+            entry = PWMPortTable[port]
+            if entry.get('func') == doMaestroPWM:
+                if 'cmd' not in entry: _bindMaestroEntry(entry, entry['multiplier'])
+                layout.append((entry['board'], entry['pwmout'], timesize + digsize + port*4 + 2, entry))
+        for port in DigitalPortTable:
+            entry = DigitalPortTable[port]
+            if entry.get('func') == doMaestroDigital:
+                if 'cmd' not in entry: _bindMaestroEntry(entry, 7000)
+                layout.append((entry['board'], entry['pwmout'], -1 - port, entry))
+        layout.sort()
+
+        # Build the command bytes for every record
+        message = 'Building Maestro frames'
+        times = []
+        frames = []
+        lastframe = None
+        for offset in range(0, len(data), recsize):
+            times.append(int.from_bytes(data[offset:offset+timesize], 'little'))
+            bits = int.from_bytes(data[offset+timesize:offset+timesize+digsize], 'little')
+            cmds = []
+            for board, chan, index, entry in layout:
+                if index < 0:
+                    value = (bits >> (-1 - index)) & 1
+                else:
+                    value = int.from_bytes(data[offset+index:offset+index+2], 'little')
+                cmds.append((board, _encodeMaestroTarget(entry, value)))
+            frame = pControl.packFrame(cmds)
+            # Repeated frames share one object so the player can tell nothing changed
+            if frame == lastframe: frame = lastframe
+            frames.append(frame)
+            lastframe = frame
+
+        return times, frames
+
+    except:
+        if verbosity:
+            print('Whoops - Trouble in binToMaestroFrames')
+            print('Message:', message)
+
+    return None
+
+def sendMaestroFrame(frame):
+    # Write one frame built by binToMaestroFrames to the Maestros
+    makePControl()
+    if pControl:
+        pControl.sendBytes(frame, wholeFrame=True)
+
 ######################  Self Test Code  ################################################
 #/* Usage method */
 def print_usage(name):
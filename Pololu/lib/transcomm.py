@@ -19,6 +19,9 @@ import math
 import random
 import serial
 import binascii
+import struct
+import socket
+import collections
 import time
 
 # Get path to actual file and add path/lib to search path
@@ -35,6 +38,7 @@ if os.path.exists(cachefile):
 verbosity = False
 tclient = False
 tserver = False
+tunix = False
 
 # Base class
 class Communications:
@@ -53,27 +57,267 @@ class Communications:
     def readline(self):
         return None
 
+    def readMessages(self):
+        return []
+
     def writeline(self, inString):
         return False
 
+    def writePorts(self, updates):
+        return False
+
     def write(self, inBytes=None, inLen = 0):
         return False
 
+    def request(self, inString):
+        return None
+
+    def getResponse(self, requestid):
+        return None
+
+    def respond(self, replyto, inString):
+        return False
+
+    def fileno(self):
+        return None
+
+    def filenos(self):
+        # All the descriptors to wait on with select
+        fd = self.fileno()
+        if fd is None:
+            return []
+        return [fd]
+
     def cleanup(self):
         pass
 
-class FIFOComm(Communications):
+# Framed message protocol used over the FIFOs and sockets.  Every message is a
+# FrameHeader giving the message type and payload length followed by the payload.
+FrameHeader = struct.Struct('<BH')
+PortUpdate = struct.Struct('<BHH')  # kind, port, and value for each port in a MsgPorts payload
+RequestId = struct.Struct('<H')     # Leads the text in MsgRequest and MsgResponse payloads
+MsgText = 1                 # Payload is a text command line such as 'a\n' or 'x\n'
+MsgPorts = 2                # Payload is a batch of PortUpdates
+MsgRequest = 3              # Payload is a RequestId and a text command that wants a response
+MsgResponse = 4             # Payload is the RequestId being answered and the response text
+PortDigital = ord('d')
+PortServo = ord('s')
+PipeChunk = getattr(select, 'PIPE_BUF', 512)    # Writes up to this size go into a pipe whole
+MaxPortsPerFrame = (PipeChunk - FrameHeader.size) // PortUpdate.size
+MaxReadPerCall = 65536      # Bytes taken from one peer per call so one cannot starve the rest
+OutQueueFrames = 64         # Messages other than port updates are refused beyond this many
+ConnectRetryTime = 0.25     # Seconds between attempts to attach to the other side
+SocketName = '/tmp/sock.maestroanimator'
+
+class FramedComm(Communications):
+    '''
+    FramedComm holds the message framing, queuing, and request tracking shared by the FIFO
+    and socket transports.  Subclasses open the connection and provide isOpen, readBytes,
+    writeBytes, and disconnect for it.
+    '''
+    def __init__(self):
+        super().__init__()
+        self.inbuf = bytearray()
+        self.inmessages = []            # Complete messages received but not yet read
+        self.outbuf = bytearray()       # Bytes committed to the connection but not yet written
+        self.outqueue = collections.deque()
+        self.pendingPorts = {}          # Latest value for each (kind, port) not yet queued
+        self.dropped = 0                # Messages refused because the queue was full
+        self.nextRequest = 1
+        self.responses = {}             # Response text by RequestId until collected
+
+    def isOpen(self):
+        return False
+
+    def readBytes(self):
+        # Returns available bytes, b'' if there are none, or None if the peer has gone
+        return None
+
+    def writeBytes(self, data):
+        # Returns the number of bytes written, 0 if it would block, or None if the peer has gone
+        return None
+
+    def disconnect(self):
+        self.resetBuffers()
+
+    def resetBuffers(self):
+        self.inbuf = bytearray()
+        self.outbuf = bytearray()
+        self.outqueue.clear()
+        self.pendingPorts = {}
+
+    def hasOutput(self):
+        return len(self.outbuf) > 0 or len(self.outqueue) > 0 or len(self.pendingPorts) > 0
+
+    def isThereInput(self):
+        self.receive()
+        return len(self.inmessages) > 0
+
+    def readMessages(self):
+        '''
+        Reads everything waiting on the connection and returns a list of complete messages as
+        (type, payload) pairs.  Text payloads are strings, port payloads are lists of
+        (kind, port, value) tuples, and request payloads are (replyto, text) pairs where
+        replyto is passed back to respond.  Partial messages are kept for the next call.
+        '''
+        self.receive()
+        messages = self.inmessages
+        self.inmessages = []
+        return messages
+
+    def receive(self):
+        # Read what is waiting and add the complete messages to inmessages
+        if not self.isOpen():
+            return
+        hangup = False
+        count = 0
+        while count < MaxReadPerCall:
+            data = self.readBytes()
+            if data is None:
+                hangup = True
+                break
+            if len(data) == 0:
+                break
+            self.inbuf.extend(data)
+            count += len(data)
+
+        # Pull out all the complete messages
+        offset = 0
+        while len(self.inbuf) - offset >= FrameHeader.size:
+            msgtype, length = FrameHeader.unpack_from(self.inbuf, offset)
+            if len(self.inbuf) - offset - FrameHeader.size < length:
+                break
+            offset += FrameHeader.size
+            payload = bytes(self.inbuf[offset:offset+length])
+            offset += length
+            if msgtype == MsgText:
+                self.inmessages.append((msgtype, payload.decode('utf-8', 'replace')))
+            elif msgtype == MsgPorts:
+                self.inmessages.append((msgtype, list(PortUpdate.iter_unpack(payload))))
+            elif msgtype == MsgRequest and length >= RequestId.size:
+                requestid = RequestId.unpack_from(payload)[0]
+                self.inmessages.append((msgtype, (requestid, payload[RequestId.size:].decode('utf-8', 'replace'))))
+            elif msgtype == MsgResponse and length >= RequestId.size:
+                requestid = RequestId.unpack_from(payload)[0]
+                self.responses[requestid] = payload[RequestId.size:].decode('utf-8', 'replace')
+        del self.inbuf[:offset]
+
+        # Messages that arrived before a hangup are kept for the reader
+        if hangup: self.disconnect()
+
+    def readline(self):
+        # Returns the next text command, leaving any other messages for readMessages, or ''
+        self.receive()
+        for indx in range(len(self.inmessages)):
+            if self.inmessages[indx][0] == MsgText:
+                return self.inmessages.pop(indx)[1]
+        return ''
+
+    def writeline(self, inString):
+        if len(inString) == 0 or inString[-1] != '\n':
+            inString += '\n'
+        # Port updates already waiting go first so commands stay in order
+        self.flush()
+        if not (self.queuePorts() and self.queueMessage(MsgText, inString.encode('utf-8'))):
+            return False
+        return self.flush()
+
+    def writePorts(self, updates):
+        '''
+        Sends a batch of (kind, port, value) updates.  Updates wait in a dictionary while
+        the connection is backed up so a later value for a port replaces an earlier unsent
+        one and they all go out together as soon as the reader catches up.
+        '''
+        for kind, port, value in updates:
+            self.pendingPorts[(kind, port)] = max(0, min(0xffff, int(value)))
+        return self.flush()
+
+    def request(self, inString):
+        # Sends a text command that wants a response and returns its RequestId for getResponse
+        requestid = self.nextRequest
+        self.nextRequest = self.nextRequest % 0xffff + 1
+        self.flush()
+        if not (self.queuePorts() and self.queueMessage(MsgRequest, RequestId.pack(requestid) + inString.encode('utf-8'))):
+            return None
+        if not self.flush():
+            return None
+        return requestid
+
+    def getResponse(self, requestid):
+        # Returns the response to the request or None if it has not arrived yet
+        self.receive()
+        return self.responses.pop(requestid, None)
+
+    def respond(self, replyto, inString):
+        self.flush()
+        if not self.queueMessage(MsgResponse, RequestId.pack(replyto) + inString.encode('utf-8')):
+            return False
+        return self.flush()
+
+    def queueMessage(self, msgtype, payload):
+        '''
+        Queues a message unless OutQueueFrames are already waiting on a reader that has
+        stopped reading.  Queued messages are never thrown away so a refused one is
+        counted in dropped, reported, and False returned for the caller to handle.
+        '''
+        if len(self.outqueue) >= OutQueueFrames:
+            self.dropped += 1
+            sys.stderr.write('\nWhoops - Output queue full, message not sent (%d so far)\n' % self.dropped)
+            return False
+        self.outqueue.append(FrameHeader.pack(msgtype, len(payload)) + payload)
+        return True
+
+    def queuePorts(self):
+        '''
+        Packs the pending port updates into as few messages as fit whole in a pipe.  Updates
+        that do not fit in the queue stay pending, where later values replace them, rather
+        than being refused.  Returns True if none are left pending.
+        '''
+        updates = list(self.pendingPorts.items())
+        for first in range(0, len(updates), MaxPortsPerFrame):
+            if len(self.outqueue) >= OutQueueFrames:
+                return False
+            payload = bytearray()
+            for (kind, port), value in updates[first:first+MaxPortsPerFrame]:
+                payload.extend(PortUpdate.pack(kind, port, value))
+                del self.pendingPorts[(kind, port)]
+            self.outqueue.append(FrameHeader.pack(MsgPorts, len(payload)) + bytes(payload))
+        return True
+
+    def flush(self):
+        # Write as much as the connection will take without blocking and keep the rest for later
+        if not self.isOpen():
+            return False
+        while True:
+            if len(self.outbuf) == 0:
+                if len(self.outqueue) == 0:
+                    self.queuePorts()
+                while len(self.outqueue) > 0 and (len(self.outbuf) == 0 or
+                        len(self.outbuf) + len(self.outqueue[0]) <= PipeChunk):
+                    self.outbuf.extend(self.outqueue.popleft())
+                if len(self.outbuf) == 0:
+                    return True
+            count = self.writeBytes(self.outbuf)
+            if count is None:
+                self.disconnect()   # Reader has gone away
+                return False
+            if count == 0:
+                return True     # Backed up so finish on a later call
+            del self.outbuf[:count]
+
+class FIFOComm(FramedComm):
     def __init__(self, inputFIFOName=None, outputFIFOName=None):
         super().__init__()
 
         # FIFO Names
         self.inputFIFOName = inputFIFOName
         self.outputFIFOName = outputFIFOName
-        self.inputFIFO = None
-        self.outputFIFO = None
+        self.inputFD = None
+        self.outputFD = None
         self.inpoll = None
+        self.nextConnect = 0.0
 
-        # Create the output FIFO to inform the world that we can talk but don't open it yet cuz that'll hang
+        # Create the output FIFO to inform the world that we can talk but don't open it yet
         try:
             os.mkfifo(self.outputFIFOName)
         except FileExistsError:
@@ -82,81 +326,255 @@ class FIFOComm(Communications):
         except:
             sys.stderr.write('\nWHOOPS - Unable to create output FIFO %s\n' % self.outputFIFOName)
 
-    def isThereInput(self):
-        if self.inpoll is not None:
-            result = self.inpoll.poll(0)
-            return len(result) > 0
-        else:
-            return False
-
     def isReady(self):
         '''
-        The isReady method first checks to see if another process has created a named pipe
-        or FIFO with the correct name that we want to read from.  If so, we open that pipe
-        and also open our output pipe with the correct name that we want to write
-        to.  Note that opening the output pipe blocks until someone attaches to it to read
-        from it.
-
-        Note that isReady should be called inside a loop that checks often as a process that
-        wants to talk to us has to create their output pipe first and then check to see if
-        this process has created its output pipe.  Once both pipes are created, both processes
-        proceed with opening both input and output pipes.
+        The isReady method returns True while we are connected to the process at the other
+        end of the FIFOs.  When not connected, it tries to attach at most every
+        ConnectRetryTime seconds.  The other process has to create the FIFO we read from
+        and be reading from the FIFO we write to before we are connected.  Since neither
+        FIFO is opened in blocking mode, isReady never waits on the other process.
+
+        Once connected, no more checks are made on the FIFO files.  The connection is
+        dropped when a write finds the reader gone or a read finds the writer gone and
+        isReady starts trying to attach again.  isReady also sends any queued messages
+        that the pipe could not take earlier.
         '''
-        if os.path.exists(self.inputFIFOName) and stat.S_ISFIFO(os.lstat(self.inputFIFOName).st_mode):
-            if self.inputFIFO is None:
-                # Someone created our input fifo and is trying to connect to us so attach to that fifo
-                # Create in non-blocking mode so we aren't waiting
-                self.inputFIFO = os.fdopen(os.open(self.inputFIFOName, os.O_RDONLY | os.O_NONBLOCK))
-                # Then immediately set back to blocking mode
-                os.set_blocking(self.inputFIFO.fileno(), True)
-                # Create poller to allow checking for input without reading
+        if self.outputFD is None:
+            now = time.monotonic()
+            if now >= self.nextConnect:
+                self.nextConnect = now + ConnectRetryTime
+                self.connect()
+        elif self.hasOutput():
+            self.flush()
+        return self.outputFD is not None
+
+    def connect(self):
+        # Attach to the other process if it has created our input FIFO and is reading its own
+        try:
+            if self.inputFD is None:
+                if not stat.S_ISFIFO(os.stat(self.inputFIFOName).st_mode):
+                    return False
+                self.inputFD = os.open(self.inputFIFOName, os.O_RDONLY | os.O_NONBLOCK)
+                # Create poller to allow checking for hangups
                 self.inpoll = select.poll()
-                self.inpoll.register(self.inputFIFO, select.POLLIN)
-                # Create the output FIFO for our devoted fan
-                self.outputFIFO = open(self.outputFIFOName, 'w')
-                print('FIFOs are open')
-        else:
-            self.closeFIFOs()
-        return self.inputFIFO is not None and self.outputFIFO is not None
+                self.inpoll.register(self.inputFD, select.POLLIN)
+            # Opening for write without blocking fails until someone is reading
+            self.outputFD = os.open(self.outputFIFOName, os.O_WRONLY | os.O_NONBLOCK)
+            print('FIFOs are open')
+        except:
+            return False
+        return True
 
-    def read(self, numBytes=0):
-        return self.inputFIFO.read(numBytes)
+    def isOpen(self):
+        return self.outputFD is not None
 
-    def readline(self):
-        return self.inputFIFO.readline()
+    def readBytes(self):
+        if self.inputFD is None:
+            return None
+        try:
+            data = os.read(self.inputFD, PipeChunk)
+        except BlockingIOError:
+            return b''
+        except:
+            return None
+        if len(data) == 0:
+            # No writer.  A hangup means the other side has gone, otherwise it has not
+            # opened its end yet.
+            for fd, event in self.inpoll.poll(0):
+                if event & select.POLLHUP: return None
+        return data
+
+    def writeBytes(self, data):
+        try:
+            return os.write(self.outputFD, data)
+        except BlockingIOError:
+            return 0
+        except:
+            return None
 
-    def writeline(self, inString):
-        if len(inString) == 0 or inString[-1] != '\n':
-            inString += '\n'
-        status = self.outputFIFO.write(inString)
-        self.outputFIFO.flush()
-        return status
+    def fileno(self):
+        # Input descriptor to wait on with select or None if not connected
+        return self.inputFD
 
-    def write(self, outBytes=None, outLen = 0):
-        if outBytes == None:
-            return 0
-        status = self.outputFIFO.write(outBytes)
-        self.outputFIFO.flush()
-        return status
+    def disconnect(self):
+        self.closeFIFOs()
 
     def closeFIFOs(self):
-        if True:  #try:
-            if self.outputFIFO is not None:
-                self.outputFIFO.close()
-            self.outputFIFO = None
-        else:  #except:
+        try:
+            if self.outputFD is not None:
+                os.close(self.outputFD)
+        except:
             pass
-        if True: #try:
-            if self.inputFIFO is not None:
-                self.inputFIFO.close()
-            self.inpoll = None
-            self.inputFIFO = None
-        else:  #except:
+        self.outputFD = None
+        try:
+            if self.inputFD is not None:
+                os.close(self.inputFD)
+        except:
             pass
+        self.inpoll = None
+        self.inputFD = None
+        self.resetBuffers()
 
     def cleanup(self):
         self.closeFIFOs()
-        os.remove(self.outputFIFOName)
+        try:
+            os.remove(self.outputFIFOName)
+        except:
+            pass
+
+class SocketComm(FramedComm):
+    '''
+    SocketComm talks the framed protocol over a Unix domain socket.  Given a socketName, it
+    is a client that connects to the SocketServerComm listening there and reconnects if
+    dropped.  SocketServerComm also wraps each client it accepts in one, given the socket.
+    '''
+    def __init__(self, socketName=SocketName, sock=None):
+        super().__init__()
+        self.socketName = socketName
+        self.sock = sock
+        self.nextConnect = 0.0
+        if sock is not None:
+            sock.setblocking(False)
+
+    def isReady(self):
+        if self.sock is None:
+            now = time.monotonic()
+            if now >= self.nextConnect:
+                self.nextConnect = now + ConnectRetryTime
+                self.connect()
+        elif self.hasOutput():
+            self.flush()
+        return self.sock is not None
+
+    def connect(self):
+        if self.socketName is None:
+            return False
+        sock = None
+        try:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.socketName)
+            sock.setblocking(False)
+        except:
+            if sock is not None: sock.close()
+            return False
+        self.sock = sock
+        return True
+
+    def isOpen(self):
+        return self.sock is not None
+
+    def readBytes(self):
+        try:
+            data = self.sock.recv(PipeChunk)
+        except BlockingIOError:
+            return b''
+        except:
+            return None
+        if len(data) == 0:
+            return None     # Peer closed the connection
+        return data
+
+    def writeBytes(self, data):
+        try:
+            return self.sock.send(data)
+        except BlockingIOError:
+            return 0
+        except:
+            return None
+
+    def fileno(self):
+        if self.sock is None:
+            return None
+        return self.sock.fileno()
+
+    def disconnect(self):
+        try:
+            if self.sock is not None:
+                self.sock.close()
+        except:
+            pass
+        self.sock = None
+        self.resetBuffers()
+
+    def cleanup(self):
+        self.disconnect()
+
+class SocketServerComm(Communications):
+    '''
+    SocketServerComm listens on a Unix domain socket and serves any number of SocketComm
+    clients at once.  Messages from all the clients are returned together by readMessages
+    and requests are answered to the client that made them.
+    '''
+    def __init__(self, socketName=SocketName):
+        super().__init__()
+        self.socketName = socketName
+        self.listener = None
+        self.clients = []
+        try:
+            # Clear out any socket left behind by an earlier run
+            if os.path.exists(self.socketName):
+                os.remove(self.socketName)
+            self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.listener.bind(self.socketName)
+            self.listener.listen(8)
+            self.listener.setblocking(False)
+        except:
+            sys.stderr.write('\nWHOOPS - Unable to listen on socket %s\n' % self.socketName)
+            self.listener = None
+
+    def isReady(self):
+        # Accept any new clients, drop departed ones, and push out queued output
+        if self.listener is not None:
+            while True:
+                try:
+                    sock, address = self.listener.accept()
+                except:
+                    break
+                self.clients.append(SocketComm(socketName=None, sock=sock))
+                if verbosity: print('Client connected, now', len(self.clients))
+        for client in self.clients:
+            if client.hasOutput(): client.flush()
+        self.clients = [client for client in self.clients if client.isOpen()]
+        return len(self.clients) > 0
+
+    def isThereInput(self):
+        for client in self.clients:
+            if client.isThereInput(): return True
+        return False
+
+    def readMessages(self):
+        messages = []
+        for client in self.clients:
+            for msgtype, payload in client.readMessages():
+                if msgtype == MsgRequest:
+                    # Remember who asked so the response goes back to them
+                    payload = ((client, payload[0]), payload[1])
+                messages.append((msgtype, payload))
+        return messages
+
+    def respond(self, replyto, inString):
+        client, requestid = replyto
+        return client.respond(requestid, inString)
+
+    def filenos(self):
+        fds = []
+        if self.listener is not None:
+            fds.append(self.listener.fileno())
+        for client in self.clients:
+            if client.isOpen(): fds.append(client.fileno())
+        return fds
+
+    def cleanup(self):
+        for client in self.clients:
+            client.cleanup()
+        self.clients = []
+        try:
+            if self.listener is not None:
+                self.listener.close()
+            self.listener = None
+            os.remove(self.socketName)
+        except:
+            pass
 
 
 def mainEventLoop(comm):
@@ -171,36 +589,36 @@ def mainEventLoop(comm):
     print('Comm is open')
 
     if tserver:
-        while(not comm.isThereInput()):
+        # Take a text line, a batch of ports, and a request and answer the request
+        messages = []
+        while len(messages) < 3:
             time.sleep(0.1)
+            comm.isReady()
+            messages += comm.readMessages()
 
-        print('Data is available')
+        print('Messages Received:', messages)
 
-        line = comm.readline()
-        print('Line Received:', line)
+        for msgtype, payload in messages:
+            if msgtype == MsgRequest:
+                comm.respond(payload[0], 'ok ' + payload[1])
 
-        bytes = comm.read(16)
-        print('Bytes Received:', bytes)
-
-        comm.writeline('Hello')
-
-        comm.write('ABCDEFGHIJKLMNOP')
+        # Give the response time to get out before hanging up
+        time.sleep(0.5)
+        comm.isReady()
 
     elif tclient:
         comm.writeline('Hello')
 
-        comm.write('ABCDEFGHIJKLMNOP')
+        comm.writePorts([(PortServo, 1, 1500), (PortDigital, 2, 1)])
 
-        while(not comm.isThereInput()):
-            time.sleep(0.1)
+        requestid = comm.request('a')
 
-        print('Data is available')
-
-        line = comm.readline()
-        print('Line Received:', line)
+        response = None
+        while response is None:
+            time.sleep(0.1)
+            response = comm.getResponse(requestid)
 
-        bytes = comm.read(16)
-        print('Bytes Received:', bytes)
+        print('Response to request', requestid, 'Received:', response)
 
     comm.cleanup()
 
@@ -216,6 +634,7 @@ def print_usage(name):
     sys.stderr.write("-v/-verbose       :run more verbosely\n");
     sys.stderr.write("-c/-client        :run client side\n");
     sys.stderr.write("-s/-server        :run server side\n");
+    sys.stderr.write("-u/-unix          :use a Unix domain socket rather than FIFOs\n");
     sys.stderr.write("\n\n");
 
 #/* Main */
@@ -234,6 +653,8 @@ if __name__ == "__main__":
         elif sys.argv[i] == '-s' or sys.argv[i] == '-server':
             tclient = False
             tserver = True
+        elif sys.argv[i] == '-u' or sys.argv[i] == '-unix':
+            tunix = True
         else:
             sys.stderr.write("\nWhoops - Unrecognized argument: %s\n" % sys.argv[i]);
             print_usage(sys.argv[0]);
@@ -242,8 +663,15 @@ if __name__ == "__main__":
         i += 1
 
     # Initialize stuff
+    comm = None
+    if tunix:
+        # Unix domain socket with the server listening for any number of clients
+        if tclient:
+            comm = SocketComm(socketName='sock.transcommtest')
+        elif tserver:
+            comm = SocketServerComm(socketName='sock.transcommtest')
     # FIFOs
-    if tclient:
+    elif tclient:
         comm = FIFOComm(inputFIFOName = 'fifo.commtocontrol', outputFIFOName = 'fifo.controltocomm')
     elif tserver:
         comm = FIFOComm(inputFIFOName = 'fifo.controltocomm', outputFIFOName = 'fifo.commtocontrol')